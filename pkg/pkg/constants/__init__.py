@@ -1,8 +1,6 @@
+from functools import cache
 from pathlib import Path
 
-import seaborn as sns
-from caveclient import CAVEclient
-
 RESULTS_PATH = Path(__file__).parent.parent.parent.parent
 RESULTS_PATH = RESULTS_PATH / "results"
 
@@ -27,9 +25,29 @@ MATERIALIZATION_VERSION = 1078
 
 DATASTACK_NAME = "minnie65_phase3_v1"
 
-client = CAVEclient(DATASTACK_NAME)
-TIMESTAMP = client.materialize.get_timestamp(MATERIALIZATION_VERSION)
+# the first two colors of seaborn's "Dark2" palette
+MERGE_COLOR = "#1b9e77"
+SPLIT_COLOR = "#d95f02"
+
+
+@cache
+def get_client():
+    """Get the CAVEclient for `DATASTACK_NAME`, created on first use."""
+    from caveclient import CAVEclient
+
+    return CAVEclient(DATASTACK_NAME)
+
+
+@cache
+def get_timestamp():
+    """Get the timestamp of `MATERIALIZATION_VERSION`, fetched on first use."""
+    return get_client().materialize.get_timestamp(MATERIALIZATION_VERSION)
+
 
-colors = sns.color_palette("Dark2").as_hex()
-MERGE_COLOR = colors[0]
-SPLIT_COLOR = colors[1]
+def __getattr__(name):
+    # `client` and `TIMESTAMP` need the network, so are only made when first asked for
+    if name == "client":
+        return get_client()
+    elif name == "TIMESTAMP":
+        return get_timestamp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
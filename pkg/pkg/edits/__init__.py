@@ -6,12 +6,17 @@ from .changes import (
     collate_edit_info,
     find_soma_nuc_merge_metaoperation,
     find_supervoxel_component,
+    get_cached_predecessor_edits,
     get_changed_edges,
     get_detailed_change_log,
+    get_ever_referenced_level2_ids,
     get_initial_network,
+    get_pruned_initial_network,
     get_initial_node_ids,
+    NetworkDeltaStore,
     get_level2_lineage_components,
     get_network_edits,
+    get_network_edits_bulk,
     get_network_metaedits,
     get_operation_metaoperation_map,
     get_supervoxel_level2_map,
@@ -21,6 +26,9 @@ from .changes import (
     resolve_synapses_from_edit_selections,
     count_synapses_by_sample, 
     apply_synapses,
+    extend_edit_history,
+    extend_synapses,
+    group_synapses_by_level2,
     map_synapses_to_spatial_graph
 )
 from .io import (
@@ -1,5 +1,5 @@
 import json
-from typing import Union
+from typing import Optional, Union
 
 import caveclient as cc
 import networkx as nx
@@ -8,10 +8,12 @@ import pandas as pd
 from joblib import Parallel, delayed
 from networkframe import NetworkFrame
 from requests import HTTPError
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
 from tqdm.auto import tqdm
 from tqdm_joblib import tqdm_joblib
 
-from ..io import lazycloud
+from ..io import SupervoxelLevel2Store, lazycloud
 from ..morphology import (
     find_component_by_l2_id,
     get_alltime_synapses,
@@ -19,8 +21,11 @@ from ..morphology import (
 )
 from ..utils import (
     get_all_nodes_edges,
+    get_l2data,
+    get_level2_chunk_bounds,
     get_level2_nodes_edges,
     get_nucleus_point_nm,
+    get_positions,
     pt_to_xyz,
 )
 
@@ -72,23 +77,89 @@ def get_detailed_change_log(root_id, client, filtered=True):
 class NetworkDelta:
     def __init__(
         self,
-        removed_nodes: pd.DataFrame,
-        added_nodes: pd.DataFrame,
-        removed_edges: pd.DataFrame,
-        added_edges: pd.DataFrame,
+        removed_nodes: Union[pd.DataFrame, np.ndarray],
+        added_nodes: Union[pd.DataFrame, np.ndarray],
+        removed_edges: Union[pd.DataFrame, np.ndarray],
+        added_edges: Union[pd.DataFrame, np.ndarray],
         metadata: dict = {},
     ):
+        # nodes/edges may be given as arrays (node IDs, or source/target pairs), in
+        # which case the DataFrames are only created when first accessed
+        if isinstance(removed_edges, pd.DataFrame):
+            removed_edges = removed_edges.reset_index(drop=True)
+        if isinstance(added_edges, pd.DataFrame):
+            added_edges = added_edges.reset_index(drop=True)
         self.removed_nodes = removed_nodes
         self.added_nodes = added_nodes
-        self.removed_edges = removed_edges.reset_index(drop=True)
-        self.added_edges = added_edges.reset_index(drop=True)
+        self.removed_edges = removed_edges
+        self.added_edges = added_edges
         self.metadata = metadata
 
+    @staticmethod
+    def _nodes_frame(nodes):
+        if isinstance(nodes, np.ndarray):
+            return pd.DataFrame(index=nodes)
+        return nodes
+
+    @staticmethod
+    def _edges_frame(edges):
+        if isinstance(edges, np.ndarray):
+            return pd.DataFrame(edges, columns=["source", "target"])
+        return edges
+
+    @property
+    def removed_nodes(self) -> pd.DataFrame:
+        self._removed_nodes = self._nodes_frame(self._removed_nodes)
+        return self._removed_nodes
+
+    @removed_nodes.setter
+    def removed_nodes(self, removed_nodes):
+        self._removed_nodes = removed_nodes
+
+    @property
+    def added_nodes(self) -> pd.DataFrame:
+        self._added_nodes = self._nodes_frame(self._added_nodes)
+        return self._added_nodes
+
+    @added_nodes.setter
+    def added_nodes(self, added_nodes):
+        self._added_nodes = added_nodes
+
+    @property
+    def removed_edges(self) -> pd.DataFrame:
+        self._removed_edges = self._edges_frame(self._removed_edges)
+        return self._removed_edges
+
+    @removed_edges.setter
+    def removed_edges(self, removed_edges):
+        self._removed_edges = removed_edges
+
+    @property
+    def added_edges(self) -> pd.DataFrame:
+        self._added_edges = self._edges_frame(self._added_edges)
+        return self._added_edges
+
+    @added_edges.setter
+    def added_edges(self, added_edges):
+        self._added_edges = added_edges
+
+    def _node_ids(self, which: str) -> np.ndarray:
+        nodes = getattr(self, f"_{which}_nodes")
+        if isinstance(nodes, np.ndarray):
+            return nodes
+        return nodes.index.values
+
+    def _edge_pairs(self, which: str) -> np.ndarray:
+        edges = getattr(self, f"_{which}_edges")
+        if isinstance(edges, np.ndarray):
+            return edges
+        return edges[["source", "target"]].values
+
     def __repr__(self):
-        rep = f"NetworkDelta(removed_nodes={self.removed_nodes.shape[0]}, "
-        rep += f"added_nodes={self.added_nodes.shape[0]}, "
-        rep += f"removed_edges={self.removed_edges.shape[0]}, "
-        rep += f"added_edges={self.added_edges.shape[0]}, "
+        rep = f"NetworkDelta(removed_nodes={len(self._node_ids('removed'))}, "
+        rep += f"added_nodes={len(self._node_ids('added'))}, "
+        rep += f"removed_edges={len(self._edge_pairs('removed'))}, "
+        rep += f"added_edges={len(self._edge_pairs('added'))}, "
         rep += f"metadata={self.metadata}"
         rep += ")"
         return rep
@@ -137,6 +208,86 @@ class NetworkDelta:
         return True
 
 
+def _to_builtin(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+class NetworkDeltaStore:
+    """
+    Columnar storage for all of the `NetworkDelta`s of a neuron.
+
+    Node IDs and edges for every delta are concatenated into flat integer arrays, with
+    per-delta offsets into them (CSR style), and the metadata is kept as a JSON table.
+    `to_dict` turns the store back into `NetworkDelta`s which hold views into these
+    arrays, only building DataFrames when they are accessed.
+    """
+
+    NODE_KEYS = ("removed_nodes", "added_nodes")
+    EDGE_KEYS = ("removed_edges", "added_edges")
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays["keys"])
+
+    def __repr__(self) -> str:
+        return f"NetworkDeltaStore(deltas={len(self)})"
+
+    @classmethod
+    def from_networkdeltas(cls, networkdeltas: dict) -> "NetworkDeltaStore":
+        arrays = {"keys": np.array(list(networkdeltas.keys()), dtype=np.int64)}
+
+        for key in cls.NODE_KEYS:
+            which = key.split("_")[0]
+            chunks = [delta._node_ids(which) for delta in networkdeltas.values()]
+            arrays[key], arrays[f"{key}_offsets"] = _flatten_chunks(chunks)
+
+        for key in cls.EDGE_KEYS:
+            which = key.split("_")[0]
+            chunks = [delta._edge_pairs(which) for delta in networkdeltas.values()]
+            arrays[key], arrays[f"{key}_offsets"] = _flatten_chunks(chunks, width=2)
+
+        metadata = [delta.metadata for delta in networkdeltas.values()]
+        metadata = json.dumps(metadata, default=_to_builtin).encode()
+        arrays["metadata"] = np.frombuffer(metadata, dtype=np.uint8)
+
+        return cls(arrays)
+
+    def to_dict(self) -> dict[int, NetworkDelta]:
+        arrays = self.arrays
+        metadata = json.loads(bytes(arrays["metadata"]).decode())
+
+        networkdeltas = {}
+        for i, key in enumerate(arrays["keys"].tolist()):
+            views = {}
+            for name in self.NODE_KEYS + self.EDGE_KEYS:
+                offsets = arrays[f"{name}_offsets"]
+                views[name] = arrays[name][offsets[i] : offsets[i + 1]]
+            networkdeltas[key] = NetworkDelta(
+                views["removed_nodes"],
+                views["added_nodes"],
+                views["removed_edges"],
+                views["added_edges"],
+                metadata=metadata[i],
+            )
+        return networkdeltas
+
+
+def _flatten_chunks(chunks: list, width: Optional[int] = None):
+    shape = (-1,) if width is None else (-1, width)
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+    if len(chunks) == 0:
+        return np.empty((0,) + shape[1:], dtype=np.int64), offsets
+    chunks = [np.asarray(chunk, dtype=np.int64).reshape(shape) for chunk in chunks]
+    return np.concatenate(chunks), offsets
+
+
 def combine_deltas(deltas):
     total_added_nodes = pd.concat(
         [delta.added_nodes for delta in deltas], verify_integrity=True
@@ -186,115 +337,505 @@ def make_bbox(bbox_halfwidth, point_in_nm, seg_resolution):
 
 
 def _network_edits_saver(networkdeltas_by_operation: dict) -> dict:
-    networkdelta_dicts = {}
-    for operation_id, delta in networkdeltas_by_operation.items():
-        networkdelta_dicts[operation_id] = delta.to_dict()
-    return networkdelta_dicts
+    return NetworkDeltaStore.from_networkdeltas(networkdeltas_by_operation).arrays
+
 
+def _network_edits_loader(arrays: dict) -> dict:
+    return NetworkDeltaStore(arrays).to_dict()
 
-def _network_edits_loader(networkdelta_dicts: dict) -> dict:
+
+def _legacy_network_edits_loader(networkdelta_dicts: dict) -> dict:
+    # network edits were cached as JSON dictionaries before `NetworkDeltaStore`
     networkdeltas_by_operation = {}
     for operation_id, delta in networkdelta_dicts.items():
         networkdeltas_by_operation[int(operation_id)] = NetworkDelta.from_dict(delta)
     return networkdeltas_by_operation
 
 
+def _get_bounds_settings(bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth):
+    return {
+        "bounds_halfwidth": bounds_halfwidth,
+        "adaptive_bounds": adaptive_bounds,
+        "max_bounds_halfwidth": max_bounds_halfwidth,
+    }
+
+
+def _has_bounds_settings(delta, bounds_settings) -> bool:
+    # deltas cached before the settings were recorded can't be checked, so don't match
+    return all(
+        name in delta.metadata and delta.metadata[name] == value
+        for name, value in bounds_settings.items()
+    )
+
+
+def _get_operation_metadata(row, operation_id, root_id, delta, bounds_settings):
+    n_added_nodes = len(delta._node_ids("added"))
+    n_removed_nodes = len(delta._node_ids("removed"))
+    n_added_edges = len(delta._edge_pairs("added"))
+    n_removed_edges = len(delta._edge_pairs("removed"))
+    metadata = {
+        **row.to_dict(),
+        "operation_id": operation_id,
+        "root_id": root_id,
+        "n_added_nodes": n_added_nodes,
+        "n_removed_nodes": n_removed_nodes,
+        "n_modified_nodes": n_added_nodes + n_removed_nodes,
+        "n_added_edges": n_added_edges,
+        "n_removed_edges": n_removed_edges,
+        "n_modified_edges": n_added_edges + n_removed_edges,
+        **bounds_settings,
+    }
+    return metadata
+
+
+def _get_info_for_operation(
+    operation_id,
+    row,
+    root_id,
+    client,
+    bounds_halfwidth,
+    adaptive_bounds=False,
+    max_bounds_halfwidth=None,
+):
+    bounds_settings = _get_bounds_settings(
+        bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth
+    )
+    point_in_cg = np.array(row["sink_coords"][0])
+    seg_resolution = client.chunkedgraph.base_resolution
+    point_in_nm = point_in_cg * seg_resolution
+
+    while True:
+        if bounds_halfwidth is None:
+            bbox_cg = None
+        else:
+            bbox_cg = make_bbox(bounds_halfwidth, point_in_nm, seg_resolution).T
+
+        delta, edges = _get_delta_in_bounds(row, client, bbox_cg)
+
+        if not adaptive_bounds or bbox_cg is None:
+            break
+        if not _delta_leaves_bounds(delta, edges, bbox_cg, client):
+            break
+
+        # some changes may have been cut off by the box, so look again in a bigger one
+        bounds_halfwidth = 2 * bounds_halfwidth
+        if max_bounds_halfwidth is not None and bounds_halfwidth > max_bounds_halfwidth:
+            bounds_halfwidth = None
+
+    # keep track of what changed
+    delta.metadata = _get_operation_metadata(
+        row, operation_id, root_id, delta, bounds_settings
+    )
+
+    return delta
+
+
+def _get_delta_in_bounds(row, client, bbox_cg):
+    before_root_ids = row["before_root_ids"]
+    after_root_ids = row["roots"]
+
+    # grabbing the union of before/after nodes/edges
+    # NOTE: this is where all the compute time comes from
+    all_before_nodes, all_before_edges = get_all_nodes_edges(
+        before_root_ids, client, positions=False, bounds=bbox_cg
+    )
+    all_after_nodes, all_after_edges = get_all_nodes_edges(
+        after_root_ids, client, positions=False, bounds=bbox_cg
+    )
+
+    # finding the nodes that were added or removed, simple set logic
+    added_nodes_index = all_after_nodes.index.difference(all_before_nodes.index)
+    added_nodes = all_after_nodes.loc[added_nodes_index]
+    removed_nodes_index = all_before_nodes.index.difference(all_after_nodes.index)
+    removed_nodes = all_before_nodes.loc[removed_nodes_index]
+
+    # finding the edges that were added or removed, simple set logic again
+    removed_edges, added_edges = get_changed_edges(all_before_edges, all_after_edges)
+
+    delta = NetworkDelta(removed_nodes, added_nodes, removed_edges, added_edges)
+    edges = pd.concat([all_before_edges, all_after_edges])[["source", "target"]]
+    return delta, edges
+
+
+def _delta_leaves_bounds(delta, edges, bbox_cg, client):
+    """
+    Whether the changes in `delta` may continue past the box `bbox_cg`.
+
+    The level 2 graph in the box holds every chunk overlapping it, and edges from
+    those chunks to their neighbors. So the changes may have been cut off only if a
+    changed node, or a neighbor of one in `edges` (before or after the operation), is
+    in a chunk which does not overlap the box.
+    """
+    changed_node_ids = np.concatenate(
+        [delta._node_ids("added"), delta._node_ids("removed")]
+    )
+    if len(changed_node_ids) == 0:
+        return False
+    is_incident = edges["source"].isin(changed_node_ids) | edges["target"].isin(
+        changed_node_ids
+    )
+    node_ids = np.unique(
+        np.concatenate(
+            [
+                changed_node_ids,
+                edges.loc[is_incident, ["source", "target"]].values.ravel(),
+            ]
+        ).astype(np.int64)
+    )
+    chunk_bounds = get_level2_chunk_bounds(node_ids, client)
+    before_start = chunk_bounds[:, :, 1] <= bbox_cg[:, 0]
+    after_stop = chunk_bounds[:, :, 0] >= bbox_cg[:, 1]
+    return bool((before_start | after_stop).any())
+
+
+def get_cached_predecessor_edits(
+    root_id,
+    client,
+    max_lookback=5,
+    cache_verbose=False,
+    adaptive_bounds: bool = False,
+    max_bounds_halfwidth=None,
+):
+    """
+    Find the cached `NetworkDelta`s of the closest ancestors of `root_id`.
+
+    Walks back through the lineage graph from `root_id`, one generation at a time, and
+    stops going further back along any path once an ancestor with cached network edits
+    is found.
+
+    Parameters
+    ----------
+    root_id :
+        Root ID to find the ancestors of.
+    client :
+        CAVEclient instance.
+    max_lookback :
+        Maximum number of generations to walk back through.
+    cache_verbose :
+        Whether to print information about cache loading.
+    adaptive_bounds, max_bounds_halfwidth :
+        Settings of the cached network edits to look for (see `get_network_edits`).
+
+    Returns
+    -------
+    :
+        Dictionary mapping operation IDs to the cached `NetworkDelta`s from ancestors.
+    """
+    lineage_graph = client.chunkedgraph.get_lineage_graph(root_id, as_nx_graph=True)
+
+    networkdeltas_by_operation = {}
+    frontier = list(lineage_graph.predecessors(root_id))
+    seen = set(frontier)
+    for _ in range(max_lookback):
+        next_frontier = []
+        for ancestor_id in frontier:
+            ancestor_deltas = get_network_edits(
+                ancestor_id,
+                client,
+                adaptive_bounds=adaptive_bounds,
+                max_bounds_halfwidth=max_bounds_halfwidth,
+                only_load=True,
+                cache_verbose=cache_verbose,
+            )
+            if ancestor_deltas is not None:
+                for operation_id, delta in ancestor_deltas.items():
+                    networkdeltas_by_operation.setdefault(operation_id, delta)
+                continue
+            for predecessor_id in lineage_graph.predecessors(ancestor_id):
+                if predecessor_id not in seen:
+                    seen.add(predecessor_id)
+                    next_frontier.append(predecessor_id)
+        frontier = next_frontier
+        if len(frontier) == 0:
+            break
+
+    return networkdeltas_by_operation
+
+
 @lazycloud(
     cloud_bucket="allen-minnie-phase3",
     folder="edit_info",
-    file_suffix="operations.json",
+    file_suffix="operations.npz",
     arg_keys=[0],
     kwarg_keys=[],
-    save_format="json",
+    save_format="npz",
     load_func=_network_edits_loader,
     save_func=_network_edits_saver,
+    optional_kwarg_keys=["adaptive_bounds", "max_bounds_halfwidth"],
+    legacy_formats=[("operations.json", "json", _legacy_network_edits_loader)],
 )
 def get_network_edits(
     root_id,
     client,
     verbose=True,
     bounds_halfwidth=10_000,
+    adaptive_bounds: bool = False,
+    max_bounds_halfwidth=None,
+    incremental: bool = False,
+    max_lookback: int = 5,
+    precomputed_networkdeltas: Optional[dict] = None,
+    change_log: Optional[pd.DataFrame] = None,
     use_cache: bool = True,
     cache_verbose: bool = False,
     only_load: bool = False,
 ):
-    change_log = get_detailed_change_log(root_id, client, filtered=False)
-    filtered_change_log = get_detailed_change_log(root_id, client, filtered=True)
-    change_log["is_filtered"] = False
-    change_log.loc[filtered_change_log.index, "is_filtered"] = True
+    """
+    Get the changes to the level 2 graph made by each operation in a neuron's history.
 
-    def _get_info_for_operation(operation_id):
-        row = change_log.loc[operation_id]
+    Parameters
+    ----------
+    root_id :
+        Root ID of the neuron.
+    client :
+        CAVEclient instance.
+    verbose :
+        Whether to print progress information.
+    bounds_halfwidth :
+        Halfwidth (in nm) of the box around each operation's sink point within which
+        changes to the level 2 graph are looked for. If None, uses the whole objects.
+    adaptive_bounds :
+        If True, `bounds_halfwidth` is only the starting size of each operation's box.
+        Whenever a changed node, or a node connected to one, lies in a level 2 chunk
+        outside of the box, the changes may extend past it, so that operation alone
+        is looked at again with a box of twice the halfwidth, until they do not.
+        This lets a small starting box be used without missing changes. Part of the
+        cache key when not at its default.
+    max_bounds_halfwidth :
+        Largest halfwidth (in nm) to expand to when `adaptive_bounds`; past it, the
+        whole objects are used. If None, keeps expanding. Part of the cache key when
+        not at its default.
+    incremental :
+        If True, reuse the cached `NetworkDelta`s of this neuron's closest ancestors
+        (see `get_cached_predecessor_edits`) and only compute those of operations
+        which are new since then. Cached `NetworkDelta`s whose metadata does not
+        record the same `bounds_halfwidth`, `adaptive_bounds` and
+        `max_bounds_halfwidth` are computed again. Metadata is always rebuilt from
+        the current change log, since e.g. which operations are filtered can change
+        with new edits.
+    max_lookback :
+        Maximum number of lineage generations to look back through for cached
+        ancestors, if `incremental`.
+    precomputed_networkdeltas :
+        Dictionary mapping operation IDs to already computed `NetworkDelta`s to reuse,
+        as for `incremental`. Used by `get_network_edits_bulk`.
+    change_log :
+        Change log of the neuron, with an "is_filtered" column, if already fetched.
+        Used by `get_network_edits_bulk`.
+
+    Returns
+    -------
+    :
+        Dictionary mapping operation IDs to `NetworkDelta`s, in time order.
+    """
+    if change_log is None:
+        change_log = _get_annotated_change_log(root_id, client)
 
-        before_root_ids = row["before_root_ids"]
-        after_root_ids = row["roots"]
+    bounds_settings = _get_bounds_settings(
+        bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth
+    )
+    cached_deltas = {}
+    if precomputed_networkdeltas is not None:
+        cached_deltas.update(precomputed_networkdeltas)
+    if incremental:
+        predecessor_deltas = get_cached_predecessor_edits(
+            root_id,
+            client,
+            max_lookback=max_lookback,
+            cache_verbose=cache_verbose,
+            adaptive_bounds=adaptive_bounds,
+            max_bounds_halfwidth=max_bounds_halfwidth,
+        )
+        for operation_id, delta in predecessor_deltas.items():
+            cached_deltas.setdefault(operation_id, delta)
+    cached_deltas = {
+        operation_id: delta
+        for operation_id, delta in cached_deltas.items()
+        if _has_bounds_settings(delta, bounds_settings)
+    }
+
+    new_operation_ids = change_log.index[~change_log.index.isin(cached_deltas.keys())]
+    if verbose and len(cached_deltas) > 0:
+        print(
+            f"Reusing {len(change_log) - len(new_operation_ids)} cached operations, "
+            f"computing {len(new_operation_ids)} new operations"
+        )
 
-        point_in_cg = np.array(row["sink_coords"][0])
-        seg_resolution = client.chunkedgraph.base_resolution
-        point_in_nm = point_in_cg * seg_resolution
+    with tqdm_joblib(total=len(new_operation_ids)) as progress_bar:
+        new_networkdeltas = Parallel(n_jobs=-1)(
+            delayed(_get_info_for_operation)(
+                operation_id,
+                change_log.loc[operation_id],
+                root_id,
+                client,
+                bounds_halfwidth,
+                adaptive_bounds=adaptive_bounds,
+                max_bounds_halfwidth=max_bounds_halfwidth,
+            )
+            for operation_id in new_operation_ids
+        )
+    new_networkdeltas = dict(zip(new_operation_ids, new_networkdeltas))
 
-        if bounds_halfwidth is None:
-            bbox_cg = None
+    networkdeltas_by_operation = {}
+    for operation_id in change_log.index:
+        if operation_id in new_networkdeltas:
+            delta = new_networkdeltas[operation_id]
         else:
-            bbox_cg = make_bbox(bounds_halfwidth, point_in_nm, seg_resolution).T
+            delta = cached_deltas[operation_id]
+            # copy so that deltas shared with other neurons keep their own metadata
+            delta = NetworkDelta(
+                delta._removed_nodes,
+                delta._added_nodes,
+                delta._removed_edges,
+                delta._added_edges,
+                metadata=_get_operation_metadata(
+                    change_log.loc[operation_id],
+                    operation_id,
+                    root_id,
+                    delta,
+                    bounds_settings,
+                ),
+            )
+        networkdeltas_by_operation[operation_id] = delta
 
-        # grabbing the union of before/after nodes/edges
-        # NOTE: this is where all the compute time comes from
-        all_before_nodes, all_before_edges = get_all_nodes_edges(
-            before_root_ids, client, positions=False, bounds=bbox_cg
-        )
-        all_after_nodes, all_after_edges = get_all_nodes_edges(
-            after_root_ids, client, positions=False, bounds=bbox_cg
-        )
+    return networkdeltas_by_operation
 
-        # finding the nodes that were added or removed, simple set logic
-        added_nodes_index = all_after_nodes.index.difference(all_before_nodes.index)
-        added_nodes = all_after_nodes.loc[added_nodes_index]
-        removed_nodes_index = all_before_nodes.index.difference(all_after_nodes.index)
-        removed_nodes = all_before_nodes.loc[removed_nodes_index]
 
-        # finding the edges that were added or removed, simple set logic again
-        removed_edges, added_edges = get_changed_edges(
-            all_before_edges, all_after_edges
-        )
+def _get_annotated_change_log(root_id, client):
+    change_log = get_detailed_change_log(root_id, client, filtered=False)
+    filtered_change_log = get_detailed_change_log(root_id, client, filtered=True)
+    change_log["is_filtered"] = False
+    change_log.loc[filtered_change_log.index, "is_filtered"] = True
+    return change_log
 
-        # keep track of what changed
-        metadata = {
-            **row.to_dict(),
-            "operation_id": operation_id,
-            "root_id": root_id,
-            "n_added_nodes": len(added_nodes),
-            "n_removed_nodes": len(removed_nodes),
-            "n_modified_nodes": len(added_nodes) + len(removed_nodes),
-            "n_added_edges": len(added_edges),
-            "n_removed_edges": len(removed_edges),
-            "n_modified_edges": len(added_edges) + len(removed_edges),
-        }
 
-        return NetworkDelta(
-            removed_nodes, added_nodes, removed_edges, added_edges, metadata=metadata
-        )
+def get_network_edits_bulk(
+    root_ids,
+    client,
+    verbose=True,
+    bounds_halfwidth=10_000,
+    adaptive_bounds: bool = False,
+    max_bounds_halfwidth=None,
+    use_cache: bool = True,
+    cache_verbose: bool = False,
+) -> dict:
+    """
+    Get the network edits for many neurons, computing each operation only once.
 
-    with tqdm_joblib(total=len(change_log.index)) as progress_bar:
-        networkdeltas_by_operation = Parallel(n_jobs=-1)(
-            delayed(_get_info_for_operation)(operation_id)
-            for operation_id in change_log.index
+    Histories of different neurons often share operations, e.g. a merge between two
+    neurons or a shared orphan fragment. This unions the change logs of all `root_ids`,
+    computes the `NetworkDelta` of each distinct operation once (reusing those from
+    any neuron whose network edits are already cached), and then writes each neuron's
+    network edits to its cache as `get_network_edits` would.
+
+    Parameters
+    ----------
+    root_ids :
+        Root IDs of the neurons.
+    client :
+        CAVEclient instance.
+    verbose :
+        Whether to print progress information.
+    bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth :
+        See `get_network_edits`.
+    use_cache :
+        If False, recomputes every operation and overwrites each neuron's cache.
+    cache_verbose :
+        Whether to print information about cache loading.
+
+    Returns
+    -------
+    :
+        Dictionary mapping each root ID to its dictionary of `NetworkDelta`s by
+        operation ID, as returned by `get_network_edits`.
+    """
+    root_ids = list(pd.unique(np.asarray(root_ids)))
+    bounds_settings = _get_bounds_settings(
+        bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth
+    )
+
+    networkdeltas_by_root = {}
+    shared_networkdeltas = {}
+    if use_cache:
+        for root_id in root_ids:
+            networkdeltas = get_network_edits(
+                root_id,
+                client,
+                adaptive_bounds=adaptive_bounds,
+                max_bounds_halfwidth=max_bounds_halfwidth,
+                only_load=True,
+                cache_verbose=cache_verbose,
+            )
+            if networkdeltas is not None:
+                networkdeltas_by_root[root_id] = networkdeltas
+                for operation_id, delta in networkdeltas.items():
+                    if _has_bounds_settings(delta, bounds_settings):
+                        shared_networkdeltas.setdefault(operation_id, delta)
+
+    # union the change logs of the neurons which still need computing
+    change_logs_by_root = {}
+    rows_by_operation = {}
+    root_id_by_operation = {}
+    for root_id in root_ids:
+        if root_id in networkdeltas_by_root:
+            continue
+        change_log = _get_annotated_change_log(root_id, client)
+        change_logs_by_root[root_id] = change_log
+        for operation_id, row in change_log.iterrows():
+            if operation_id not in shared_networkdeltas:
+                rows_by_operation.setdefault(operation_id, row)
+                root_id_by_operation.setdefault(operation_id, root_id)
+
+    if verbose:
+        print(
+            f"Computing {len(rows_by_operation)} distinct operations for "
+            f"{len(root_ids) - len(networkdeltas_by_root)} neurons..."
         )
 
-    networkdeltas_by_operation = dict(zip(change_log.index, networkdeltas_by_operation))
+    with tqdm_joblib(total=len(rows_by_operation)) as progress_bar:
+        new_networkdeltas = Parallel(n_jobs=-1)(
+            delayed(_get_info_for_operation)(
+                operation_id,
+                row,
+                root_id_by_operation[operation_id],
+                client,
+                bounds_halfwidth,
+                adaptive_bounds=adaptive_bounds,
+                max_bounds_halfwidth=max_bounds_halfwidth,
+            )
+            for operation_id, row in rows_by_operation.items()
+        )
+    shared_networkdeltas.update(dict(zip(rows_by_operation.keys(), new_networkdeltas)))
+
+    # fan the deltas back out to each neuron's cache
+    for root_id in root_ids:
+        if root_id in networkdeltas_by_root:
+            continue
+        networkdeltas_by_root[root_id] = get_network_edits(
+            root_id,
+            client,
+            verbose=verbose,
+            bounds_halfwidth=bounds_halfwidth,
+            adaptive_bounds=adaptive_bounds,
+            max_bounds_halfwidth=max_bounds_halfwidth,
+            precomputed_networkdeltas=shared_networkdeltas,
+            change_log=change_logs_by_root[root_id],
+            use_cache=use_cache,
+            cache_verbose=cache_verbose,
+        )
 
-    return networkdeltas_by_operation
+    return networkdeltas_by_root
 
 
 @lazycloud(
     cloud_bucket="allen-minnie-phase3",
     folder="edit_info",
-    file_suffix="meta_operations.json",
+    file_suffix="meta_operations.npz",
     arg_keys=[1],
     kwarg_keys=[],
-    save_format="json",
+    save_format="npz",
     load_func=_network_edits_loader,
     save_func=_network_edits_saver,
+    legacy_formats=[("meta_operations.json", "json", _legacy_network_edits_loader)],
 )
 def get_network_metaedits(
     networkdeltas_by_operation,
@@ -305,46 +846,41 @@ def get_network_metaedits(
     only_load: bool = False,
 ):
     # find the nodes that are modified in any way by each operation
-    mod_sets = {}
-    for edit_id, delta in networkdeltas_by_operation.items():
-        mod_set = []
-        mod_set += delta.added_nodes.index.tolist()
-        mod_set += delta.removed_nodes.index.tolist()
-        mod_set += delta.added_edges["source"].tolist()
-        mod_set += delta.added_edges["target"].tolist()
-        mod_set += delta.removed_edges["source"].tolist()
-        mod_set += delta.removed_edges["target"].tolist()
-        mod_set = np.unique(mod_set)
-        mod_sets[edit_id] = mod_set
-
-    # make an incidence matrix of which nodes are modified by which operations
-    index = np.unique(np.concatenate(list(mod_sets.values())))
-    node_edit_indicators = pd.DataFrame(
-        index=index, columns=networkdeltas_by_operation.keys(), data=False
+    operation_ids = list(networkdeltas_by_operation.keys())
+    mod_sets = []
+    for delta in networkdeltas_by_operation.values():
+        mod_set = np.concatenate(
+            [
+                delta._node_ids("added"),
+                delta._node_ids("removed"),
+                delta._edge_pairs("added").ravel(),
+                delta._edge_pairs("removed").ravel(),
+            ]
+        )
+        mod_sets.append(np.unique(mod_set.astype(np.int64)))
+
+    # make a sparse incidence matrix of which nodes are modified by which operations
+    _, node_codes = np.unique(np.concatenate(mod_sets), return_inverse=True)
+    operation_codes = np.repeat(
+        np.arange(len(operation_ids)), [len(mod_set) for mod_set in mod_sets]
+    )
+    X = csr_array(
+        (np.ones(len(node_codes), dtype=int), (node_codes, operation_codes)),
+        shape=(node_codes.max() + 1 if len(node_codes) else 0, len(operation_ids)),
     )
-    for edit_id, mod_set in mod_sets.items():
-        node_edit_indicators.loc[mod_set, edit_id] = True
 
     # this inner product matrix tells us which operations are connected with at least
     # one overlapping node in common
-    X = node_edit_indicators.values.astype(int)
     product = X.T @ X
-    product = pd.DataFrame(
-        index=node_edit_indicators.columns,
-        columns=node_edit_indicators.columns,
-        data=product,
-    )
 
     # meta-operations are connected components according to the above graph
-    from scipy.sparse.csgraph import connected_components
-
-    _, labels = connected_components(product.values, directed=False)
+    _, labels = connected_components(product, directed=False)
 
     meta_operation_map = {}
     for label in np.unique(labels):
-        meta_operation_map[label] = node_edit_indicators.columns[
-            labels == label
-        ].tolist()
+        meta_operation_map[label] = [
+            operation_ids[i] for i in np.flatnonzero(labels == label)
+        ]
 
     # get the final network state for checking "relevance"
     nodes, edges = get_level2_nodes_edges(root_id, client, positions=False)
@@ -417,8 +953,24 @@ def get_initial_node_ids(root_id, client):
     return original_node_ids
 
 
-def get_initial_network(root_id, client, positions=False, verbose=True):
-    original_node_ids = get_initial_node_ids(root_id, client)
+def get_initial_network(
+    root_id,
+    client,
+    positions=False,
+    verbose=True,
+    prune=False,
+    networkdeltas_by_operation=None,
+    original_node_ids=None,
+):
+    if prune:
+        if networkdeltas_by_operation is None:
+            raise ValueError("`networkdeltas_by_operation` is required when pruning.")
+        return get_pruned_initial_network(
+            root_id, networkdeltas_by_operation, client, positions=positions
+        )
+
+    if original_node_ids is None:
+        original_node_ids = get_initial_node_ids(root_id, client)
 
     def _get_info_for_node(leaf_id):
         try:
@@ -455,7 +1007,65 @@ def get_initial_network(root_id, client, positions=False, verbose=True):
     return nf
 
 
-def get_supervoxel_level2_map(root_id, networkdeltas_by_operation, client):
+def get_pruned_initial_network(
+    root_id, networkdeltas_by_operation, client, positions=False
+):
+    """
+    Build the initial network from the final neuron and its edit history only.
+
+    Rather than fetching the level 2 graph of every original object in the lineage,
+    this keeps only the parts of the initial state which matter for replaying the
+    edits onto this neuron: nodes/edges in the final neuron which were not created by
+    an edit, and nodes/edges which some edit removed but no edit created. Only the
+    final neuron's level 2 graph is fetched.
+
+    Parts of merged-in objects which never became part of the final neuron are only
+    kept within the bounds used to extract each edit's `NetworkDelta`, so
+    intermediate states of the neuron may be missing those distant fragments.
+    """
+    final_nodes, final_edges = get_level2_nodes_edges(root_id, client, positions=False)
+
+    added_nodes = []
+    removed_nodes = []
+    added_edges = []
+    removed_edges = []
+    for delta in networkdeltas_by_operation.values():
+        added_nodes.append(delta.added_nodes.index.values)
+        removed_nodes.append(delta.removed_nodes.index.values)
+        added_edges.append(delta.added_edges[["source", "target"]])
+        removed_edges.append(delta.removed_edges[["source", "target"]])
+    added_nodes = np.concatenate([np.empty(0, dtype=int)] + added_nodes)
+    removed_nodes = np.concatenate([np.empty(0, dtype=int)] + removed_nodes)
+
+    node_ids = final_nodes.index.union(np.unique(removed_nodes))
+    node_ids = node_ids.difference(np.unique(added_nodes))
+
+    edges = pd.concat(
+        [final_edges[["source", "target"]]] + removed_edges, ignore_index=True
+    )
+    edges = edges.drop_duplicates(keep="first")
+    if len(added_edges) > 0:
+        added_edges = pd.MultiIndex.from_frame(
+            pd.concat(added_edges, ignore_index=True)
+        )
+        edges = edges[~pd.MultiIndex.from_frame(edges).isin(added_edges)]
+    edges = edges[edges["source"].isin(node_ids) & edges["target"].isin(node_ids)]
+    edges = edges.reset_index(drop=True).astype(int)
+
+    if positions:
+        if positions == "lazy":
+            nodes = get_positions(node_ids, client, n_retries=0)
+        else:
+            nodes = get_positions(node_ids, client)
+    else:
+        nodes = pd.DataFrame(index=node_ids.astype(int))
+
+    nf = NetworkFrame(nodes, edges, validate=False)
+
+    return nf
+
+
+def get_ever_referenced_level2_ids(root_id, networkdeltas_by_operation, client):
     ever_referenced_level2_ids = []
 
     nf = get_initial_network(root_id, client, positions=False)
@@ -464,14 +1074,27 @@ def get_supervoxel_level2_map(root_id, networkdeltas_by_operation, client):
     for edit in networkdeltas_by_operation.values():
         ever_referenced_level2_ids.extend(edit.added_nodes)
 
-    supervoxel_map = []
-    for l2_id in tqdm(
-        ever_referenced_level2_ids, desc="Getting supervoxel -> level 2 map"
-    ):
-        supervoxels = client.chunkedgraph.get_children(l2_id)
-        this_map = pd.Series(index=supervoxels, data=l2_id)
-        supervoxel_map.append(this_map)
-    supervoxel_map = pd.concat(supervoxel_map)
+    return ever_referenced_level2_ids
+
+
+def get_supervoxel_level2_map(
+    root_id,
+    networkdeltas_by_operation,
+    client,
+    store: Optional[SupervoxelLevel2Store] = None,
+    ever_referenced_level2_ids: Optional[list] = None,
+):
+    if store is None:
+        store = SupervoxelLevel2Store()
+
+    if ever_referenced_level2_ids is None:
+        ever_referenced_level2_ids = get_ever_referenced_level2_ids(
+            root_id, networkdeltas_by_operation, client
+        )
+
+    # only level2 IDs never seen before (by any neuron) are fetched
+    store.update(ever_referenced_level2_ids, client)
+    supervoxel_map = store.get_map(ever_referenced_level2_ids)
 
     if supervoxel_map.index.duplicated().any():
         raise UserWarning("WARNING: supervoxel -> level 2 map has duplicates")
@@ -537,12 +1160,12 @@ def pseudo_apply_edit(
     network_frame.add_nodes(network_delta.added_nodes, inplace=True)
     network_frame.add_edges(network_delta.added_edges, inplace=True)
 
-    network_frame.nodes.loc[
-        network_delta.removed_nodes.index, "operation_removed"
-    ] = operation_label
-    network_frame.edges.loc[
-        network_delta.removed_edges.index, "operation_removed"
-    ] = operation_label
+    network_frame.nodes.loc[network_delta.removed_nodes.index, "operation_removed"] = (
+        operation_label
+    )
+    network_frame.edges.loc[network_delta.removed_edges.index, "operation_removed"] = (
+        operation_label
+    )
     network_frame.nodes.loc[
         network_delta.removed_nodes.index, "metaoperation_removed"
     ] = metaoperation_label
@@ -649,8 +1272,10 @@ def collate_edit_info(
     edit_stats = pd.DataFrame(rows)
     modified_level2_nodes = pd.concat(raw_modified_nodes)
 
-    raw_node_coords = client.l2cache.get_l2data(
-        np.unique(modified_level2_nodes.index.to_list()), attributes=["rep_coord_nm"]
+    raw_node_coords = get_l2data(
+        np.unique(modified_level2_nodes.index.to_list()),
+        client,
+        attributes=["rep_coord_nm"],
     )
 
     node_coords = pd.DataFrame(raw_node_coords).T
@@ -746,6 +1371,35 @@ def apply_edit_history(nf, networkdeltas_by_operation, operation_to_metaoperatio
 
     nf.edges.set_index(["source", "target"], inplace=True, drop=False)
 
+    _pseudo_apply_edits(nf, networkdeltas_by_operation, operation_to_metaoperation)
+
+    _label_edit_history(nf)
+
+
+def extend_edit_history(nf, new_networkdeltas_by_operation, operation_to_metaoperation):
+    """
+    Add the edits in `new_networkdeltas_by_operation` to a network which already had
+    `apply_edit_history` applied to it.
+
+    Since new edits can join previously separate meta-operations together, the
+    meta-operation labels of the whole network are remapped from its operation labels
+    according to `operation_to_metaoperation`, which must cover all operations.
+    """
+    _pseudo_apply_edits(nf, new_networkdeltas_by_operation, operation_to_metaoperation)
+
+    for frame in [nf.nodes, nf.edges]:
+        for which in ["added", "removed"]:
+            frame[f"metaoperation_{which}"] = (
+                frame[f"operation_{which}"]
+                .map(operation_to_metaoperation)
+                .fillna(-1)
+                .astype(int)
+            )
+
+    _label_edit_history(nf)
+
+
+def _pseudo_apply_edits(nf, networkdeltas_by_operation, operation_to_metaoperation):
     for networkdelta in tqdm(networkdeltas_by_operation.values()):
         # this step is necessary to match the indexing set above
         networkdelta.added_edges = networkdelta.added_edges.set_index(
@@ -765,6 +1419,8 @@ def apply_edit_history(nf, networkdeltas_by_operation, operation_to_metaoperatio
             metaoperation_label=operation_to_metaoperation[operation_id],
         )
 
+
+def _label_edit_history(nf):
     # give the edges info about when those nodes were added
     nf.apply_node_features("operation_added", inplace=True)
     nf.apply_node_features("metaoperation_added", inplace=True)
@@ -862,13 +1518,12 @@ def resolve_synapses_from_edit_selections(
             found_pre_synapses = []
             found_post_synapses = []
         else:
-            found_pre_synapses = []
-            for synapses in instance_neuron_nf.nodes["pre_synapses"]:
-                found_pre_synapses.extend(synapses)
-
-            found_post_synapses = []
-            for synapses in instance_neuron_nf.nodes["post_synapses"]:
-                found_post_synapses.extend(synapses)
+            found_pre_synapses = _concatenate_synapse_lists(
+                instance_neuron_nf.nodes["pre_synapses"]
+            )
+            found_post_synapses = _concatenate_synapse_lists(
+                instance_neuron_nf.nodes["post_synapses"]
+            )
 
         resolved_pre_synapses[selection_name] = found_pre_synapses
         resolved_post_synapses[selection_name] = found_post_synapses
@@ -916,6 +1571,7 @@ def map_synapses_to_spatial_graph(
     client,
     l2dict_mesh=None,
     verbose=False,
+    supervoxel_store: Optional[SupervoxelLevel2Store] = None,
 ):
     level2_lineage_component_map = get_level2_lineage_components(
         networkdeltas_by_operation
@@ -934,6 +1590,7 @@ def map_synapses_to_spatial_graph(
             side,
             client,
             verbose=verbose,
+            supervoxel_store=supervoxel_store,
         )
 
         # now we can map each of the synapses to the mesh index, via the level 2 id
@@ -947,12 +1604,66 @@ def map_synapses_to_spatial_graph(
     return tuple(outs)
 
 
+def group_synapses_by_level2(
+    synapses: pd.DataFrame, mapping_col: str, node_index: pd.Index
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Group synapse ids by the level2 node they map to, in CSR layout.
+
+    Parameters
+    ----------
+    synapses :
+        Synapse table, indexed by synapse id.
+    mapping_col :
+        Column of `synapses` holding the level2 id for each synapse.
+    node_index :
+        Level2 node ids defining the row order of the output.
+
+    Returns
+    -------
+    indptr :
+        Array of length `len(node_index) + 1`; the synapses of the node at position
+        `i` are `indices[indptr[i]:indptr[i + 1]]`.
+    indices :
+        Synapse ids, sorted by node position.
+
+    Raises
+    ------
+    KeyError
+        If some synapses map to level2 ids which are not in `node_index`.
+    """
+    node_ilocs = node_index.get_indexer(synapses[mapping_col].values)
+    is_missing = node_ilocs == -1
+    if is_missing.any():
+        raise KeyError(
+            f"{is_missing.sum()} synapses map to level2 IDs not in the network, e.g. "
+            f"{synapses[mapping_col].values[is_missing][:5].tolist()}"
+        )
+    synapse_ids = synapses.index.values
+
+    order = np.argsort(node_ilocs, kind="stable")
+    indices = synapse_ids[order]
+
+    counts = np.bincount(node_ilocs, minlength=len(node_index))
+    indptr = np.zeros(len(node_index) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    return indptr, indices
+
+
+def _concatenate_synapse_lists(synapse_lists: pd.Series) -> list:
+    if len(synapse_lists) == 0:
+        return []
+    return np.concatenate(synapse_lists.values).tolist()
+
+
 def apply_synapses(
     nf: NetworkFrame,
     networkdeltas_by_operation: dict,
     root_id: int,
     client: cc.CAVEclient,
     verbose: bool = True,
+    supervoxel_store: Optional[SupervoxelLevel2Store] = None,
 ):
     # map synapses onto the network
     # this involves looking at the entire set of synapses at any point in time so to speak
@@ -966,26 +1677,123 @@ def apply_synapses(
         nf.nodes.index,
         client,
         verbose=verbose,
+        supervoxel_store=supervoxel_store,
     )
 
-    # record this mapping onto the networkframe
-    nf.nodes["synapses"] = [[] for _ in range(len(nf.nodes))]
-    nf.nodes["pre_synapses"] = [[] for _ in range(len(nf.nodes))]
-    nf.nodes["post_synapses"] = [[] for _ in range(len(nf.nodes))]
+    _record_synapses(nf, pre_synapses, post_synapses)
+
+    return pre_synapses, post_synapses
+
+
+def extend_synapses(
+    nf: NetworkFrame,
+    networkdeltas_by_operation: dict,
+    root_id: int,
+    client: cc.CAVEclient,
+    pre_synapses: pd.DataFrame,
+    post_synapses: pd.DataFrame,
+    new_operation_ids: Optional[list] = None,
+    verbose: bool = True,
+    supervoxel_store: Optional[SupervoxelLevel2Store] = None,
+):
+    """
+    Like `apply_synapses`, but keeps the mapping of the already mapped `pre_synapses`
+    and `post_synapses` where it still holds, and only maps the rest.
 
-    for idx, synapse in pre_synapses.iterrows():
-        nf.nodes.loc[synapse["pre_pt_current_level2_id"], "synapses"].append(idx)
-        nf.nodes.loc[synapse["pre_pt_current_level2_id"], "pre_synapses"].append(idx)
+    Synapses are (re)mapped if they are new for `root_id`, or if they were mapped to a
+    level2 node in the lineage of a node removed or added by one of
+    `new_operation_ids`, since those operations can change which node holds them. If
+    `new_operation_ids` is None, every synapse is mapped again.
+    """
+    all_pre_synapses, all_post_synapses = get_alltime_synapses(
+        root_id, client, verbose=verbose
+    )
 
-    for idx, synapse in post_synapses.iterrows():
-        nf.nodes.loc[synapse["post_pt_current_level2_id"], "synapses"].append(idx)
-        nf.nodes.loc[synapse["post_pt_current_level2_id"], "post_synapses"].append(idx)
+    if new_operation_ids is None:
+        affected_nodes = None
+    else:
+        level2_lineage_component_map = get_level2_lineage_components(
+            networkdeltas_by_operation
+        )
+        touched_nodes = []
+        for operation_id in new_operation_ids:
+            delta = networkdeltas_by_operation[operation_id]
+            touched_nodes.append(delta.removed_nodes.index)
+            touched_nodes.append(delta.added_nodes.index)
+        touched_nodes = np.concatenate(touched_nodes) if touched_nodes else []
+        affected_components = level2_lineage_component_map[
+            level2_lineage_component_map.index.isin(touched_nodes)
+        ].unique()
+        affected_nodes = level2_lineage_component_map.index[
+            level2_lineage_component_map.isin(affected_components)
+        ]
 
-    nf.nodes["has_synapses"] = nf.nodes["synapses"].apply(len) > 0
+    outs = []
+    to_map = []
+    for side, synapses, all_synapses in zip(
+        ["pre", "post"],
+        [pre_synapses, post_synapses],
+        [all_pre_synapses, all_post_synapses],
+    ):
+        if affected_nodes is None:
+            kept_synapses = synapses.iloc[:0]
+        else:
+            kept_synapses = synapses[
+                ~synapses[f"{side}_pt_level2_id"].isin(affected_nodes)
+            ]
+        outs.append(kept_synapses)
+        to_map.append(all_synapses[~all_synapses.index.isin(kept_synapses.index)])
+    if verbose:
+        print(
+            f"Mapping {len(to_map[0])} new or affected pre-synapses and "
+            f"{len(to_map[1])} new or affected post-synapses..."
+        )
+
+    new_pre_synapses, new_post_synapses = map_synapses_to_spatial_graph(
+        to_map[0],
+        to_map[1],
+        networkdeltas_by_operation,
+        nf.nodes.index,
+        client,
+        verbose=verbose,
+        supervoxel_store=supervoxel_store,
+    )
+    # in the same order as `apply_synapses` would give
+    pre_synapses = pd.concat([outs[0], new_pre_synapses])
+    pre_synapses = pre_synapses.loc[
+        all_pre_synapses.index[all_pre_synapses.index.isin(pre_synapses.index)]
+    ]
+    post_synapses = pd.concat([outs[1], new_post_synapses])
+    post_synapses = post_synapses.loc[
+        all_post_synapses.index[all_post_synapses.index.isin(post_synapses.index)]
+    ]
+
+    _record_synapses(nf, pre_synapses, post_synapses)
 
     return pre_synapses, post_synapses
 
 
+def _record_synapses(
+    nf: NetworkFrame, pre_synapses: pd.DataFrame, post_synapses: pd.DataFrame
+):
+    # record this mapping onto the networkframe
+    pre_indptr, pre_indices = group_synapses_by_level2(
+        pre_synapses, "pre_pt_current_level2_id", nf.nodes.index
+    )
+    post_indptr, post_indices = group_synapses_by_level2(
+        post_synapses, "post_pt_current_level2_id", nf.nodes.index
+    )
+
+    nf.nodes["pre_synapses"] = np.split(pre_indices, pre_indptr[1:-1])
+    nf.nodes["post_synapses"] = np.split(post_indices, post_indptr[1:-1])
+    nf.nodes["synapses"] = [
+        np.concatenate((pre, post))
+        for pre, post in zip(nf.nodes["pre_synapses"], nf.nodes["post_synapses"])
+    ]
+
+    nf.nodes["has_synapses"] = (np.diff(pre_indptr) + np.diff(post_indptr)) > 0
+
+
 # def load_network_edits(root_id: int, client: cc.CAVEclient):
 #     out_file = f"{root_id}_operations.json"
 
@@ -1,6 +1,5 @@
 import os
 
-import pandas as pd
 from caveclient import CAVEclient
 from cloudfiles import CloudFiles
 from networkframe import NetworkFrame
@@ -12,7 +11,8 @@ from ..edits import (
     get_network_edits,
     get_network_metaedits,
 )
-from .changes import get_supervoxel_level2_map
+from ..io import SupervoxelLevel2Store
+from .changes import get_ever_referenced_level2_ids, get_supervoxel_level2_map
 
 
 def get_environment_variables():
@@ -76,9 +76,9 @@ def lazy_load_network_edits(root_id: int, client: CAVEclient):
 
     networkdeltas_by_meta_operation = {}
     for meta_operation_id, delta in networkdelta_dicts.items():
-        networkdeltas_by_meta_operation[
-            int(meta_operation_id)
-        ] = NetworkDelta.from_dict(delta)
+        networkdeltas_by_meta_operation[int(meta_operation_id)] = (
+            NetworkDelta.from_dict(delta)
+        )
     in_meta_operation_map = cf.get_json(f"{root_id}_meta_operation_map.json")
     meta_operation_map = {}
     for meta_operation_id, operation_ids in in_meta_operation_map.items():
@@ -111,9 +111,9 @@ def load_network_edits(
         networkdelta_dicts = cf.get_json(out_file)
         networkdeltas_by_meta_operation = {}
         for meta_operation_id, delta in networkdelta_dicts.items():
-            networkdeltas_by_meta_operation[
-                int(meta_operation_id)
-            ] = NetworkDelta.from_dict(delta)
+            networkdeltas_by_meta_operation[int(meta_operation_id)] = (
+                NetworkDelta.from_dict(delta)
+            )
         in_meta_operation_map = cf.get_json(f"{root_id}_meta_operation_map.json")
         meta_operation_map = {}
         for meta_operation_id, operation_ids in in_meta_operation_map.items():
@@ -143,18 +143,31 @@ def lazy_load_initial_network(root_id, client, positions=True):
     return initial_network
 
 
-def lazy_load_supervoxel_level2_map(root_id, networkdeltas_by_operation, client):
+def lazy_load_supervoxel_level2_map(
+    root_id, networkdeltas_by_operation, client, store=None
+):
     cloud, recompute = get_environment_variables()
     cf = get_cloud_paths(cloud)
 
-    out_file = f"{root_id}_supervoxel_level2_map.json"
+    # level2 IDs are immutable, so rather than caching a map per root ID, only the
+    # level2 IDs the root ever referenced are cached, and their supervoxels are looked
+    # up in the store shared by all neurons, which only fetches unseen level2 IDs
+    out_file = f"{root_id}_ever_referenced_level2_ids.json"
     if not cf.exists(out_file) or recompute:
-        supervoxel_map = get_supervoxel_level2_map(
+        level2_ids = get_ever_referenced_level2_ids(
             root_id, networkdeltas_by_operation, client
         )
-        cf.put_json(out_file, supervoxel_map.to_dict())
-
-    supervoxel_map = cf.get_json(out_file)
-    supervoxel_map = pd.Series(supervoxel_map)
-    supervoxel_map.index = supervoxel_map.index.astype(int)
+        cf.put_json(out_file, [int(level2_id) for level2_id in level2_ids])
+
+    level2_ids = cf.get_json(out_file)
+
+    if store is None:
+        store = SupervoxelLevel2Store()
+    supervoxel_map = get_supervoxel_level2_map(
+        root_id,
+        networkdeltas_by_operation,
+        client,
+        store=store,
+        ever_referenced_level2_ids=level2_ids,
+    )
     return supervoxel_map
@@ -1,3 +1,4 @@
 from .l2_features import L2AggregateWrangler
+from .shards import FeatureShards
 
-__all__ = ["L2AggregateWrangler"]
+__all__ = ["L2AggregateWrangler", "FeatureShards"]
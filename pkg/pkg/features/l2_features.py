@@ -1,13 +1,18 @@
 from abc import abstractmethod
-from typing import Optional, Union
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
 
 import joblib
 import numpy as np
 import pandas as pd
 from caveclient import CAVEclient
-from networkframe import NetworkFrame
 from numpy.typing import ArrayLike
 from requests.exceptions import HTTPError
+from scipy.sparse import csr_array, identity
+from scipy.sparse.csgraph import connected_components, depth_first_order, dijkstra
+
+from ..utils import decode_l2data, get_l2data
+from .shards import FeatureShards
 
 FEATURES = [
     "area_nm2",
@@ -19,94 +24,83 @@ FEATURES = [
     "size_nm3",
 ]
 
+SCALAR_FEATURES = ["area_nm2", "max_dt_nm", "mean_dt_nm", "size_nm3"]
 
-# TODO make sure this is in the right ordering
-# TODO figure out if there's a good solution for sign flips
-def _unwrap_pca(pca):
-    if np.isnan(pca).all():
-        return np.full(9, np.nan)
-    return np.array(pca).ravel()
+# permutation invariant aggregations of neighborhood features
+AGGREGATIONS = ["mean", "std", "min", "max", "sum", "count"]
 
+# number of level 2 IDs per request to the l2cache
+L2DATA_BATCH_SIZE = 5000
 
-def _unwrap_pca_val(pca):
-    if np.isnan(pca).all():
-        return np.full(3, np.nan)
+# number of source nodes per batch of geodesic neighborhood searches
+GEODESIC_BATCH_SIZE = 1024
 
-    return np.array(pca).ravel()
+# number of (node, neighbor, feature) values gathered at once for min and max
+SEGMENT_BATCH_SIZE = 2**22
 
 
-# def rewrap_pca(pca):
-#     # take the vector and transform back into 3x3 matrix
-#     if np.isnan(pca).all():
-#         return np.full((3, 3), np.nan)
-#     return np.abs(np.array(pca).reshape(3, 3))
+# TODO make sure this is in the right ordering
+# TODO figure out if there's a good solution for sign flips
+def process_node_data(
+    node_data: Union[dict, pd.DataFrame], dtype=np.float64
+) -> Optional[pd.DataFrame]:
+    """
+    Decode l2cache attributes into a table of features, one row per level 2 node.
+
+    Parameters
+    ----------
+    node_data
+        Dictionary mapping level 2 IDs to dictionaries of their attributes, as returned
+        by `get_l2data`, or a DataFrame of the same indexed by level 2 ID.
+    dtype
+        Floating point type of the features.
+
+    Returns
+    -------
+    :
+        Features indexed by level 2 ID, with `pca` flattened into 9 columns and
+        `pca_val` and `rep_coord_nm` into 3 each, and NaN for missing values. None if
+        there are no nodes or no attributes at all.
+    """
+    l2_ids, decoded = decode_l2data(node_data, FEATURES, dtype=dtype)
+    if len(l2_ids) == 0:
+        return None
 
+    pca_val = decoded["pca_val"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pca_ratio = pca_val[:, [0]] / pca_val[:, [1]]
 
-def process_node_data(node_data):
-    if node_data.empty:
-        return None
-    if node_data.isnull().all().all():
+    values = np.concatenate(
+        [decoded[feature] for feature in SCALAR_FEATURES]
+        + [decoded["pca"], pca_val, pca_ratio, decoded["rep_coord_nm"]],
+        axis=1,
+    )
+    if np.isnan(values).all():
         return None
-    if not np.isin(
-        ["area_nm2", "max_dt_nm", "mean_dt_nm", "size_nm3"], node_data.columns
-    ).all():
-        scalar_features = pd.DataFrame(
-            index=node_data.index,
-            columns=["area_nm2", "max_dt_nm", "mean_dt_nm", "size_nm3"],
-        )
-    else:
-        scalar_features = node_data[
-            ["area_nm2", "max_dt_nm", "mean_dt_nm", "size_nm3"]
-        ].astype(float)
-
-    if "pca" in node_data.columns:
-        pca_unwrapped = np.stack(node_data["pca"].apply(_unwrap_pca).values)
-        pca_unwrapped = pd.DataFrame(
-            pca_unwrapped,
-            columns=[f"pca_unwrapped_{i}" for i in range(9)],
-            index=node_data.index,
-        )
-    else:
-        pca_unwrapped = pd.DataFrame(
-            index=node_data.index,
-            columns=[f"pca_unwrapped_{i}" for i in range(9)],
-        )
 
-    if "pca_val" not in node_data.columns:
-        pca_val_unwrapped = pd.DataFrame(
-            index=node_data.index,
-            columns=[f"pca_val_unwrapped_{i}" for i in range(3)] + ["pca_ratio_01"],
-        )
-    else:
-        pca_val_unwrapped = np.stack(node_data["pca_val"].apply(_unwrap_pca_val).values)
-        pca_val_unwrapped = pd.DataFrame(
-            pca_val_unwrapped,
-            columns=[f"pca_val_unwrapped_{i}" for i in range(3)],
-            index=node_data.index,
-        )
-        pca_val_unwrapped["pca_ratio_01"] = (
-            pca_val_unwrapped["pca_val_unwrapped_0"]
-            / pca_val_unwrapped["pca_val_unwrapped_1"]
-        )
+    columns = (
+        SCALAR_FEATURES
+        + [f"pca_unwrapped_{i}" for i in range(9)]
+        + [f"pca_val_unwrapped_{i}" for i in range(3)]
+        + ["pca_ratio_01"]
+        + ["rep_coord_x", "rep_coord_y", "rep_coord_z"]
+    )
+    clean_node_data = pd.DataFrame(
+        values, index=pd.Index(l2_ids, name="l2_id"), columns=columns
+    )
+    return clean_node_data
 
-    if "rep_coord_nm" not in node_data.columns:
-        rep_coord_unwrapped = pd.DataFrame(
-            index=node_data.index,
-            columns=["rep_coord_x", "rep_coord_y", "rep_coord_z"],
-        )
-    else:
-        rep_coord_unwrapped = np.stack(node_data["rep_coord_nm"].values)
-        rep_coord_unwrapped = pd.DataFrame(
-            rep_coord_unwrapped,
-            columns=["rep_coord_x", "rep_coord_y", "rep_coord_z"],
-            index=node_data.index,
-        )
 
-    clean_node_data = pd.concat(
-        [scalar_features, pca_unwrapped, pca_val_unwrapped, rep_coord_unwrapped], axis=1
-    )
+class ExtractionFailure(NamedTuple):
+    """Stands in for the data of an object which could not be fetched."""
 
-    return clean_node_data
+    message: str
+
+
+def _bounds_key(bounds) -> Optional[tuple]:
+    if bounds is None:
+        return None
+    return tuple(np.asarray(bounds).ravel().tolist())
 
 
 class BaseWrangler:
@@ -116,11 +110,13 @@ class BaseWrangler:
         n_jobs: int = 1,
         continue_on_error: bool = True,
         verbose: Union[int, bool] = False,
+        max_concurrent_requests: int = 8,
     ):
         self.client = client
         self.n_jobs = n_jobs
         self.continue_on_error = continue_on_error
         self.verbose = verbose
+        self.max_concurrent_requests = max_concurrent_requests
 
     def print(self, msg: str, level: int = 0) -> None:
         if self.verbose >= level and self.n_jobs == 1:
@@ -131,9 +127,17 @@ class BaseWrangler:
         object_ids: ArrayLike,
         bounds_by_object: Optional[ArrayLike] = None,
         points_by_object: Optional[ArrayLike] = None,
-    ) -> pd.DataFrame:
+        out_path: Optional[Union[str, Path]] = None,
+        objects_per_shard: int = 100,
+        resume: bool = False,
+    ) -> Union[pd.DataFrame, FeatureShards]:
         """Extract features for a list of objects.
 
+        Extraction happens in three phases: every object is planned (e.g. its
+        children are looked up), the data needed by all of the plans is fetched at
+        once, de-duplicated across objects and in large batches, and finally the
+        features of each object are computed locally from the fetched data.
+
         Parameters
         ----------
         object_ids
@@ -143,40 +147,147 @@ class BaseWrangler:
             List of bounds to extract features for. If None, no bounds are used in the
             extraction of features for the specified object ID. Some feature extractors
             may not support bounds or may require them.
+        out_path
+            If not None, features are not returned in memory but streamed to Parquet
+            shards in this directory, one shard per `objects_per_shard` objects, each
+            written as soon as its objects are done. See `FeatureShards`.
+        objects_per_shard
+            Number of objects per shard when streaming to `out_path`.
+        resume
+            If True, objects (with the same bounds) already in the shards in
+            `out_path` are skipped, e.g. to continue an interrupted extraction.
+            Objects whose data could not be fetched are not recorded in the shards,
+            so they are tried again. If False, `out_path` must not already hold
+            shards.
 
         Returns
         -------
         :
             DataFrame containing extracted features for the specified objects. The outer
             index is the object ID; the inner index may be some other ID for children
-            of the object ID.
+            of the object ID. If streaming to `out_path`, the `FeatureShards` holding
+            them instead.
         """
         if isinstance(object_ids, (int, np.integer)):
             object_ids = [object_ids]
+        if bounds_by_object is None:
+            bounds_by_object = [None] * len(object_ids)
+
+        if out_path is not None:
+            return self._stream_features(
+                object_ids, bounds_by_object, out_path, objects_per_shard, resume
+            )
+
+        data_by_object = self._extract_features(object_ids, bounds_by_object)
+        data_by_object = [
+            None if isinstance(x, ExtractionFailure) else x for x in data_by_object
+        ]
+        data = self._combine_features(data_by_object)
+        return data
+
+    def _stream_features(
+        self, object_ids, bounds_by_object, out_path, objects_per_shard, resume
+    ) -> FeatureShards:
+        shards = FeatureShards(out_path)
+        if len(shards) > 0 and not resume:
+            raise ValueError(
+                f"{out_path} already holds feature shards; use resume=True to "
+                "continue extracting into it, or a new out_path."
+            )
+
+        completed = shards.completed_objects()
+        keys = [
+            (int(object_id), _bounds_key(bounds))
+            for object_id, bounds in zip(object_ids, bounds_by_object)
+        ]
+        remaining = [i for i, key in enumerate(keys) if key not in completed]
+        self.print(
+            f"Skipping {len(keys) - len(remaining)} objects already in {out_path}",
+            level=1,
+        )
+
+        for start in range(0, len(remaining), objects_per_shard):
+            indices = remaining[start : start + objects_per_shard]
+            data_by_object = self._extract_features(
+                [object_ids[i] for i in indices],
+                [bounds_by_object[i] for i in indices],
+            )
+            # objects which failed are left out of the shard, to be retried on resume
+            is_failed = [isinstance(x, ExtractionFailure) for x in data_by_object]
+            data_by_object = [
+                x for x, failed in zip(data_by_object, is_failed) if not failed
+            ]
+            if all(x is None for x in data_by_object):
+                data = None
+            else:
+                data = self._combine_features(data_by_object)
+            shards.write(
+                data,
+                [keys[i] for i, failed in zip(indices, is_failed) if not failed],
+            )
+            self.print(
+                f"Wrote features for {start + len(indices)} of {len(remaining)} "
+                f"objects ({sum(is_failed)} failed in this shard)",
+                level=1,
+            )
+        return shards
 
+    def _extract_features(self, object_ids, bounds_by_object) -> list:
+        self.print(
+            f"Planning feature extraction for {len(object_ids)} objects", level=1
+        )
+        plans = self._plan(object_ids, bounds_by_object)
+
+        self.print("Fetching data for all objects", level=1)
+        fetched_by_object = self._fetch(plans)
+
+        self.print("Computing features for each object", level=1)
         if self.n_jobs == 1:
             data_by_object = []
-            for i, object_id in enumerate(object_ids):
-                if bounds_by_object is not None:
-                    bounds = bounds_by_object[i]
-                else:
-                    bounds = None
-                object_node_data = self._extract_for_object(object_id, bounds)
+            for plan, fetched in zip(plans, fetched_by_object):
+                object_node_data = self._extract_for_object(plan, fetched)
                 data_by_object.append(object_node_data)
         else:
             data_by_object = joblib.Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
-                joblib.delayed(self._extract_for_object)(
-                    object_id,
-                    bounds_by_object[i] if bounds_by_object is not None else None,
-                )
-                for i, object_id in enumerate(object_ids)
+                joblib.delayed(self._extract_for_object)(plan, fetched)
+                for plan, fetched in zip(plans, fetched_by_object)
             )
+        return data_by_object
+
+    def _plan(self, object_ids, bounds_by_object) -> list:
+        # objects repeated with the same bounds are only planned once
+        keys = [
+            (object_id, _bounds_key(bounds))
+            for object_id, bounds in zip(object_ids, bounds_by_object)
+        ]
+        unique_inputs = {}
+        for key, object_id, bounds in zip(keys, object_ids, bounds_by_object):
+            unique_inputs.setdefault(key, (object_id, bounds))
+
+        unique_plans = self._map_requests(
+            lambda inputs: self._plan_for_object(*inputs), list(unique_inputs.values())
+        )
+        plans_by_key = dict(zip(unique_inputs.keys(), unique_plans))
+        return [plans_by_key[key] for key in keys]
+
+    def _map_requests(self, func, items) -> list:
+        """Apply `func` to each of `items`, at most `max_concurrent_requests` at once."""
+        if self.max_concurrent_requests == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        return joblib.Parallel(n_jobs=self.max_concurrent_requests, prefer="threads")(
+            joblib.delayed(func)(item) for item in items
+        )
 
-        data = self._combine_features(data_by_object)
-        return data
+    @abstractmethod
+    def _plan_for_object(self, object_id, bounds):
+        pass
+
+    @abstractmethod
+    def _fetch(self, plans):
+        pass
 
     @abstractmethod
-    def _extract_for_object(self, object_id, bounds):
+    def _extract_for_object(self, plan, fetched):
         pass
 
     @abstractmethod
@@ -184,6 +295,14 @@ class BaseWrangler:
         pass
 
 
+class L2ObjectPlan(NamedTuple):
+    """Level 2 nodes and edges of an object, within its bounds."""
+
+    object_id: int
+    l2_ids: np.ndarray
+    edges: pd.DataFrame
+
+
 class L2AggregateWrangler(BaseWrangler):
     def __init__(
         self,
@@ -192,7 +311,10 @@ class L2AggregateWrangler(BaseWrangler):
         continue_on_error=True,
         verbose=False,
         neighborhood_hops=5,
+        neighborhood_distance_nm=None,
         drop_self_in_neighborhood=True,
+        aggregations=["mean"],
+        max_concurrent_requests=8,
     ):
         """
         Feature extractor for level 2 nodes, using graph aggregation to average features
@@ -213,18 +335,44 @@ class L2AggregateWrangler(BaseWrangler):
             verbosity.
         neighborhood_hops
             Number of hops to consider for neighborhood aggregation.
+        neighborhood_distance_nm
+            If not None, neighborhoods are instead the nodes within this geodesic
+            distance (in nm) of each node, measured along the level 2 graph with edges
+            weighted by the distance between the representative coordinates of the
+            nodes they connect. Overrides `neighborhood_hops`.
         drop_self_in_neighborhood
             If True, do not include the node itself in the neighborhood aggregation.
             A separate vector of features is still computed for the node itself.
+        aggregations
+            Aggregations of the features of each neighborhood to compute, any of
+            "mean", "std", "min", "max", "sum" and "count" (of non-missing values).
+            Missing values are skipped. Columns are named "{feature}_neighbor_agg" for
+            the mean and "{feature}_neighbor_{aggregation}" otherwise.
+        max_concurrent_requests
+            Maximum number of requests to the chunkedgraph or the l2cache in flight at
+            once.
         """
         super().__init__(
             client=client,
             n_jobs=n_jobs,
             continue_on_error=continue_on_error,
             verbose=verbose,
+            max_concurrent_requests=max_concurrent_requests,
         )
+        if neighborhood_hops is not None and neighborhood_hops < 0:
+            raise ValueError(
+                f"neighborhood_hops must be non-negative, got {neighborhood_hops}."
+            )
         self.neighborhood_hops = neighborhood_hops
+        self.neighborhood_distance_nm = neighborhood_distance_nm
         self.drop_self_in_neighborhood = drop_self_in_neighborhood
+        for aggregation in aggregations:
+            if aggregation not in AGGREGATIONS:
+                raise ValueError(
+                    f"Aggregation {aggregation} not recognized, must be one of "
+                    f"{AGGREGATIONS}."
+                )
+        self.aggregations = aggregations
 
     def _combine_features(self, data_by_object):
         if all([x is None for x in data_by_object]):
@@ -234,18 +382,95 @@ class L2AggregateWrangler(BaseWrangler):
         node_data.set_index(["object_id", "l2_id"], inplace=True)
         return node_data
 
-    def _extract_for_object(self, object_id, bounds):
-        self.print(f"Extracting features for object {object_id}", level=2)
-        object_node_data = self._extract_node_features(object_id, bounds)
+    def _plan_for_object(
+        self, object_id, bounds
+    ) -> Union[L2ObjectPlan, ExtractionFailure]:
+        try:
+            l2_ids = self.client.chunkedgraph.get_leaves(
+                object_id, stop_layer=2, bounds=bounds
+            )
+            edges = self._extract_edges(object_id, bounds)
+        except HTTPError as e:
+            if self.continue_on_error:
+                self.print(f"Error planning object {object_id}: {e}", level=2)
+                return ExtractionFailure(repr(e))
+            else:
+                raise e
+        l2_ids = np.asarray(l2_ids, dtype=np.int64)
+        return L2ObjectPlan(object_id=object_id, l2_ids=l2_ids, edges=edges)
+
+    def _fetch(self, plans: list[Union[L2ObjectPlan, ExtractionFailure]]) -> list:
+        l2_ids = [plan.l2_ids for plan in plans if isinstance(plan, L2ObjectPlan)]
+        if len(l2_ids) > 0:
+            l2_ids = np.unique(np.concatenate(l2_ids))
+        else:
+            l2_ids = np.array([], dtype=np.int64)
+        self.print(f"Fetching data for {len(l2_ids)} unique level 2 nodes", level=1)
+
+        batches = [
+            l2_ids[i : i + L2DATA_BATCH_SIZE]
+            for i in range(0, len(l2_ids), L2DATA_BATCH_SIZE)
+        ]
+        l2data_by_batch = self._map_requests(self._fetch_l2data_batch, batches)
+
+        l2data = {}
+        failed_l2_ids = []
+        for batch, batch_l2data in zip(batches, l2data_by_batch):
+            if isinstance(batch_l2data, ExtractionFailure):
+                failed_l2_ids.append(batch)
+            else:
+                l2data.update(batch_l2data)
+        failed_l2_ids = (
+            np.concatenate(failed_l2_ids) if len(failed_l2_ids) > 0 else np.array([])
+        )
+
+        node_data = process_node_data(l2data)
+
+        fetched_by_object = []
+        for plan in plans:
+            if isinstance(plan, ExtractionFailure):
+                fetched_by_object.append(plan)
+                continue
+            if np.isin(plan.l2_ids, failed_l2_ids).any():
+                fetched_by_object.append(
+                    ExtractionFailure("Failed to fetch level 2 data.")
+                )
+                continue
+            if node_data is None:
+                fetched_by_object.append(None)
+                continue
+            object_node_data = node_data.reindex(plan.l2_ids)
+            object_node_data.index.name = "l2_id"
+            if object_node_data.empty or object_node_data.isnull().all().all():
+                fetched_by_object.append(None)
+            else:
+                fetched_by_object.append(object_node_data)
+        return fetched_by_object
+
+    def _fetch_l2data_batch(self, l2_ids: np.ndarray) -> Union[dict, ExtractionFailure]:
+        try:
+            return get_l2data(l2_ids, self.client, attributes=FEATURES)
+        except HTTPError as e:
+            if self.continue_on_error:
+                self.print(f"Error fetching data for level 2 nodes: {e}", level=2)
+                return ExtractionFailure(repr(e))
+            else:
+                raise e
+
+    def _extract_for_object(
+        self,
+        plan: Union[L2ObjectPlan, ExtractionFailure],
+        object_node_data: Union[pd.DataFrame, ExtractionFailure, None],
+    ):
+        if isinstance(object_node_data, ExtractionFailure):
+            return object_node_data
         if object_node_data is None:
             return None
-
-        self.print(f"Extracting level 2 graph for object {object_id}", level=2)
-        object_edges = self._extract_edges(object_id, bounds)
+        object_id = plan.object_id
 
         self.print(f"Extracting neighborhood features for object {object_id}", level=2)
         object_neighborhood_features = self._compute_neighborhood_features(
-            object_node_data, object_edges
+            object_node_data, plan.edges
         )
 
         object_node_data = object_node_data.join(object_neighborhood_features)
@@ -253,25 +478,6 @@ class L2AggregateWrangler(BaseWrangler):
         object_node_data["object_id"] = object_id
         return object_node_data
 
-    def _extract_node_features(self, object_id, bounds):
-        l2_ids = self.client.chunkedgraph.get_leaves(
-            object_id, stop_layer=2, bounds=bounds
-        )
-        try:
-            node_data = pd.DataFrame(
-                self.client.l2cache.get_l2data(l2_ids, attributes=FEATURES)
-            ).T
-            node_data.index = node_data.index.astype(int)
-            node_data.index.name = "l2_id"
-            node_data = process_node_data(node_data)
-            return node_data
-        except HTTPError as e:
-            if self.continue_on_error:
-                self.print(f"Error fetching data for object {object_id}: {e}", level=2)
-                return None
-            else:
-                raise e
-
     def _extract_edges(self, object_id, bounds):
         edges = self.client.chunkedgraph.level2_chunk_graph(object_id, bounds=bounds)
         edges = pd.DataFrame(edges, columns=["source", "target"])
@@ -280,29 +486,223 @@ class L2AggregateWrangler(BaseWrangler):
     def _compute_neighborhood_features(
         self, object_node_data: pd.DataFrame, object_edges: pd.DataFrame
     ):
-        nf = NetworkFrame(object_node_data, object_edges)
+        adjacency = _build_adjacency(object_node_data.index, object_edges)
         k = self.neighborhood_hops
-        distance = None
+        distance = self.neighborhood_distance_nm
         if distance is not None:
-            raise NotImplementedError(
-                "Distance-based neighborhood features not yet implemented"
-            )
+            positions = object_node_data[
+                ["rep_coord_x", "rep_coord_y", "rep_coord_z"]
+            ].to_numpy(dtype=float)
+            lengths = _weight_by_edge_length(adjacency, positions)
+            neighborhoods = _geodesic_reachability(lengths, distance)
         else:
             assert k is not None
-            neighborhoods = nf.k_hop_decomposition(k=k, directed=False)
-
-        rows = []
-        for node, neighborhood in neighborhoods.items():
-            neighborhood_nodes = neighborhood.nodes
-            if self.drop_self_in_neighborhood:
-                neighborhood_nodes = neighborhood_nodes.drop(node)
-            # TODO could be generalized to other permutation invariant aggregations
-            agg_neighbor_features = neighborhood_nodes.mean(skipna=True).to_frame().T
-            rows.append(agg_neighbor_features)
-        neighborhood_features = pd.concat(rows)
-        neighborhood_features.rename(
-            columns=lambda x: f"{x}_neighbor_agg", inplace=True
+            neighborhoods = _k_hop_reachability(adjacency, k)
+
+        if self.drop_self_in_neighborhood:
+            neighborhoods.setdiag(0)
+            neighborhoods.eliminate_zeros()
+
+        features = object_node_data.to_numpy(dtype=float)
+        aggregated = _aggregate_neighborhoods(
+            neighborhoods, features, self.aggregations
         )
-        neighborhood_features.index = list(neighborhoods.keys())
+
+        neighborhood_features = []
+        for aggregation in self.aggregations:
+            suffix = "agg" if aggregation == "mean" else aggregation
+            neighborhood_features.append(
+                pd.DataFrame(
+                    aggregated[aggregation],
+                    index=object_node_data.index,
+                    columns=[
+                        f"{x}_neighbor_{suffix}" for x in object_node_data.columns
+                    ],
+                )
+            )
+        neighborhood_features = pd.concat(neighborhood_features, axis=1)
         neighborhood_features.index.name = "l2_id"
         return neighborhood_features
+
+
+def _build_adjacency(nodes: pd.Index, edges: pd.DataFrame) -> csr_array:
+    """
+    Symmetric sparse adjacency matrix of the level 2 graph, ordered like `nodes`.
+
+    Edges to nodes not in `nodes` (e.g. ones with no l2cache data) are dropped.
+    """
+    n = len(nodes)
+    sources = nodes.get_indexer(edges["source"])
+    targets = nodes.get_indexer(edges["target"])
+    keep = (sources != -1) & (targets != -1)
+    sources = sources[keep]
+    targets = targets[keep]
+    adjacency = csr_array(
+        (
+            np.ones(2 * len(sources)),
+            (np.concatenate([sources, targets]), np.concatenate([targets, sources])),
+        ),
+        shape=(n, n),
+    )
+    adjacency.sum_duplicates()
+    adjacency.data[:] = 1.0
+    return adjacency
+
+
+def _k_hop_reachability(adjacency: csr_array, k: int) -> csr_array:
+    """
+    Binary matrix of which nodes are within `k` hops of each node, itself included.
+
+    Computed as the nonzero pattern of (A + I)^k, one sparse product per hop; the
+    entries are reset to 1 after each product so that they do not grow with the
+    number of paths.
+    """
+    if k < 0:
+        raise ValueError(f"Number of hops must be non-negative, got {k}.")
+    if k == 0:
+        return csr_array(identity(adjacency.shape[0], format="csr"))
+    step = (adjacency + identity(adjacency.shape[0], format="csr")).tocsr()
+    step.data[:] = 1.0
+    reachability = step.copy()
+    for _ in range(k - 1):
+        reachability = (reachability @ step).tocsr()
+        reachability.data[:] = 1.0
+    return reachability
+
+
+def _aggregate_neighborhoods(
+    neighborhoods: csr_array, features: np.ndarray, aggregations: list[str]
+) -> dict[str, np.ndarray]:
+    """
+    Aggregate `features` over each row of the binary matrix `neighborhoods`.
+
+    The sum, count, mean and standard deviation all come from one sparse product of
+    `neighborhoods` with the feature values, their squares and which are not missing,
+    side by side. The minimum and maximum are segment reductions over the features
+    of each node's neighbors, gathered in batches of rows. Missing values are skipped,
+    and a node with no non-missing values in its neighborhood gets NaN (or a count of
+    0).
+    """
+    n_features = features.shape[1]
+    is_valid = ~np.isnan(features)
+    values = np.where(is_valid, features, 0.0)
+
+    aggregated = {}
+    if any(a in aggregations for a in ["mean", "std", "sum", "count"]):
+        products = neighborhoods @ np.concatenate(
+            [values, values**2, is_valid.astype(float)], axis=1
+        )
+        sums = products[:, :n_features]
+        squares = products[:, n_features : 2 * n_features]
+        counts = products[:, 2 * n_features :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+            # sample standard deviation, as in pandas
+            variances = (squares - sums * means) / (counts - 1)
+        means[counts == 0] = np.nan
+        variances[counts < 2] = np.nan
+        aggregated["sum"] = sums
+        aggregated["count"] = counts
+        aggregated["mean"] = means
+        aggregated["std"] = np.sqrt(np.maximum(variances, 0))
+
+    if "min" in aggregations or "max" in aggregations:
+        n = neighborhoods.shape[0]
+        indptr = neighborhoods.indptr
+        mins = np.full((n, n_features), np.nan)
+        maxs = np.full((n, n_features), np.nan)
+        # batches of rows holding about SEGMENT_BATCH_SIZE values each
+        batch_nnz = max(SEGMENT_BATCH_SIZE // max(n_features, 1), 1)
+        boundaries = np.searchsorted(
+            indptr, np.arange(0, indptr[-1], batch_nnz), side="right"
+        )
+        boundaries = np.unique(np.concatenate([[0], boundaries - 1, [n]]))
+        for start, stop in zip(boundaries[:-1], boundaries[1:]):
+            rows = np.arange(start, stop)
+            rows = rows[indptr[rows + 1] > indptr[rows]]
+            if len(rows) == 0:
+                continue
+            gathered = features[neighborhoods.indices[indptr[start] : indptr[stop]]]
+            segment_starts = indptr[rows] - indptr[start]
+            with np.errstate(invalid="ignore"):
+                mins[rows] = np.fmin.reduceat(gathered, segment_starts, axis=0)
+                maxs[rows] = np.fmax.reduceat(gathered, segment_starts, axis=0)
+        aggregated["min"] = mins
+        aggregated["max"] = maxs
+
+    return {aggregation: aggregated[aggregation] for aggregation in aggregations}
+
+
+def _weight_by_edge_length(adjacency: csr_array, positions: np.ndarray) -> csr_array:
+    """
+    Adjacency matrix with each edge weighted by the distance between its endpoints.
+
+    Edges with an endpoint missing a position are given the median edge length.
+    """
+    lengths = adjacency.tocoo()
+    lengths.data = np.linalg.norm(
+        positions[lengths.row] - positions[lengths.col], axis=1
+    )
+    is_missing = np.isnan(lengths.data)
+    if is_missing.all():
+        lengths.data[:] = 1.0
+    elif is_missing.any():
+        lengths.data[is_missing] = np.median(lengths.data[~is_missing])
+    # zero-length edges would be read as no edge
+    lengths.data = np.maximum(lengths.data, np.finfo(float).eps)
+    return lengths.tocsr()
+
+
+def _depth_first_ordering(adjacency: csr_array) -> np.ndarray:
+    """Order of the nodes in a depth-first traversal of every connected component."""
+    n = adjacency.shape[0]
+    _, labels = connected_components(adjacency, directed=False)
+    # a virtual node linked to one node of each component, to traverse them all at once
+    _, component_starts = np.unique(labels, return_index=True)
+    links = csr_array(
+        (
+            np.ones(len(component_starts)),
+            (np.full(len(component_starts), n), component_starts),
+        ),
+        shape=(n + 1, n + 1),
+    )
+    linked = adjacency.copy()
+    linked.resize((n + 1, n + 1))
+    order = depth_first_order(
+        (linked + links).tocsr(), n, directed=False, return_predecessors=False
+    )
+    return order[1:]
+
+
+def _geodesic_reachability(lengths: csr_array, distance: float) -> csr_array:
+    """
+    Binary matrix of which nodes are within `distance` of each node, itself included,
+    along a graph with edge weights `lengths`.
+
+    Sources are searched in batches of nearby nodes (in depth-first order).
+    For each batch, one bounded multi-source Dijkstra finds the region within
+    `distance` of any of its sources, and the bounded Dijkstra from each source is
+    then run on that region alone, so the cost tracks the size of the neighborhoods
+    rather than the size of the graph.
+    """
+    n = lengths.shape[0]
+    order = _depth_first_ordering(lengths)
+    rows = []
+    cols = []
+    for start in range(0, n, GEODESIC_BATCH_SIZE):
+        sources = order[start : start + GEODESIC_BATCH_SIZE]
+        nearest = dijkstra(
+            lengths, directed=False, indices=sources, limit=distance, min_only=True
+        )
+        region = np.flatnonzero(np.isfinite(nearest))
+        region_lengths = lengths[region][:, region]
+        region_sources = np.searchsorted(region, sources)
+        distances = dijkstra(
+            region_lengths, directed=False, indices=region_sources, limit=distance
+        )
+        source_index, region_index = np.nonzero(np.isfinite(distances))
+        rows.append(sources[source_index])
+        cols.append(region[region_index])
+    rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+    cols = np.concatenate(cols) if cols else np.array([], dtype=int)
+    return csr_array((np.ones(len(rows)), (rows, cols)), shape=(n, n))
@@ -0,0 +1,141 @@
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+
+SHARD_PREFIX = "part-"
+
+
+def _write_atomic(file: Path, write) -> None:
+    tmp_file = file.with_name(file.name + f".{uuid.uuid4().hex}.tmp")
+    try:
+        write(tmp_file)
+        os.replace(tmp_file, file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+
+def _decode_key(key: list) -> tuple:
+    object_id, bounds = key
+    return (object_id, tuple(bounds) if bounds is not None else None)
+
+
+class FeatureShards:
+    """
+    Features written to a directory of Parquet shards, read lazily.
+
+    Each shard holds the features of a batch of objects, in "part-{i}.parquet", next
+    to a manifest "part-{i}.json" of the objects (and their bounds) it covers. The
+    manifest is written last, so a shard only counts as done once both exist;
+    objects which had no features are listed in a manifest with no Parquet file.
+    Reading and writing Parquet needs pyarrow or fastparquet, as in pandas.
+
+    Parameters
+    ----------
+    path :
+        Directory of the shards. Created if it does not exist.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"FeatureShards(path={self.path}, n_shards={len(self)})"
+
+    def _manifest_files(self) -> list[Path]:
+        return sorted(self.path.glob(f"{SHARD_PREFIX}*.json"))
+
+    def _manifests(self) -> list[dict]:
+        manifests = []
+        for manifest_file in self._manifest_files():
+            with open(manifest_file) as f:
+                manifests.append(json.load(f))
+        return manifests
+
+    def __len__(self) -> int:
+        return len(self._manifest_files())
+
+    def completed_objects(self) -> set[tuple]:
+        """The (object ID, bounds) pairs covered by the written shards."""
+        completed = set()
+        for manifest in self._manifests():
+            completed.update(_decode_key(key) for key in manifest["objects"])
+        return completed
+
+    def write(self, data: Optional[pd.DataFrame], object_keys: list[tuple]) -> None:
+        """
+        Write a shard of features.
+
+        Parameters
+        ----------
+        data :
+            Features of the objects, or None if none of them had any.
+        object_keys :
+            (object ID, bounds) pair of each object covered by the shard, whether or
+            not it had features.
+        """
+        manifest_files = self._manifest_files()
+        if len(manifest_files) > 0:
+            shard = int(manifest_files[-1].stem.removeprefix(SHARD_PREFIX)) + 1
+        else:
+            shard = 0
+        name = f"{SHARD_PREFIX}{shard:05d}"
+
+        if data is not None:
+            _write_atomic(
+                self.path / f"{name}.parquet", lambda file: data.to_parquet(file)
+            )
+        manifest = {
+            "file": f"{name}.parquet" if data is not None else None,
+            "n_rows": len(data) if data is not None else 0,
+            "objects": [
+                [int(object_id), list(bounds) if bounds is not None else None]
+                for object_id, bounds in object_keys
+            ],
+        }
+        _write_atomic(
+            self.path / f"{name}.json",
+            lambda file: file.write_text(json.dumps(manifest)),
+        )
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        """Iterate over the features in each shard, reading one shard at a time."""
+        for manifest in self._manifests():
+            if manifest["file"] is not None:
+                yield pd.read_parquet(self.path / manifest["file"])
+
+    def read(
+        self, object_ids: Optional[list] = None, columns: Optional[list] = None
+    ) -> pd.DataFrame:
+        """
+        Read the features in the shards into one DataFrame.
+
+        Parameters
+        ----------
+        object_ids :
+            If not None, only read the features of these objects. Shards are filtered
+            as they are read, so only the selected rows are held in memory.
+        columns :
+            If not None, only read these feature columns.
+        """
+        data = []
+        for manifest in self._manifests():
+            if manifest["file"] is None:
+                continue
+            if object_ids is not None and not any(
+                object_id in object_ids for object_id, _ in manifest["objects"]
+            ):
+                continue
+            shard_data = pd.read_parquet(self.path / manifest["file"], columns=columns)
+            if object_ids is not None:
+                shard_data = shard_data[
+                    shard_data.index.get_level_values("object_id").isin(object_ids)
+                ]
+            data.append(shard_data)
+        if len(data) == 0:
+            return pd.DataFrame()
+        return pd.concat(data)
@@ -1,4 +1,19 @@
+from .catalog import ArtifactCatalog, get_default_catalog
 from .lazycloud import lazycloud
+from .level2_store import SupervoxelLevel2Store
+from .metrics import get_cache_metrics, reset_cache_metrics
+from .serialization import deserialize, serialize
 from .variables import get_variables, write_variable
 
-__all__ = ["lazycloud", "get_variables", "write_variable"]
+__all__ = [
+    "lazycloud",
+    "get_variables",
+    "write_variable",
+    "SupervoxelLevel2Store",
+    "get_cache_metrics",
+    "reset_cache_metrics",
+    "ArtifactCatalog",
+    "get_default_catalog",
+    "serialize",
+    "deserialize",
+]
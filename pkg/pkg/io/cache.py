@@ -0,0 +1,650 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from cloudfiles import CloudFiles
+from cloudfiles.secrets import google_credentials
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+
+from pkg.constants import OUT_PATH
+
+from .serialization import _BufferReader
+
+DEFAULT_MEMORY_BYTES = 2**30
+DEFAULT_DISK_BYTES = 50 * 2**30
+DEFAULT_DISK_SCAN_INTERVAL = 600
+# evicting down to below the limit leaves room for a batch of puts before the next scan
+DISK_EVICT_FRACTION = 0.9
+DEFAULT_LEASE_TTL = 300
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_WAIT_TIMEOUT = 3600
+
+LEASE_SUFFIX = ".lease"
+
+
+class ArtifactKey(NamedTuple):
+    """Location of a cached artifact: a file in a folder of a cloud bucket."""
+
+    cloud_bucket: str
+    folder: str
+    file_name: str
+
+    @property
+    def path(self) -> str:
+        return f"{self.cloud_bucket}/{self.folder}/{self.file_name}"
+
+
+class MemoryCache:
+    """
+    In-process least-recently-used cache of serialized artifacts.
+
+    Artifacts are kept as bytes rather than as objects, so that callers which modify
+    what they load cannot change what later callers get.
+
+    Parameters
+    ----------
+    max_bytes :
+        Total size of the artifacts to hold; the least recently used are dropped
+        beyond it. Artifacts larger than this are never held.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return (
+            f"MemoryCache(max_bytes={self.max_bytes}, n_bytes={self.n_bytes}, "
+            f"artifacts={len(self._data)})"
+        )
+
+    def get(self, key: ArtifactKey) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key.path)
+            if data is not None:
+                self._data.move_to_end(key.path)
+            return data
+
+    def put(self, key: ArtifactKey, data: bytes) -> None:
+        with self._lock:
+            self._discard(key.path)
+            if len(data) > self.max_bytes:
+                return
+            self._data[key.path] = data
+            self.n_bytes += len(data)
+            while self.n_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.n_bytes -= len(evicted)
+
+    def discard(self, key: ArtifactKey) -> None:
+        with self._lock:
+            self._discard(key.path)
+
+    def _discard(self, path: str) -> None:
+        data = self._data.pop(path, None)
+        if data is not None:
+            self.n_bytes -= len(data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.n_bytes = 0
+
+
+class DiskCache:
+    """
+    Local on-disk cache of serialized artifacts, mirroring the bucket layout.
+
+    Reading an artifact marks it as recently used, and once the artifacts added push
+    the cache past `max_bytes` the least recently used ones are deleted until it is
+    back under 90% of it.
+    The size of the cache is kept as a running total between scans of the directory,
+    which are only done to evict, or every `scan_interval` seconds to count what other
+    processes sharing the directory have added.
+
+    Parameters
+    ----------
+    path :
+        Directory to hold the cache. Created if it does not exist.
+    max_bytes :
+        Total size of the artifacts to hold on disk.
+    scan_interval :
+        Longest time in seconds to go without scanning the directory while artifacts
+        are being added.
+    """
+
+    name = "disk"
+
+    def __init__(
+        self,
+        path: Union[str, Path] = OUT_PATH / "lazycloud_cache",
+        max_bytes: int = DEFAULT_DISK_BYTES,
+        scan_interval: float = DEFAULT_DISK_SCAN_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.scan_interval = scan_interval
+        self._lock = threading.Lock()
+        # unknown until the directory is first scanned
+        self._n_bytes = None
+        self._last_scan = -float("inf")
+
+    def __repr__(self) -> str:
+        return f"DiskCache(path={self.path}, max_bytes={self.max_bytes})"
+
+    def _file(self, key: ArtifactKey) -> Path:
+        return self.path / key.path
+
+    def get(self, key: ArtifactKey) -> Optional[bytes]:
+        file = self._file(key)
+        try:
+            data = file.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: ArtifactKey, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        file = self._file(key)
+        replaced_size = _file_size(file)
+        _write_atomic(file, data)
+        with self._lock:
+            if self._n_bytes is not None:
+                self._n_bytes += len(data) - replaced_size
+            scan = (
+                self._n_bytes is None
+                or self._n_bytes > self.max_bytes
+                or time.monotonic() - self._last_scan > self.scan_interval
+            )
+        if scan:
+            self.evict()
+
+    def discard(self, key: ArtifactKey) -> None:
+        file = self._file(key)
+        size = _file_size(file)
+        file.unlink(missing_ok=True)
+        with self._lock:
+            if self._n_bytes is not None:
+                self._n_bytes -= size
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used artifacts until the cache is under 90% of
+        `max_bytes`.
+
+        Scans the whole directory, and resets the running size total from it.
+        """
+        scan_time = time.monotonic()
+        files = []
+        for file in self.path.rglob("*"):
+            if file.is_file() and not file.name.endswith(".tmp"):
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file))
+        n_bytes = sum(size for _, size, _ in files)
+        for _, size, file in sorted(files, key=lambda x: x[0]):
+            if n_bytes <= self.max_bytes * DISK_EVICT_FRACTION:
+                break
+            file.unlink(missing_ok=True)
+            n_bytes -= size
+        with self._lock:
+            self._n_bytes = n_bytes
+            self._last_scan = scan_time
+
+
+class CloudCache:
+    """Artifacts in their cloud bucket, the source of truth for all other tiers."""
+
+    name = "cloud"
+
+    def __init__(self):
+        self._buckets = {}
+
+    def __repr__(self) -> str:
+        return "CloudCache()"
+
+    def _cloudfiles(self, key: ArtifactKey) -> CloudFiles:
+        return CloudFiles(f"gs://{key.cloud_bucket}/{key.folder}")
+
+    def get(self, key: ArtifactKey) -> Optional[bytes]:
+        # a single request, which gives None if the artifact does not exist
+        return self._cloudfiles(key).get(key.file_name)
+
+    def put(self, key: ArtifactKey, data: bytes) -> None:
+        # streamed from the buffer in chunks with the GCS client, as cloudfiles would
+        # need a full copy of it as bytes
+        view = memoryview(data).cast("B")
+        self._blob(key, key.file_name).upload_from_file(
+            _BufferReader(view),
+            size=view.nbytes,
+            content_type="application/octet-stream",
+        )
+
+    def discard(self, key: ArtifactKey) -> None:
+        self._cloudfiles(key).delete(key.file_name)
+
+    # uploads to the bucket are atomic, so readers never see a partial artifact.
+    # leases are marker objects next to the artifact, written with the GCS client
+    # directly since cloudfiles has no preconditions: a lease is created only if
+    # there is none, and taken over, renewed or deleted only if it is still the
+    # generation of it which was read
+
+    def _blob(self, key: ArtifactKey, file_name: str) -> storage.Blob:
+        bucket = self._buckets.get(key.cloud_bucket)
+        if bucket is None:
+            # the same credentials cloudfiles uses
+            project, credentials = google_credentials(key.cloud_bucket)
+            client = storage.Client(project=project, credentials=credentials)
+            bucket = client.bucket(key.cloud_bucket)
+            self._buckets[key.cloud_bucket] = bucket
+        return bucket.blob(f"{key.folder}/{file_name}")
+
+    def _lease_blob(self, key: ArtifactKey) -> storage.Blob:
+        return self._blob(key, key.file_name + LEASE_SUFFIX)
+
+    def _get_lease(self, key: ArtifactKey) -> tuple[Optional[dict], Optional[int]]:
+        # the lease, and its generation; None for both if there is none
+        blob = self._lease_blob(key)
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return None, None
+        return _parse_lease(data), blob.generation
+
+    def acquire_lease(self, key: ArtifactKey, owner: str, ttl: float) -> bool:
+        try:
+            self._lease_blob(key).upload_from_string(
+                _make_lease(owner, ttl), if_generation_match=0
+            )
+            return True
+        except PreconditionFailed:
+            pass
+
+        lease, generation = self._get_lease(key)
+        if generation is None:
+            # released in the meantime
+            return self.acquire_lease(key, owner, ttl)
+        if lease is not None and lease["owner"] == owner:
+            return True
+        if lease is not None and lease["expires"] > time.time():
+            return False
+        # the holder is gone (or the lease is corrupted); of the callers racing to
+        # take it over, only the first to write succeeds
+        try:
+            self._lease_blob(key).upload_from_string(
+                _make_lease(owner, ttl), if_generation_match=generation
+            )
+            return True
+        except PreconditionFailed:
+            return False
+
+    def renew_lease(self, key: ArtifactKey, owner: str, ttl: float) -> None:
+        lease, generation = self._get_lease(key)
+        if lease is None or lease["owner"] != owner:
+            print(f"LAZYCLOUD: Lost lease on {key.path}")
+            return
+        try:
+            self._lease_blob(key).upload_from_string(
+                _make_lease(owner, ttl), if_generation_match=generation
+            )
+        except PreconditionFailed:
+            print(f"LAZYCLOUD: Lost lease on {key.path}")
+
+    def release_lease(self, key: ArtifactKey, owner: str) -> None:
+        lease, generation = self._get_lease(key)
+        if lease is None or lease["owner"] != owner:
+            return
+        try:
+            self._lease_blob(key).delete(if_generation_match=generation)
+        except (NotFound, PreconditionFailed):
+            pass
+
+
+class LocalFileCache:
+    """
+    Artifacts in a local directory laid out like the cloud buckets.
+
+    A stand-in for `CloudCache` as the source of truth, e.g. for working offline or
+    for testing, which can be shared between processes on one machine. Artifacts are
+    written atomically, and leases are lock files created exclusively.
+
+    Parameters
+    ----------
+    path :
+        Directory to hold the artifacts. Created if it does not exist.
+    """
+
+    name = "local"
+
+    def __init__(self, path: Union[str, Path] = OUT_PATH / "lazycloud_local"):
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"LocalFileCache(path={self.path})"
+
+    def _file(self, key: ArtifactKey) -> Path:
+        return self.path / key.path
+
+    def _lease_file(self, key: ArtifactKey) -> Path:
+        file = self._file(key)
+        return file.with_name(file.name + LEASE_SUFFIX)
+
+    def get(self, key: ArtifactKey) -> Optional[bytes]:
+        try:
+            return self._file(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: ArtifactKey, data: bytes) -> None:
+        _write_atomic(self._file(key), data)
+
+    def discard(self, key: ArtifactKey) -> None:
+        self._file(key).unlink(missing_ok=True)
+
+    def acquire_lease(self, key: ArtifactKey, owner: str, ttl: float) -> bool:
+        lease_file = self._lease_file(key)
+        lease_file.parent.mkdir(parents=True, exist_ok=True)
+        # the lease is written in full first and then linked into place, which fails
+        # if the lease file exists, so no one ever sees a lease half written
+        tmp_file = lease_file.with_name(lease_file.name + f".{uuid.uuid4().hex}.tmp")
+        tmp_file.write_bytes(_make_lease(owner, ttl))
+        try:
+            os.link(tmp_file, lease_file)
+            return True
+        except FileExistsError:
+            pass
+        finally:
+            tmp_file.unlink(missing_ok=True)
+
+        lease = _read_lease(lease_file)
+        if lease is not None and lease["owner"] == owner:
+            return True
+        if lease is not None and lease["expires"] > time.time():
+            return False
+        if lease is None:
+            # unreadable, e.g. corrupted; held until it is older than a lease lasts
+            try:
+                if time.time() - lease_file.stat().st_mtime < ttl:
+                    return False
+            except FileNotFoundError:
+                return self.acquire_lease(key, owner, ttl)
+        # the holder is gone; only one of the callers racing to break the lease can
+        # move it out of the way, and then they race to create it as above
+        stale_file = lease_file.with_name(lease_file.name + f".{uuid.uuid4().hex}.tmp")
+        try:
+            os.replace(lease_file, stale_file)
+        except FileNotFoundError:
+            return False
+        stale_file.unlink(missing_ok=True)
+        return self.acquire_lease(key, owner, ttl)
+
+    def renew_lease(self, key: ArtifactKey, owner: str, ttl: float) -> None:
+        lease_file = self._lease_file(key)
+        lease = _read_lease(lease_file)
+        if lease is None or lease["owner"] != owner:
+            print(f"LAZYCLOUD: Lost lease on {key.path}")
+            return
+        _write_atomic(lease_file, _make_lease(owner, ttl))
+
+    def release_lease(self, key: ArtifactKey, owner: str) -> None:
+        lease_file = self._lease_file(key)
+        lease = _read_lease(lease_file)
+        if lease is not None and lease["owner"] == owner:
+            lease_file.unlink(missing_ok=True)
+
+
+def _write_atomic(file: Path, data: bytes) -> None:
+    # readers see either the old file or the new one, never a partial write
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = file.with_name(file.name + f".{uuid.uuid4().hex}.tmp")
+    tmp_file.write_bytes(data)
+    os.replace(tmp_file, file)
+
+
+def _file_size(file: Path) -> int:
+    try:
+        return file.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _make_lease(owner: str, ttl: float) -> bytes:
+    return json.dumps({"owner": owner, "expires": time.time() + ttl}).encode()
+
+
+def _parse_lease(data: Optional[bytes]) -> Optional[dict]:
+    if data is None:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        # a lease being written right now
+        return None
+
+
+def _read_lease(lease_file: Path) -> Optional[dict]:
+    try:
+        return _parse_lease(lease_file.read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+class Lease:
+    """
+    A held lease on computing an artifact, kept alive in the background until released.
+
+    Made by `TieredCache.acquire`; use as a context manager, or call `release`.
+    """
+
+    def __init__(self, tier, key: ArtifactKey, owner: str, ttl: float):
+        self.tier = tier
+        self.key = key
+        self.owner = owner
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread = None
+        if tier is not None:
+            self._thread = threading.Thread(target=self._renew, daemon=True)
+            self._thread.start()
+
+    def __repr__(self) -> str:
+        return f"Lease(key={self.key}, owner={self.owner})"
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.tier.renew_lease(self.key, self.owner, self.ttl)
+            except Exception as e:
+                print(f"LAZYCLOUD: Failed to renew lease on {self.key.path}: {e}")
+
+    def release(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.tier.release_lease(self.key, self.owner)
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class TieredCache:
+    """
+    Looks artifacts up in each of `tiers` in turn, from fastest to slowest.
+
+    An artifact found in a slower tier is copied into the faster ones, and new
+    artifacts are written to every tier, slowest (most durable) first.
+
+    To keep concurrent workers from all computing the same missing artifact, leases
+    on computing artifacts are taken out in the slowest tier, if it supports them
+    (see `acquire`).
+
+    Parameters
+    ----------
+    tiers :
+        Caches, from fastest to slowest.
+    lease_ttl :
+        Seconds a lease lasts without being renewed. Held leases are renewed in the
+        background, so this only bounds how long a crashed worker blocks others.
+    poll_interval :
+        Seconds between checks for an artifact being computed elsewhere.
+    wait_timeout :
+        Seconds to wait for an artifact being computed elsewhere before computing it
+        anyway. None waits for as long as the lease is held, which may be forever if
+        its holder is stuck but alive.
+    """
+
+    def __init__(
+        self,
+        tiers: list,
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        wait_timeout: Optional[float] = DEFAULT_WAIT_TIMEOUT,
+    ):
+        self.tiers = tiers
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def __repr__(self) -> str:
+        return f"TieredCache(tiers={self.tiers})"
+
+    def get(self, key: ArtifactKey) -> tuple[Optional[bytes], Optional[str]]:
+        """
+        Returns
+        -------
+        :
+            The artifact, or None if no tier has it, and the name of the tier it was
+            found in.
+        """
+        for i, tier in enumerate(self.tiers):
+            data = tier.get(key)
+            if data is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.put(key, data)
+                return data, tier.name
+        return None, None
+
+    def put(self, key: ArtifactKey, data: bytes) -> None:
+        for tier in self.tiers[::-1]:
+            tier.put(key, data)
+
+    def discard(self, key: ArtifactKey) -> None:
+        for tier in self.tiers:
+            tier.discard(key)
+
+    def acquire(
+        self, key: ArtifactKey, verbose: bool = False
+    ) -> tuple[Optional[bytes], Optional[str], Optional[Lease]]:
+        """
+        Wait for an artifact being computed elsewhere, or take the lease on computing it.
+
+        Returns
+        -------
+        :
+            The artifact, the name of the tier it was found in, and None if it was
+            computed elsewhere in the meantime; otherwise None, None and a `Lease` to
+            release once the artifact has been `put`.
+        """
+        lease_tier = self.tiers[-1]
+        if not hasattr(lease_tier, "acquire_lease"):
+            return None, None, Lease(None, key, self.owner, self.lease_ttl)
+
+        start = time.time()
+        waiting = False
+        while True:
+            if lease_tier.acquire_lease(key, self.owner, self.lease_ttl):
+                lease = Lease(lease_tier, key, self.owner, self.lease_ttl)
+                # it may have been written between our miss and taking the lease
+                data, tier_name = self.get(key) if waiting else (None, None)
+                if data is not None:
+                    lease.release()
+                    return data, tier_name, None
+                return None, None, lease
+
+            if not waiting and verbose:
+                print(f"LAZYCLOUD: Waiting for {key.file_name} to be computed...")
+            waiting = True
+            time.sleep(self.poll_interval)
+            data, tier_name = self.get(key)
+            if data is not None:
+                return data, tier_name, None
+            if (
+                self.wait_timeout is not None
+                and time.time() - start > self.wait_timeout
+            ):
+                return None, None, Lease(None, key, self.owner, self.lease_ttl)
+
+
+_DEFAULT_CACHE = None
+
+
+def get_default_cache() -> TieredCache:
+    """
+    Get the process-wide cache used by `lazycloud`.
+
+    The memory and disk tiers can be sized with the `LAZYCLOUD_MEMORY_BYTES` and
+    `LAZYCLOUD_DISK_BYTES` environment variables (0 turns a tier off), and the disk
+    cache placed with `LAZYCLOUD_DISK_PATH`. Setting `LAZYCLOUD_LOCAL_PATH` keeps
+    artifacts in that directory rather than in the cloud, and `LAZYCLOUD_LEASE_TTL`,
+    `LAZYCLOUD_POLL_INTERVAL` and `LAZYCLOUD_WAIT_TIMEOUT` tune the waiting on
+    artifacts computed elsewhere.
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        memory_bytes = int(
+            os.environ.get("LAZYCLOUD_MEMORY_BYTES", DEFAULT_MEMORY_BYTES)
+        )
+        disk_bytes = int(os.environ.get("LAZYCLOUD_DISK_BYTES", DEFAULT_DISK_BYTES))
+        disk_path = os.environ.get("LAZYCLOUD_DISK_PATH", OUT_PATH / "lazycloud_cache")
+
+        tiers = []
+        if memory_bytes > 0:
+            tiers.append(MemoryCache(max_bytes=memory_bytes))
+        if disk_bytes > 0:
+            tiers.append(DiskCache(path=disk_path, max_bytes=disk_bytes))
+        local_path = os.environ.get("LAZYCLOUD_LOCAL_PATH")
+        if local_path:
+            tiers.append(LocalFileCache(path=local_path))
+        else:
+            tiers.append(CloudCache())
+        _DEFAULT_CACHE = TieredCache(
+            tiers,
+            lease_ttl=float(os.environ.get("LAZYCLOUD_LEASE_TTL", DEFAULT_LEASE_TTL)),
+            poll_interval=float(
+                os.environ.get("LAZYCLOUD_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)
+            ),
+            wait_timeout=float(
+                os.environ.get("LAZYCLOUD_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+            ),
+        )
+    return _DEFAULT_CACHE
+
+
+def set_default_cache(cache: Optional[TieredCache]) -> None:
+    """Set the cache used by `lazycloud`; None restores the default on next use."""
+    global _DEFAULT_CACHE
+    _DEFAULT_CACHE = cache
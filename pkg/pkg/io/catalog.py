@@ -0,0 +1,338 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import pandas as pd
+from cloudfiles import CloudFiles
+
+from pkg.constants import OUT_PATH
+
+from .cache import ArtifactKey
+
+
+class ArtifactCatalog:
+    """
+    Local index of the artifacts cached by `lazycloud`.
+
+    Maps each artifact to the function and key parameters it was made with, and its
+    size, creation time and format, so that which artifacts exist can be asked
+    locally rather than with a request per artifact. Every artifact `lazycloud`
+    writes or loads from its source of truth is recorded; artifacts written
+    elsewhere can be added with `scan`.
+
+    The catalog is a SQLite database, so it can be shared by processes on one
+    machine.
+
+    Parameters
+    ----------
+    path :
+        File to hold the catalog. Created if it does not exist.
+    """
+
+    def __init__(self, path: Union[str, Path] = OUT_PATH / "lazycloud_catalog.sqlite"):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def __repr__(self) -> str:
+        return f"ArtifactCatalog(path={self.path})"
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                "path TEXT PRIMARY KEY, cloud_bucket TEXT, folder TEXT, "
+                "file_name TEXT, function TEXT, file_suffix TEXT, params TEXT, "
+                "size INTEGER, created REAL, save_format TEXT, compression TEXT)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS artifacts_suffix "
+                "ON artifacts (folder, file_suffix)"
+            )
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def record(
+        self,
+        key: ArtifactKey,
+        function: Optional[str],
+        file_suffix: str,
+        params: dict,
+        size: Optional[int],
+        save_format: Optional[str] = None,
+        compression: Optional[str] = None,
+        created: Optional[float] = None,
+    ) -> None:
+        """Add an artifact to the catalog, replacing any previous entry for it."""
+        if created is None:
+            created = time.time()
+        with self._connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key.path,
+                    key.cloud_bucket,
+                    key.folder,
+                    key.file_name,
+                    function,
+                    file_suffix,
+                    json.dumps(params, default=_to_json),
+                    size,
+                    created,
+                    save_format,
+                    compression,
+                ),
+            )
+
+    def contains(self, key: ArtifactKey) -> bool:
+        cursor = self._connection.execute(
+            "SELECT 1 FROM artifacts WHERE path = ?", (key.path,)
+        )
+        return cursor.fetchone() is not None
+
+    def discard(self, key: ArtifactKey) -> None:
+        with self._connection as connection:
+            connection.execute("DELETE FROM artifacts WHERE path = ?", (key.path,))
+
+    def query(
+        self,
+        function: Optional[str] = None,
+        file_suffix: Optional[str] = None,
+        folder: Optional[str] = None,
+        **params,
+    ) -> pd.DataFrame:
+        """
+        Find the artifacts in the catalog.
+
+        Parameters
+        ----------
+        function :
+            Only artifacts made by the function of this name.
+        file_suffix :
+            Only artifacts with this `file_suffix`, e.g.
+            "merge_and_clean_sequence.pkl".
+        folder :
+            Only artifacts in this folder.
+        **params :
+            Only artifacts whose key parameters have these values, e.g.
+            `random_seed=3`. A list or other collection matches any of its values,
+            e.g. `root_id=root_ids`.
+
+        Returns
+        -------
+        :
+            One row per artifact, with one column per key parameter after the
+            catalog columns.
+        """
+        conditions = []
+        values = []
+        for column, value in [
+            ("function", function),
+            ("file_suffix", file_suffix),
+            ("folder", folder),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        sql = "SELECT * FROM artifacts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        table = pd.read_sql_query(sql, self._connection, params=values)
+
+        param_table = pd.DataFrame(
+            [json.loads(p) for p in table["params"]], index=table.index
+        )
+        table = pd.concat([table.drop(columns="params"), param_table], axis=1)
+
+        for name, value in params.items():
+            if name not in table.columns:
+                return table.iloc[:0]
+            if isinstance(value, (str, bytes)) or not hasattr(value, "__iter__"):
+                value = [value]
+            # parameters may have been recorded as strings when scanned from names
+            value = set(value) | {str(v) for v in value}
+            table = table[table[name].isin(value)]
+        return table.reset_index(drop=True)
+
+    def scan(
+        self,
+        cloud_bucket: Optional[str] = None,
+        folder: Optional[str] = None,
+        file_suffix: Optional[str] = None,
+        function: Optional[Union[str, Callable]] = None,
+        arg_names: Optional[list] = None,
+        kwarg_keys: Optional[list] = None,
+    ) -> int:
+        """
+        Add artifacts already in a bucket folder to the catalog.
+
+        Key parameters are parsed from the file names, and numeric and boolean values
+        are cast back from strings; creation times are not known.
+
+        Parameters
+        ----------
+        cloud_bucket, folder, file_suffix :
+            Where the artifacts are, and the `file_suffix` they were written with.
+            If None, taken from `function`.
+        function :
+            A function decorated with `lazycloud`, whose bucket, folder, suffix and key
+            parameters are used where not given, or the name to record the artifacts
+            under.
+        arg_names :
+            Names of the positional key parameters (`arg_keys`) the file names start
+            with, in order. If None, taken from `function`, else there are none.
+        kwarg_keys :
+            Names of the keyword key parameters in the file names. If None, taken from
+            `function` (with its `optional_kwarg_keys`, filled in with their defaults
+            where left out), else any "name=value" token is parsed.
+
+        Returns
+        -------
+        :
+            The number of artifacts added.
+        """
+        if callable(function):
+            if cloud_bucket is None:
+                cloud_bucket = function.cloud_bucket
+            if folder is None:
+                folder = function.folder
+            if file_suffix is None:
+                file_suffix = function.file_suffix
+            if arg_names is None:
+                arg_names = function.arg_names
+            if kwarg_keys is None:
+                kwarg_keys = function.kwarg_keys
+            optional_kwarg_defaults = function.optional_kwarg_defaults
+            function = function.__name__
+        else:
+            optional_kwarg_defaults = {}
+        if cloud_bucket is None or folder is None or file_suffix is None:
+            raise ValueError(
+                "cloud_bucket, folder and file_suffix are needed if function is not "
+                "decorated with lazycloud."
+            )
+        if arg_names is None:
+            arg_names = []
+
+        cf = CloudFiles(f"gs://{cloud_bucket}/{folder}")
+        file_names = [
+            file_name
+            for file_name in cf.list(flat=True)
+            if file_name.endswith("-" + file_suffix)
+        ]
+        file_names = [
+            file_name
+            for file_name in file_names
+            if not self.contains(ArtifactKey(cloud_bucket, folder, file_name))
+        ]
+        params_by_file = {}
+        for file_name in file_names:
+            params = _parse_params(
+                file_name[: -len(file_suffix) - 1],
+                arg_names,
+                kwarg_keys,
+                optional_kwarg_defaults,
+            )
+            if params is not None:
+                params_by_file[file_name] = params
+
+        sizes = cf.size(list(params_by_file)) if params_by_file else {}
+        for file_name, params in params_by_file.items():
+            self.record(
+                ArtifactKey(cloud_bucket, folder, file_name),
+                function,
+                file_suffix,
+                params,
+                sizes.get(file_name),
+                created=float("nan"),
+            )
+        return len(params_by_file)
+
+
+def _parse_value(value: str):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return {"True": True, "False": False, "None": None}.get(value, value)
+
+
+def _parse_params(
+    key: str,
+    arg_names: list,
+    kwarg_keys: Optional[list],
+    optional_kwarg_defaults: dict = {},
+) -> Optional[dict]:
+    # inverse of how lazycloud names files: "{arg}-...-{kwarg}={value}-...", where
+    # optional keyword parameters are left out when at their default
+    if kwarg_keys is not None:
+        kwarg_keys = list(kwarg_keys) + list(optional_kwarg_defaults)
+    tokens = key.split("-") if key else []
+    if len(tokens) < len(arg_names):
+        return None
+    params = {name: _parse_value(token) for name, token in zip(arg_names, tokens)}
+    values = {}
+    name = None
+    for token in tokens[len(arg_names) :]:
+        token_name, sep, value = token.partition("=")
+        if sep and (kwarg_keys is None or token_name in kwarg_keys):
+            name = token_name
+            values[name] = value
+        elif name is not None:
+            # the value itself had a "-" in it
+            values[name] += "-" + token
+        else:
+            return None
+    if kwarg_keys is not None and set(values) | set(optional_kwarg_defaults) != set(
+        kwarg_keys
+    ):
+        return None
+    params.update(optional_kwarg_defaults)
+    params.update({name: _parse_value(value) for name, value in values.items()})
+    return params
+
+
+def _to_json(obj):
+    # e.g. numpy integers, which root IDs often are
+    if hasattr(obj, "item"):
+        return obj.item()
+    return str(obj)
+
+
+_DEFAULT_CATALOG = None
+
+
+def get_default_catalog() -> Optional[ArtifactCatalog]:
+    """
+    Get the process-wide catalog `lazycloud` records artifacts in.
+
+    The catalog can be placed with the `LAZYCLOUD_CATALOG_PATH` environment variable;
+    setting it to an empty string turns the catalog off.
+    """
+    global _DEFAULT_CATALOG
+    if _DEFAULT_CATALOG is None:
+        path = os.environ.get(
+            "LAZYCLOUD_CATALOG_PATH", OUT_PATH / "lazycloud_catalog.sqlite"
+        )
+        if not path:
+            return None
+        _DEFAULT_CATALOG = ArtifactCatalog(path)
+    return _DEFAULT_CATALOG
+
+
+def set_default_catalog(catalog: Optional[ArtifactCatalog]) -> None:
+    """Set the catalog used by `lazycloud`; None restores the default on next use."""
+    global _DEFAULT_CATALOG
+    _DEFAULT_CATALOG = catalog
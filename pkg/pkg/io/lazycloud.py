@@ -1,15 +1,26 @@
-import json
+import inspect
 import os
-import pickle
+import sqlite3
+import time
 from functools import wraps
 from pathlib import Path
 from typing import Callable, Literal, Optional, Union
 
-import numpy as np
 from cloudfiles import CloudFiles
 
 from pkg.constants import OUT_PATH
 
+from .cache import ArtifactKey, TieredCache, get_default_cache
+from .catalog import ArtifactCatalog, get_default_catalog
+from .metrics import CACHE_METRICS
+from .serialization import (
+    FORMATS,
+    Compression,
+    deserialize,
+    get_compression,
+    serialize,
+)
+
 
 def get_cloudfiles(
     use_cloud: bool, cloud_bucket: str, foldername: str, local_path: str = ""
@@ -38,15 +49,6 @@ def parametrized(dec):
     return layer
 
 
-class CustomJSONizer(json.JSONEncoder):
-    def default(self, obj):
-        return (
-            super().encode(bool(obj))
-            if isinstance(obj, np.bool_)
-            else super().default(obj)
-        )
-
-
 @parametrized
 def lazycloud(
     func: Callable,
@@ -56,10 +58,16 @@ def lazycloud(
     arg_keys: Union[int, list[int]] = [],
     kwarg_keys: Union[str, list[str]] = [],
     local_path: Union[str, Path] = OUT_PATH,
-    save_format: Literal["pickle", "json"] = "pickle",
+    save_format: Literal["pickle", "json", "npz"] = "pickle",
     load_func: Optional[Callable] = None,
     save_func: Optional[Callable] = None,
     verify: bool = False,
+    cache: Optional[TieredCache] = None,
+    compression: Optional[Compression] = None,
+    compression_level: Optional[int] = None,
+    catalog: Optional[ArtifactCatalog] = None,
+    optional_kwarg_keys: list[str] = [],
+    legacy_formats: list[tuple[str, str, Optional[Callable]]] = [],
 ) -> Callable:
     """
     This decorator is used to cache the results of a function in the cloud (or fallback
@@ -83,8 +91,9 @@ def lazycloud(
     local_path :
         The local path to use for caching.
     save_format :
-        The format to use for saving the cache, can be "pickle" or "json". If None, will
-        use the `load_func` and `save_func` instead.
+        The format to use for saving the cache, can be "pickle", "json" or "npz". For
+        "npz", the (possibly `save_func`-transformed) result must be a dictionary of
+        numpy arrays. If None, will use the `load_func` and `save_func` instead.
     load_func :
         A function to use prior to pickling/json-ing, depending on `save_format`. This
         can be used to prepare an object for these operations.
@@ -94,32 +103,105 @@ def lazycloud(
     verify :
         Whether to check if the loaded result from the cache matches the one computed
         when running the function. Requires the result to implement the `__eq__` method.
-    """
+    cache :
+        The tiers to look results up in and write them to. If None, uses
+        `get_default_cache`: an in-memory LRU cache, then a local disk cache, then the
+        cloud bucket. A freshly computed result is returned from its serialized form
+        without reading it back from the cloud.
+    compression :
+        Compression to write new results with: "zstd", "brotli" or "gzip", or None
+        for none. The compression is recorded in the artifact, so results are always
+        loaded correctly whatever they were written with. Serialization is streamed
+        through the compressor in both directions.
+    compression_level :
+        Compression level to use, if `compression`. If None, uses the codec's default.
+    catalog :
+        Catalog to record the artifacts written or found in the source of truth in,
+        with the values of their `arg_keys` and `kwarg_keys`. If None, uses
+        `get_default_catalog`.
+    optional_kwarg_keys :
+        Names of arguments to also index the cache by, like `kwarg_keys`, but only
+        when they are not at their default value, so that adding one to a function
+        keeps the names of the artifacts it made before. They may be passed by
+        position or keyword.
+    legacy_formats :
+        Earlier (file_suffix, save_format, load_func) the artifacts were written
+        with. On a miss, the artifact is looked for in the source of truth under each
+        of these in turn, and if found, loaded with its `load_func` and written back
+        in the current format, rather than recomputed.
 
-    if save_format == "pickle":
-        loader = pickle.loads
-        saver = pickle.dumps
-    elif save_format == "json":
-        loader = json.loads
+    Notes
+    -----
+    Hits, misses, and the time and bytes spent on each decorated function are
+    recorded; see `pkg.io.get_cache_metrics`.
+    """
 
-        def saver(obj):
-            return json.dumps(obj, cls=CustomJSONizer)
-    else:
+    if save_format not in FORMATS:
         raise ValueError(f"Unknown save_format: {save_format}")
 
+    parameters = inspect.signature(func).parameters
+    parameter_names = list(parameters)
+    optional_kwarg_defaults = {
+        kwarg_key: parameters[kwarg_key].default for kwarg_key in optional_kwarg_keys
+    }
+
+    def get_optional_kwargs(args, kwargs):
+        values = {}
+        for kwarg_key, default in optional_kwarg_defaults.items():
+            position = parameter_names.index(kwarg_key)
+            if kwarg_key in kwargs:
+                values[kwarg_key] = kwargs[kwarg_key]
+            elif position < len(args):
+                values[kwarg_key] = args[position]
+            else:
+                values[kwarg_key] = default
+        return values
+
+    def record_artifact(key, args, kwargs, data, function_name, overwrite):
+        if catalog is None:
+            artifact_catalog = get_default_catalog()
+        else:
+            artifact_catalog = catalog
+        if artifact_catalog is None:
+            return
+        params = {parameter_names[arg_key]: args[arg_key] for arg_key in arg_keys}
+        params.update({kwarg_key: kwargs[kwarg_key] for kwarg_key in kwarg_keys})
+        params.update(get_optional_kwargs(args, kwargs))
+        try:
+            if not overwrite and artifact_catalog.contains(key):
+                return
+            artifact_catalog.record(
+                key,
+                function_name,
+                file_suffix,
+                params,
+                len(data),
+                save_format=save_format,
+                compression=get_compression(data),
+            )
+        except sqlite3.Error as e:
+            print(f"LAZYCLOUD: Failed to catalog {key.file_name}: {e}")
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         # use_cloud = (
         #     os.environ.get("LAZYCLOUD_USE_CLOUD", "False").capitalize() == "True"
         # )
-        cf = get_cloudfiles(True, cloud_bucket, folder, local_path=local_path)
-
-        file_name = ""
+        file_prefix = ""
         for arg_key in arg_keys:
-            file_name += str(args[arg_key]) + "-"
+            file_prefix += str(args[arg_key]) + "-"
         for kwarg_key in kwarg_keys:
-            file_name += f"{str(kwarg_key)}={str(kwargs[kwarg_key])}-"
-        file_name += file_suffix
+            file_prefix += f"{str(kwarg_key)}={str(kwargs[kwarg_key])}-"
+        for kwarg_key, value in get_optional_kwargs(args, kwargs).items():
+            if value != optional_kwarg_defaults[kwarg_key]:
+                file_prefix += f"{str(kwarg_key)}={str(value)}-"
+        file_name = file_prefix + file_suffix
+        key = ArtifactKey(cloud_bucket, folder, file_name)
+
+        if cache is None:
+            tiered_cache = get_default_cache()
+        else:
+            tiered_cache = cache
 
         if "cache_verbose" in kwargs:
             cache_verbose = kwargs.get("cache_verbose")
@@ -150,25 +232,107 @@ def lazycloud(
         else:
             only_load = False
 
-        if (not cf.exists(file_name) or force_recompute) and not only_load:
-            result = func(*args, **kwargs)
-            if save_func:
-                result = save_func(result)
+        function_name = func.__name__
+        CACHE_METRICS.add(function_name, calls=1)
+
+        data = None
+        tier_name = None
+        lease = None
+        if not force_recompute or only_load:
+            data, tier_name = tiered_cache.get(key)
+            if data is not None:
+                CACHE_METRICS.hit(function_name, tier_name, len(data))
+                if cache_verbose:
+                    print(f"LAZYCLOUD: Loading result {file_name} from {tier_name}...")
 
-            result = saver(result)
-            if cache_verbose:
-                print(f"LAZYCLOUD: Writing {file_name} to cloud...")
-            cf.put(file_name, result)
+        if data is None and not force_recompute:
+            for legacy_suffix, legacy_format, legacy_load_func in legacy_formats:
+                legacy_key = ArtifactKey(
+                    cloud_bucket, folder, file_prefix + legacy_suffix
+                )
+                legacy_data = tiered_cache.tiers[-1].get(legacy_key)
+                if legacy_data is None:
+                    continue
+                if cache_verbose:
+                    print(
+                        f"LAZYCLOUD: Migrating result {legacy_key.file_name} to "
+                        f"{file_name}..."
+                    )
+                result = deserialize(legacy_data, legacy_format)
+                if legacy_load_func:
+                    result = legacy_load_func(result)
+                if save_func:
+                    result = save_func(result)
+                data = serialize(
+                    result,
+                    save_format,
+                    compression=compression,
+                    compression_level=compression_level,
+                )
+                tiered_cache.put(key, data)
+                tier_name = tiered_cache.tiers[-1].name
+                CACHE_METRICS.hit(function_name, tier_name, len(legacy_data))
+                record_artifact(key, args, kwargs, data, function_name, overwrite=True)
+                break
 
-        if only_load:
-            if not cf.exists(file_name):
+        if data is None:
+            if only_load:
+                CACHE_METRICS.add(function_name, misses=1)
                 return None
 
-        if cache_verbose:
-            print(f"LAZYCLOUD: Loading result {file_name} from cloud...")
-        loaded_result = loader(cf.get(file_name))
+            # if another worker is already computing this, wait for its result
+            if not force_recompute:
+                data, tier_name, lease = tiered_cache.acquire(
+                    key, verbose=cache_verbose
+                )
+                if data is not None:
+                    CACHE_METRICS.add(function_name, waits=1)
+                    CACHE_METRICS.hit(function_name, tier_name, len(data))
+                    if cache_verbose:
+                        print(
+                            f"LAZYCLOUD: Loading result {file_name} from {tier_name}..."
+                        )
+
+        if data is None:
+            CACHE_METRICS.add(function_name, misses=1)
+            try:
+                currtime = time.perf_counter()
+                result = func(*args, **kwargs)
+                if save_func:
+                    result = save_func(result)
+                CACHE_METRICS.add(
+                    function_name, compute_seconds=time.perf_counter() - currtime
+                )
+
+                currtime = time.perf_counter()
+                data = serialize(
+                    result,
+                    save_format,
+                    compression=compression,
+                    compression_level=compression_level,
+                )
+                CACHE_METRICS.add(
+                    function_name,
+                    serialize_seconds=time.perf_counter() - currtime,
+                    bytes_written=len(data),
+                )
+                if cache_verbose:
+                    print(f"LAZYCLOUD: Writing {file_name} to cloud...")
+                tiered_cache.put(key, data)
+            finally:
+                if lease is not None:
+                    lease.release()
+            record_artifact(key, args, kwargs, data, function_name, overwrite=True)
+        elif tier_name == tiered_cache.tiers[-1].name:
+            record_artifact(key, args, kwargs, data, function_name, overwrite=False)
+
+        currtime = time.perf_counter()
+        loaded_result = deserialize(data, save_format)
         if load_func:
             loaded_result = load_func(loaded_result)
+        CACHE_METRICS.add(
+            function_name, deserialize_seconds=time.perf_counter() - currtime
+        )
 
         if verify:
             is_same = result == loaded_result
@@ -177,4 +341,12 @@ def lazycloud(
 
         return loaded_result
 
+    # how file names are built, so artifacts can be cataloged from their names
+    wrapper.cloud_bucket = cloud_bucket
+    wrapper.folder = folder
+    wrapper.file_suffix = file_suffix
+    wrapper.arg_names = [parameter_names[arg_key] for arg_key in arg_keys]
+    wrapper.kwarg_keys = list(kwarg_keys)
+    wrapper.optional_kwarg_defaults = optional_kwarg_defaults
+
     return wrapper
@@ -0,0 +1,307 @@
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+from pkg.constants import OUT_PATH
+
+from ..utils import get_level2_children
+
+SHARD_SUFFIXES = (
+    "supervoxel_ids",
+    "level2_ids",
+    "level2_order",
+    "level2_sorted",
+    "fetched",
+)
+
+DEFAULT_MAX_SHARDS = 16
+
+
+def _save_npy_atomic(path: Path, array: np.ndarray) -> None:
+    tmp_path = path.with_name(path.name + f".{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class SupervoxelLevel2Store:
+    """
+    Local, append-only store of the supervoxel -> level2 ID mapping.
+
+    Level2 IDs are immutable, so the supervoxels belonging to a level2 ID never need to
+    be fetched twice, and the mapping can be shared across neurons. The store is a set
+    of shards on disk, each holding `uint64` arrays of supervoxel IDs and level2 IDs
+    sorted by supervoxel ID, the order which sorts them by level2 ID instead (and the
+    level2 IDs in that order), and the sorted level2 IDs whose children it holds.
+    Shards are memory-mapped on load and queried with `np.searchsorted`, by supervoxel
+    or by level2 ID.
+
+    Note that a supervoxel belongs to a different level2 ID after every edit which
+    touched it, so a supervoxel may map to several level2 IDs in the store.
+
+    Every update writes a new shard, so to keep the number of shards each lookup goes
+    through bounded, once there are more than `max_shards` the smallest are merged.
+
+    Parameters
+    ----------
+    path :
+        Directory holding the shards. Created if it does not exist.
+    mmap :
+        Whether to memory-map the shards rather than reading them into memory.
+    max_shards :
+        Number of shards past which the smallest shards are merged into one on
+        `append`. If None, shards are only merged by `compact`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = OUT_PATH / "supervoxel_level2_store",
+        mmap: bool = True,
+        max_shards: Optional[int] = DEFAULT_MAX_SHARDS,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.mmap = mmap
+        self.max_shards = max_shards
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return (
+            f"SupervoxelLevel2Store(path={self.path}, shards={len(self._shards)}, "
+            f"supervoxels={len(self)}, level2_ids={len(self.fetched_level2_ids)})"
+        )
+
+    def __len__(self) -> int:
+        return sum(len(shard["supervoxel_ids"]) for shard in self._shards)
+
+    def _load_shard(self, name: str) -> dict:
+        mmap_mode = "r" if self.mmap else None
+        shard = {}
+        for suffix in SHARD_SUFFIXES:
+            shard[suffix] = np.load(
+                self.path / f"{name}.{suffix}.npy", mmap_mode=mmap_mode
+            )
+        return shard
+
+    def refresh(self) -> None:
+        """Reload the shards on disk, e.g. to pick up those written by other workers."""
+        # the fetched array is written last, so its presence marks a complete shard
+        names = sorted(
+            p.name[: -len(".fetched.npy")] for p in self.path.glob("*.fetched.npy")
+        )
+        self._shard_names = []
+        self._shards = []
+        for name in names:
+            try:
+                shard = self._load_shard(name)
+            except FileNotFoundError:
+                # merged away by another worker since the directory was listed
+                continue
+            self._shard_names.append(name)
+            self._shards.append(shard)
+
+    @property
+    def fetched_level2_ids(self) -> np.ndarray:
+        """Sorted level2 IDs whose supervoxels are in the store."""
+        if len(self._shards) == 0:
+            return np.empty(0, dtype=np.uint64)
+        return np.unique(np.concatenate([shard["fetched"] for shard in self._shards]))
+
+    def contains_level2_ids(self, level2_ids: ArrayLike) -> np.ndarray:
+        """Boolean mask of which `level2_ids` already have their supervoxels stored."""
+        level2_ids = np.asarray(level2_ids, dtype=np.uint64)
+        is_fetched = np.zeros(len(level2_ids), dtype=bool)
+        for shard in self._shards:
+            fetched = shard["fetched"]
+            if len(fetched) == 0:
+                continue
+            locs = np.searchsorted(fetched, level2_ids)
+            locs[locs == len(fetched)] = 0
+            is_fetched |= fetched[locs] == level2_ids
+        return is_fetched
+
+    def append(
+        self,
+        supervoxel_ids: ArrayLike,
+        level2_ids: ArrayLike,
+        fetched_level2_ids: ArrayLike,
+    ) -> None:
+        """
+        Write a new shard holding the `supervoxel_ids` -> `level2_ids` pairs.
+
+        `fetched_level2_ids` records which level2 IDs these pairs fully describe, which
+        may include level2 IDs with no supervoxels returned. If this brings the store
+        past `max_shards`, the smallest shards are then merged.
+        """
+        self._write_shard(supervoxel_ids, level2_ids, fetched_level2_ids)
+        if self.max_shards is not None and len(self._shards) > self.max_shards:
+            sizes = [len(shard["supervoxel_ids"]) for shard in self._shards]
+            n_merge = len(self._shards) - self.max_shards // 2
+            smallest = np.argsort(sizes, kind="stable")[:n_merge]
+            self._merge([self._shard_names[i] for i in smallest])
+
+    def _write_shard(
+        self,
+        supervoxel_ids: ArrayLike,
+        level2_ids: ArrayLike,
+        fetched_level2_ids: ArrayLike,
+    ) -> None:
+        supervoxel_ids = np.asarray(supervoxel_ids, dtype=np.uint64)
+        level2_ids = np.asarray(level2_ids, dtype=np.uint64)
+        fetched_level2_ids = np.unique(np.asarray(fetched_level2_ids, dtype=np.uint64))
+
+        order = np.lexsort((level2_ids, supervoxel_ids))
+        supervoxel_ids = supervoxel_ids[order]
+        level2_ids = level2_ids[order]
+        level2_order = np.argsort(level2_ids, kind="stable")
+        arrays = {
+            "supervoxel_ids": supervoxel_ids,
+            "level2_ids": level2_ids,
+            "level2_order": level2_order,
+            "level2_sorted": level2_ids[level2_order],
+            "fetched": fetched_level2_ids,
+        }
+
+        name = f"shard-{uuid.uuid4().hex}"
+        for suffix in SHARD_SUFFIXES:
+            _save_npy_atomic(self.path / f"{name}.{suffix}.npy", arrays[suffix])
+
+        self._shard_names.append(name)
+        self._shards.append(self._load_shard(name))
+
+    def update(self, level2_ids: ArrayLike, client, n_jobs: int = -1) -> int:
+        """
+        Fetch and store the supervoxels of any `level2_ids` not yet in the store.
+
+        Returns
+        -------
+        :
+            The number of level2 IDs which were fetched.
+        """
+        level2_ids = np.unique(np.asarray(level2_ids, dtype=np.uint64))
+        missing = level2_ids[~self.contains_level2_ids(level2_ids)]
+        if len(missing) == 0:
+            return 0
+        supervoxel_map = get_level2_children(missing, client, n_jobs=n_jobs)
+        self.append(supervoxel_map.index, supervoxel_map.values, missing)
+        return len(missing)
+
+    def lookup(self, supervoxel_ids: ArrayLike) -> pd.Series:
+        """
+        Find every stored level2 ID that each of `supervoxel_ids` belongs to.
+
+        Returns
+        -------
+        :
+            Series indexed by supervoxel ID with level2 IDs as values. Supervoxels
+            belonging to several level2 IDs appear once per level2 ID; those not in
+            the store do not appear.
+        """
+        supervoxel_ids = np.asarray(supervoxel_ids, dtype=np.uint64)
+        found_supervoxels = []
+        found_level2_ids = []
+        for shard in self._shards:
+            starts = np.searchsorted(shard["supervoxel_ids"], supervoxel_ids, "left")
+            stops = np.searchsorted(shard["supervoxel_ids"], supervoxel_ids, "right")
+            counts = stops - starts
+            if counts.sum() == 0:
+                continue
+            positions = _expand_ranges(starts, counts)
+            found_supervoxels.append(np.repeat(supervoxel_ids, counts))
+            found_level2_ids.append(np.asarray(shard["level2_ids"][positions]))
+        return _drop_duplicate_pairs(_to_series(found_supervoxels, found_level2_ids))
+
+    def get_map(self, level2_ids: ArrayLike) -> pd.Series:
+        """
+        Get the supervoxels belonging to each of `level2_ids`, from the store only.
+
+        Returns
+        -------
+        :
+            Series indexed by supervoxel ID with level2 IDs as values, ordered by the
+            position of the level2 ID in `level2_ids`.
+        """
+        level2_ids = pd.unique(np.asarray(level2_ids, dtype=np.uint64))
+        found_supervoxels = []
+        found_level2_ids = []
+        for shard in self._shards:
+            starts = np.searchsorted(shard["level2_sorted"], level2_ids, "left")
+            stops = np.searchsorted(shard["level2_sorted"], level2_ids, "right")
+            counts = stops - starts
+            if counts.sum() == 0:
+                continue
+            positions = np.asarray(
+                shard["level2_order"][_expand_ranges(starts, counts)]
+            )
+            found_supervoxels.append(np.asarray(shard["supervoxel_ids"][positions]))
+            found_level2_ids.append(np.repeat(level2_ids, counts))
+        supervoxel_map = _drop_duplicate_pairs(
+            _to_series(found_supervoxels, found_level2_ids)
+        )
+
+        order = np.argsort(
+            pd.Index(level2_ids).get_indexer(supervoxel_map.values.astype(np.uint64)),
+            kind="stable",
+        )
+        return supervoxel_map.iloc[order]
+
+    def compact(self) -> None:
+        """Merge all shards into one, dropping any duplicate pairs."""
+        self._merge(list(self._shard_names))
+
+    def _merge(self, names: list[str]) -> None:
+        if len(names) <= 1:
+            return
+        shards = [self._shards[self._shard_names.index(name)] for name in names]
+        supervoxel_ids = np.concatenate([shard["supervoxel_ids"] for shard in shards])
+        level2_ids = np.concatenate([shard["level2_ids"] for shard in shards])
+        order = np.lexsort((level2_ids, supervoxel_ids))
+        supervoxel_ids = supervoxel_ids[order]
+        level2_ids = level2_ids[order]
+        is_new = np.ones(len(order), dtype=bool)
+        is_new[1:] = (supervoxel_ids[1:] != supervoxel_ids[:-1]) | (
+            level2_ids[1:] != level2_ids[:-1]
+        )
+        fetched = np.concatenate([shard["fetched"] for shard in shards])
+
+        self._write_shard(supervoxel_ids[is_new], level2_ids[is_new], fetched)
+
+        for name in names:
+            index = self._shard_names.index(name)
+            del self._shard_names[index]
+            del self._shards[index]
+            # the fetched array goes first, so the shard stops counting as complete
+            for suffix in SHARD_SUFFIXES[::-1]:
+                (self.path / f"{name}.{suffix}.npy").unlink(missing_ok=True)
+
+
+def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # the positions covered by each range [start, start + count), one after another
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def _drop_duplicate_pairs(supervoxel_map: pd.Series) -> pd.Series:
+    # workers which fetched the same level2 IDs at once each wrote a shard of them
+    is_duplicate = pd.MultiIndex.from_arrays(
+        [supervoxel_map.index, supervoxel_map.values]
+    ).duplicated()
+    return supervoxel_map[~is_duplicate]
+
+
+def _to_series(supervoxel_chunks: list, level2_chunks: list) -> pd.Series:
+    if len(supervoxel_chunks) == 0:
+        supervoxel_ids = np.empty(0, dtype=np.int64)
+        level2_ids = np.empty(0, dtype=np.int64)
+    else:
+        supervoxel_ids = np.concatenate(supervoxel_chunks).astype(np.int64)
+        level2_ids = np.concatenate(level2_chunks).astype(np.int64)
+    supervoxel_map = pd.Series(data=level2_ids, index=supervoxel_ids)
+    supervoxel_map.index.name = "supervoxel_id"
+    supervoxel_map.name = "level2_id"
+    return supervoxel_map
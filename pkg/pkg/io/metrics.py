@@ -0,0 +1,115 @@
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+METRIC_NAMES = [
+    "calls",
+    "hits",
+    "misses",
+    "waits",
+    "compute_seconds",
+    "serialize_seconds",
+    "deserialize_seconds",
+    "bytes_read",
+    "bytes_written",
+]
+
+
+class CacheMetrics:
+    """
+    Registry of per-function counters for calls to `lazycloud`-decorated functions.
+
+    Counts hits (by the tier they were found in), misses, and waits on results being
+    computed elsewhere, and totals the time spent computing, serializing and
+    deserializing, and the bytes read from and written to the cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = defaultdict(lambda: defaultdict(float))
+
+    def __repr__(self) -> str:
+        return f"CacheMetrics(functions={list(self._metrics.keys())})"
+
+    def add(self, function: str, **metrics) -> None:
+        with self._lock:
+            function_metrics = self._metrics[function]
+            for name, value in metrics.items():
+                function_metrics[name] += value
+
+    def hit(self, function: str, tier_name: str, n_bytes: int) -> None:
+        self.add(function, hits=1, bytes_read=n_bytes, **{f"hits_{tier_name}": 1})
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns
+        -------
+        :
+            One row per function, one column per metric.
+        """
+        with self._lock:
+            metrics = {
+                function: dict(function_metrics)
+                for function, function_metrics in self._metrics.items()
+            }
+        table = pd.DataFrame.from_dict(metrics, orient="index")
+        columns = METRIC_NAMES + sorted(table.columns.difference(METRIC_NAMES))
+        table = table.reindex(columns=columns).fillna(0)
+        table.index.name = "function"
+        return table
+
+    def dump(self, path: Union[str, Path]) -> None:
+        """Write the metrics to `path`, as CSV if it ends in ".csv", otherwise JSON."""
+        path = Path(path)
+        table = self.to_frame()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".csv":
+            table.to_csv(path)
+        else:
+            with open(path, "w") as f:
+                json.dump(table.to_dict(orient="index"), f, indent=2)
+
+
+CACHE_METRICS = CacheMetrics()
+
+
+def get_cache_metrics(function: Optional[str] = None) -> pd.DataFrame:
+    """
+    Get the cache metrics of this process so far.
+
+    Parameters
+    ----------
+    function :
+        Name of a decorated function to get the metrics for. If None, get them for
+        every function.
+    """
+    table = CACHE_METRICS.to_frame()
+    if function is not None:
+        table = table.loc[[function]]
+    return table
+
+
+def reset_cache_metrics() -> None:
+    CACHE_METRICS.reset()
+
+
+def _dump_metrics_at_exit() -> None:
+    path = os.environ.get("LAZYCLOUD_METRICS_PATH")
+    if path:
+        # one file per process, since workers would otherwise overwrite each other
+        path = Path(path)
+        path = path.with_name(f"{path.stem}-{os.getpid()}{path.suffix}")
+        CACHE_METRICS.dump(path)
+
+
+atexit.register(_dump_metrics_at_exit)
@@ -0,0 +1,278 @@
+import gzip
+import io
+import json
+import pickle
+from typing import BinaryIO, Callable, Literal, Optional
+
+import numpy as np
+
+Compression = Literal["zstd", "brotli", "gzip"]
+
+# compressed artifacts start with this, followed by the compression and a newline;
+# uncompressed artifacts have no header, as before compression was an option
+HEADER_MAGIC = b"LAZYCLOUD\x00"
+
+STREAM_CHUNK_SIZE = 2**20
+
+
+class CustomJSONizer(json.JSONEncoder):
+    def default(self, obj):
+        return (
+            super().encode(bool(obj))
+            if isinstance(obj, np.bool_)
+            else super().default(obj)
+        )
+
+
+def _dump_pickle(obj, stream: BinaryIO) -> None:
+    pickle.dump(obj, stream)
+
+
+def _load_pickle(stream: BinaryIO):
+    return pickle.load(stream)
+
+
+def _dump_json(obj, stream: BinaryIO) -> None:
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8")
+    json.dump(obj, text_stream, cls=CustomJSONizer)
+    text_stream.flush()
+    text_stream.detach()
+
+
+def _load_json(stream: BinaryIO):
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8")
+    obj = json.load(text_stream)
+    text_stream.detach()
+    return obj
+
+
+def _dump_npz(obj: dict, stream: BinaryIO) -> None:
+    # zip archives need to seek back to write their directory, so build in memory
+    buffer = io.BytesIO()
+    np.savez(buffer, **obj)
+    stream.write(buffer.getbuffer())
+
+
+def _load_npz(stream: BinaryIO) -> dict:
+    # as above, zip archives need random access, which decompressors can't give
+    if not isinstance(stream, (io.BytesIO, _BufferReader)):
+        stream = io.BytesIO(stream.read())
+    with np.load(stream, allow_pickle=False) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+FORMATS = {
+    "pickle": (_dump_pickle, _load_pickle),
+    "json": (_dump_json, _load_json),
+    "npz": (_dump_npz, _load_npz),
+}
+
+
+class _BufferReader(io.BufferedIOBase):
+    # a seekable stream over a bytes-like object, which io.BytesIO would copy
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self._view)
+        data = self._view[self._position : self._position + size]
+        self._position += len(data)
+        return bytes(data)
+
+    read1 = read
+
+    def readinto(self, out) -> int:
+        data = self._view[self._position : self._position + len(out)]
+        out[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(end, self._position + size)
+        for start in range(self._position, end, STREAM_CHUNK_SIZE):
+            chunk = bytes(self._view[start : min(start + STREAM_CHUNK_SIZE, end)])
+            newline = chunk.find(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+        return self.read(end - self._position)
+
+
+class _BrotliWriter(io.RawIOBase):
+    def __init__(self, stream: BinaryIO, level: Optional[int] = None):
+        import brotlicffi
+
+        self._stream = stream
+        if level is None:
+            self._compressor = brotlicffi.Compressor()
+        else:
+            self._compressor = brotlicffi.Compressor(quality=level)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._stream.write(self._compressor.process(bytes(data)))
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stream.write(self._compressor.finish())
+        super().close()
+
+
+class _IncrementalReader(io.RawIOBase):
+    # streams through an incremental decompressor, raising like gzip does if the
+    # input runs out before the compressed data ends, e.g. for a truncated artifact
+    def __init__(
+        self,
+        stream: BinaryIO,
+        decompress: Callable[[bytes], bytes],
+        is_finished: Callable[[], bool],
+    ):
+        self._stream = stream
+        self._decompress = decompress
+        self._is_finished = is_finished
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, out) -> int:
+        while len(self._buffer) == 0:
+            chunk = self._stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                if not self._is_finished():
+                    raise EOFError(
+                        "Compressed file ended before the end-of-stream marker was "
+                        "reached"
+                    )
+                return 0
+            self._buffer = memoryview(self._decompress(chunk))
+        n = min(len(out), len(self._buffer))
+        out[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _compressed_writer(
+    stream: BinaryIO, compression: Compression, level: Optional[int]
+) -> BinaryIO:
+    if compression == "gzip":
+        return gzip.GzipFile(
+            fileobj=stream, mode="wb", compresslevel=9 if level is None else level
+        )
+    elif compression == "zstd":
+        import zstandard
+
+        if level is None:
+            compressor = zstandard.ZstdCompressor()
+        else:
+            compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.stream_writer(stream, closefd=False)
+    elif compression == "brotli":
+        return io.BufferedWriter(_BrotliWriter(stream, level), STREAM_CHUNK_SIZE)
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+
+def _decompressed_reader(stream: BinaryIO, compression: Compression) -> BinaryIO:
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    elif compression == "zstd":
+        import zstandard
+
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        reader = _IncrementalReader(
+            stream, decompressor.decompress, lambda: decompressor.eof
+        )
+    elif compression == "brotli":
+        import brotlicffi
+
+        decompressor = brotlicffi.Decompressor()
+        reader = _IncrementalReader(
+            stream, decompressor.process, decompressor.is_finished
+        )
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    return io.BufferedReader(reader, STREAM_CHUNK_SIZE)
+
+
+def serialize(
+    obj,
+    save_format: str,
+    compression: Optional[Compression] = None,
+    compression_level: Optional[int] = None,
+) -> memoryview:
+    """
+    Serialize `obj` in `save_format`, optionally compressed.
+
+    The object is streamed through the compressor, so the full uncompressed
+    serialization is never held in memory, and the buffer it was written to is
+    returned rather than copied. The compression used is recorded in a short header so
+    that `deserialize` can detect it.
+    """
+    dump, _ = FORMATS[save_format]
+    buffer = io.BytesIO()
+    if compression is None:
+        dump(obj, buffer)
+    else:
+        buffer.write(HEADER_MAGIC + compression.encode() + b"\n")
+        writer = _compressed_writer(buffer, compression, compression_level)
+        dump(obj, writer)
+        writer.close()
+    return buffer.getbuffer()
+
+
+def get_compression(data: bytes) -> Optional[Compression]:
+    """Get the compression an artifact made by `serialize` was written with."""
+    if bytes(data[: len(HEADER_MAGIC)]) != HEADER_MAGIC:
+        return None
+    stream = _BufferReader(data)
+    stream.seek(len(HEADER_MAGIC))
+    return stream.readline().strip().decode()
+
+
+def deserialize(data: bytes, save_format: str):
+    """
+    Deserialize an artifact made by `serialize`, detecting any compression.
+
+    Compressed artifacts are streamed through the decompressor rather than first
+    decompressed in full. Raises EOFError if a compressed artifact is truncated.
+    """
+    _, load = FORMATS[save_format]
+    if isinstance(data, bytes):
+        stream = io.BytesIO(data)
+    else:
+        stream = _BufferReader(data)
+    if bytes(data[: len(HEADER_MAGIC)]) == HEADER_MAGIC:
+        stream.seek(len(HEADER_MAGIC))
+        compression = stream.readline().strip().decode()
+        stream = _decompressed_reader(stream, compression)
+        obj = load(stream)
+        # loaders may stop short of the end of the stream, e.g. pickle's, which would
+        # skip the check that the compressed data is complete
+        stream.read()
+        return obj
+    return load(stream)
@@ -11,5 +11,6 @@ from .morphology import (
 from .synapses import (
     apply_synapses_to_meshwork,
     get_alltime_synapses,
-    map_synapse_level2_ids
+    map_synapse_level2_ids,
+    remap_level2_ids,
 )
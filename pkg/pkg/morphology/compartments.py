@@ -1,15 +1,19 @@
 # everything in this file stolen from Emily's skeleton_tools code
 
+from typing import TYPE_CHECKING
+
 import joblib
 import numpy as np
 import pandas as pd
 
 # import apical_classifier.apical_model_utils as amu
 # import pcg_skel
-from meshparty import meshwork
 
 from .morphology import get_soma_row
 
+if TYPE_CHECKING:
+    from meshparty import meshwork
+
 
 def unmasked_to_masked(nrn, inds):
     """
@@ -126,6 +130,8 @@ def make_node_labels(nrn, apical_labels=True):
 
 def apply_axon_label(nrn):
     # add simple axon/dendrite split based on synapse locations/synapse flow centrality
+    from meshparty import meshwork
+
     is_axon, split_quality = meshwork.algorithms.split_axon_by_annotation(
         nrn, "pre_syn", "post_syn"
     )
@@ -173,7 +179,7 @@ def label_unmasked_axon(nrn, axons_remaining_unmasked):
 
 
 def apply_compartments(
-    nrn: meshwork.Meshwork, root_id: int, client, mask_axon=True, apical_labels=True
+    nrn: "meshwork.Meshwork", root_id: int, client, mask_axon=True, apical_labels=True
 ):
     """
     Takes a neuron and adds annotations for what compartment type (e.g. axon/dendrite,
@@ -1,22 +1,24 @@
+from typing import TYPE_CHECKING
+
 import caveclient as cc
 import numpy as np
 import pandas as pd
 
 # import pcg_skel.skel_utils as sk_utils
-from meshparty import skeletonize, trimesh_io
-from meshparty.skeleton import Skeleton
-from navis import TreeNeuron
 from networkframe import NetworkFrame
 
 # from pcg_skel.chunk_tools import build_spatial_graph
-from sklearn.metrics import pairwise_distances_argmin
-
 from ..utils import get_nucleus_level2_id, get_nucleus_point_nm, get_positions
 
+if TYPE_CHECKING:
+    from meshparty.skeleton import Skeleton
+
 
 def skeletonize_networkframe(
     networkframe, client, nan_rounds=10, require_complete=False, soma_pt=None
 ):
+    from meshparty import skeletonize, trimesh_io
+
     cv = client.info.segmentation_cloudvolume()
 
     lvl2_eg = networkframe.edges[["source", "target"]].values.tolist()
@@ -46,7 +48,9 @@ def skeletonize_networkframe(
     return sk, mesh, l2dict_mesh, l2dict_r_mesh
 
 
-def skeleton_to_treeneuron(skeleton: Skeleton):
+def skeleton_to_treeneuron(skeleton: "Skeleton"):
+    from navis import TreeNeuron
+
     f = "tempskel.swc"
     skeleton.export_to_swc(f)
     swc = pd.read_csv(f, sep=" ", header=None)
@@ -84,6 +88,8 @@ def apply_nucleus(
     """annotate a point on the level2 graph as the nucleus; whatever is closest"""
 
     if positional:
+        from sklearn.metrics import pairwise_distances_argmin
+
         nuc_pt_nm = get_nucleus_point_nm(root_id, client, method="table")
 
         pos_nodes = nf.nodes[["x", "y", "z"]]
@@ -1,8 +1,10 @@
 import time
 
-
 import pandas as pd
 
+from ..utils import get_level2_children
+
+
 def get_alltime_synapses(
     root_id, client, synapse_table=None, remove_self=True, verbose=False
 ):
@@ -78,47 +80,114 @@ def get_alltime_synapses(
 
 
 def map_synapse_level2_ids(
-    synapses, level2_lineage_component_map, nodelist, side, client, verbose=False
+    synapses,
+    level2_lineage_component_map,
+    nodelist,
+    side,
+    client,
+    verbose=False,
+    supervoxel_store=None,
 ):
-    synapses[f"{side}_pt_current_level2_id"] = client.chunkedgraph.get_roots(
-        synapses[f"{side}_pt_supervoxel_id"], stop_layer=2
-    )
-    is_current = ~synapses[f"{side}_pt_current_level2_id"].isin(
-        level2_lineage_component_map
+    supervoxel_col = f"{side}_pt_supervoxel_id"
+    current_col = f"{side}_pt_current_level2_id"
+    level2_col = f"{side}_pt_level2_id"
+
+    synapses[current_col] = client.chunkedgraph.get_roots(
+        synapses[supervoxel_col], stop_layer=2
     )
+    is_current = ~synapses[current_col].isin(level2_lineage_component_map)
 
     if verbose:
         print(f"{len(is_current) - is_current.sum()} synapses are not current")
 
-    synapses[f"{side}_pt_level2_id"] = pd.Series(index=synapses.index, dtype="Int64")
-
-    synapses.loc[is_current, f"{side}_pt_level2_id"] = synapses.loc[
-        is_current, f"{side}_pt_current_level2_id"
+    synapses[level2_col] = pd.Series(index=synapses.index, dtype="Int64")
+
+    synapses.loc[is_current, level2_col] = synapses.loc[is_current, current_col]
+
+    not_current = synapses.loc[~is_current, [supervoxel_col, current_col]]
+    if len(not_current) > 0:
+        synapses.loc[~is_current, level2_col] = remap_level2_ids(
+            not_current[supervoxel_col],
+            not_current[current_col],
+            level2_lineage_component_map,
+            nodelist,
+            client,
+            supervoxel_store=supervoxel_store,
+        ).values
+
+    synapses[level2_col] = synapses[level2_col].astype(int)
+
+
+def remap_level2_ids(
+    supervoxel_ids: pd.Series,
+    current_level2_ids: pd.Series,
+    level2_lineage_component_map: pd.Series,
+    nodelist,
+    client,
+    supervoxel_store=None,
+) -> pd.Series:
+    """
+    Find the level2 node in `nodelist` holding each supervoxel, through its lineage.
+
+    The candidates for each supervoxel are the level2 IDs in `nodelist` in the same
+    lineage component as its current level2 ID. The children of every candidate are
+    looked up in one batch, from `supervoxel_store` if given. If several candidates
+    hold a supervoxel, the lowest level2 ID is used.
+
+    Returns
+    -------
+    :
+        Level2 ID for each supervoxel, with the index of `supervoxel_ids`.
+
+    Raises
+    ------
+    ValueError
+        If a supervoxel is in none of its candidates.
+    """
+    synapse_components = current_level2_ids.map(level2_lineage_component_map)
+    # the level2 IDs that could have held these supervoxels are the ones in the
+    # same lineage components, which were also part of the network at some point
+    candidates = level2_lineage_component_map[
+        level2_lineage_component_map.isin(synapse_components.dropna().unique())
     ]
+    candidates = candidates[candidates.index.isin(nodelist)]
+
+    # one batched lookup of the children of every candidate, rather than one
+    # request per synapse per candidate
+    if supervoxel_store is not None:
+        supervoxel_store.update(candidates.index, client)
+        candidate_supervoxels = supervoxel_store.get_map(candidates.index)
+    else:
+        candidate_supervoxels = get_level2_children(candidates.index, client)
+    candidate_table = pd.DataFrame(
+        {
+            "component": candidate_supervoxels.map(candidates).values,
+            "supervoxel": candidate_supervoxels.index,
+            "level2_id": candidate_supervoxels.values,
+        }
+    )
+    candidate_table = (
+        candidate_table.sort_values("level2_id", kind="stable")
+        .drop_duplicates(["component", "supervoxel"], keep="first")
+        .set_index(["component", "supervoxel"])["level2_id"]
+    )
 
-    for idx, row in synapses.query(f"{side}_pt_level2_id.isna()").iterrows():
-        supervoxel = row[f"{side}_pt_supervoxel_id"]
-        current_l2 = client.chunkedgraph.get_roots([supervoxel], stop_layer=2)[0]
-        component = level2_lineage_component_map[current_l2]
-        candidate_level2_ids = level2_lineage_component_map[
-            level2_lineage_component_map == component
-        ].index
-
-        candidate_level2_ids = candidate_level2_ids[candidate_level2_ids.isin(nodelist)]
-
-        winning_level2_id = None
-        for candidate_level2_id in candidate_level2_ids:
-            candidate_supervoxels = client.chunkedgraph.get_children(
-                candidate_level2_id
-            )
-            if supervoxel in candidate_supervoxels:
-                winning_level2_id = candidate_level2_id
-                synapses.loc[idx, f"{side}_pt_level2_id"] = winning_level2_id
-                break
-
-    assert synapses[f"{side}_pt_level2_id"].isna().sum() == 0
+    query_index = pd.MultiIndex.from_arrays(
+        [synapse_components.values, supervoxel_ids.values]
+    )
+    level2_ids = pd.Series(
+        candidate_table.reindex(query_index).values,
+        index=supervoxel_ids.index,
+        dtype="Int64",
+    )
 
-    synapses[f"{side}_pt_level2_id"] = synapses[f"{side}_pt_level2_id"].astype(int)
+    is_missing = level2_ids.isna()
+    if is_missing.any():
+        raise ValueError(
+            f"{is_missing.sum()} supervoxels are not in any level2 ID of their lineage "
+            f"in the network, e.g. {supervoxel_ids[is_missing].iloc[:5].tolist()}"
+        )
+    return level2_ids
 
 
 def apply_synapses_to_meshwork(meshwork, pre_synapses, post_synapses, overwrite=True):
@@ -133,4 +202,3 @@ def apply_synapses_to_meshwork(meshwork, pre_synapses, post_synapses, overwrite=
             overwrite=overwrite,
         )
     return meshwork
-
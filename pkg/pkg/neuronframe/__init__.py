@@ -1,12 +1,23 @@
 from .neuronframe import NeuronFrame
-from .process import load_neuronframe
+from .process import (
+    build_neuronframe,
+    extend_neuronframe,
+    load_neuronframe,
+    load_pruned_neuronframe,
+)
 from .sequence import NeuronFrameSequence
+from .shared import SharedNeuronFrame, publish_neuronframe
 from .utils import verify_neuron_matches_final
 
 
 __all__ = [
     "NeuronFrame",
     "load_neuronframe",
+    "load_pruned_neuronframe",
+    "build_neuronframe",
+    "extend_neuronframe",
     "verify_neuron_matches_final",
     "NeuronFrameSequence",
+    "SharedNeuronFrame",
+    "publish_neuronframe",
 ]
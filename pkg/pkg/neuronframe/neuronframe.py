@@ -1,13 +1,13 @@
 import random
-from typing import Literal, Optional, Self, Union
+from typing import TYPE_CHECKING, Literal, Optional, Self, Union
 
 import caveclient as cc
 import numpy as np
 import pandas as pd
-import pyvista as pv
 from networkframe import NetworkFrame
 
-from ..plot import set_up_camera
+if TYPE_CHECKING:
+    import pyvista as pv
 
 
 class NeuronFrame(NetworkFrame):
@@ -487,7 +487,9 @@ class NeuronFrame(NetworkFrame):
 
     def to_skeleton_polydata(
         self, label: Optional[str] = None, draw_lines: bool = True
-    ) -> pv.PolyData:
+    ) -> "pv.PolyData":
+        import pyvista as pv
+
         nodes = self.nodes
         edges = self.edges
 
@@ -505,7 +507,9 @@ class NeuronFrame(NetworkFrame):
 
         return skeleton
 
-    def to_merge_polydata(self, draw_edges=False, prefix="") -> pv.PolyData:
+    def to_merge_polydata(self, draw_edges=False, prefix="") -> "pv.PolyData":
+        import pyvista as pv
+
         if prefix == "meta":
             merge_ids = self.metaedits.query("has_merge").index
         else:
@@ -530,7 +534,9 @@ class NeuronFrame(NetworkFrame):
 
     def to_split_polydata(
         self, draw_edges=False, filter=None, prefix=""
-    ) -> pv.PolyData:
+    ) -> "pv.PolyData":
+        import pyvista as pv
+
         if prefix == "meta":
             edits = self.metaedits.query("~has_merge")
         else:
@@ -571,6 +577,10 @@ class NeuronFrame(NetworkFrame):
         scalar=None,
         cmap=None,
     ):
+        import pyvista as pv
+
+        from ..plot import set_up_camera
+
         if plotter is None:
             plotter = pv.Plotter()
         set_up_camera(plotter, self)
@@ -1,16 +1,23 @@
 # %%
 
+from typing import Optional
+
 import caveclient as cc
 import pandas as pd
+from networkframe import NetworkFrame
 
 from pkg.edits import (
     apply_edit_history,
     apply_synapses,
     collate_edit_info,
+    extend_edit_history,
+    extend_synapses,
     get_initial_network,
+    get_initial_node_ids,
     get_network_edits,
     get_network_metaedits,
     get_operation_metaoperation_map,
+    get_pruned_initial_network,
 )
 from pkg.io import lazycloud
 from pkg.morphology import (
@@ -18,7 +25,14 @@ from pkg.morphology import (
     apply_positions,
 )
 from pkg.neuronframe import NeuronFrame
-from pkg.utils import get_level2_nodes_edges
+from pkg.utils import get_level2_nodes_edges, get_positions
+
+EDIT_LABEL_COLUMNS = [
+    "operation_added",
+    "operation_removed",
+    "metaoperation_added",
+    "metaoperation_removed",
+]
 
 
 @lazycloud(
@@ -26,14 +40,107 @@ from pkg.utils import get_level2_nodes_edges
     folder="edit_neuronframes",
     file_suffix="neuronframe.pkl",
     arg_keys=[0],
+    compression="zstd",
 )
 def load_neuronframe(
     root_id: int,
     client: cc.CAVEclient,
     bounds_halfwidth: int = 20_000,
+    previous_root_id: Optional[int] = None,
     cache_verbose: bool = False,
     use_cache: bool = True,
     only_load: bool = False,
+) -> NeuronFrame:
+    """
+    Load (or build and cache) the NeuronFrame for `root_id`.
+
+    If `previous_root_id` is given and its NeuronFrame is cached, the NeuronFrame for
+    `root_id` is made by extending that one with the new edits (see
+    `extend_neuronframe`) rather than built from scratch.
+    """
+    previous_neuron = _load_previous_neuronframe(
+        load_neuronframe, previous_root_id, client, cache_verbose
+    )
+    if previous_neuron is not None:
+        return extend_neuronframe(
+            previous_neuron,
+            root_id,
+            client,
+            bounds_halfwidth=bounds_halfwidth,
+            cache_verbose=cache_verbose,
+            use_cache=use_cache,
+        )
+    return build_neuronframe(
+        root_id,
+        client,
+        bounds_halfwidth=bounds_halfwidth,
+        cache_verbose=cache_verbose,
+        use_cache=use_cache,
+    )
+
+
+@lazycloud(
+    cloud_bucket="allen-minnie-phase3",
+    folder="edit_neuronframes",
+    file_suffix="pruned_neuronframe.pkl",
+    arg_keys=[0],
+    compression="zstd",
+)
+def load_pruned_neuronframe(
+    root_id: int,
+    client: cc.CAVEclient,
+    bounds_halfwidth: int = 20_000,
+    previous_root_id: Optional[int] = None,
+    cache_verbose: bool = False,
+    use_cache: bool = True,
+    only_load: bool = False,
+) -> NeuronFrame:
+    """
+    Same as `load_neuronframe`, but with the initial network pruned to the parts
+    which are reachable through this neuron's edits. See
+    `pkg.edits.get_pruned_initial_network`.
+    """
+    previous_neuron = _load_previous_neuronframe(
+        load_pruned_neuronframe, previous_root_id, client, cache_verbose
+    )
+    if previous_neuron is not None:
+        return extend_neuronframe(
+            previous_neuron,
+            root_id,
+            client,
+            bounds_halfwidth=bounds_halfwidth,
+            prune_initial_network=True,
+            cache_verbose=cache_verbose,
+            use_cache=use_cache,
+        )
+    return build_neuronframe(
+        root_id,
+        client,
+        bounds_halfwidth=bounds_halfwidth,
+        prune_initial_network=True,
+        cache_verbose=cache_verbose,
+        use_cache=use_cache,
+    )
+
+
+def _load_previous_neuronframe(loader, previous_root_id, client, cache_verbose):
+    if previous_root_id is None:
+        return None
+    previous_neuron = loader(
+        previous_root_id, client, only_load=True, cache_verbose=cache_verbose
+    )
+    if previous_neuron is None:
+        print(f"No cached neuronframe for {previous_root_id}, building from scratch...")
+    return previous_neuron
+
+
+def build_neuronframe(
+    root_id: int,
+    client: cc.CAVEclient,
+    bounds_halfwidth: int = 20_000,
+    prune_initial_network: bool = False,
+    cache_verbose: bool = False,
+    use_cache: bool = True,
 ) -> NeuronFrame:
     print("Loading level 2 network edits...")
     networkdeltas_by_operation = get_network_edits(
@@ -60,10 +167,16 @@ def load_neuronframe(
     )
 
     print("Loading initial network state...")
-    # TODO this is super lazy and not optimized, just gets ALL of the initial states
-    # for any neuron related to this one, but doesn't check whether parts of that
-    # neuron can actually connect to this one.
-    nf = get_initial_network(root_id, client, positions=False)
+    # NOTE: unless pruning, this just gets ALL of the initial states for any neuron
+    # related to this one, but doesn't check whether parts of that neuron can actually
+    # connect to this one.
+    nf = get_initial_network(
+        root_id,
+        client,
+        positions=False,
+        prune=prune_initial_network,
+        networkdeltas_by_operation=networkdeltas_by_operation,
+    )
 
     # go through all of the edits/metaedits
     # add nodes that were added, but don't remove any nodes
@@ -98,6 +211,187 @@ def load_neuronframe(
         edits=edit_stats,
     )
 
+    check_neuronframe_final_state(full_neuron, root_id, client)
+
+    full_neuron.apply_edge_lengths(inplace=True)
+
+    return full_neuron
+
+
+def extend_neuronframe(
+    neuron: NeuronFrame,
+    root_id: int,
+    client: cc.CAVEclient,
+    bounds_halfwidth: int = 20_000,
+    prune_initial_network: bool = False,
+    cache_verbose: bool = False,
+    use_cache: bool = True,
+) -> NeuronFrame:
+    """
+    Bring a NeuronFrame built for an earlier root ID up to date with `root_id`.
+
+    Only the operations which are not already in `neuron.edits` are processed: their
+    network edits are computed (reusing the cached edits of the earlier root ID, see
+    `pkg.edits.get_network_edits`), their nodes and edges are appended to the frame,
+    their edit stats are collated, and only synapses new to `root_id` are mapped. The
+    result is checked against the final state of `root_id` as in `build_neuronframe`.
+
+    Parameters
+    ----------
+    neuron :
+        NeuronFrame for an ancestor of `root_id`, as made by `build_neuronframe`.
+    root_id :
+        Root ID to bring the NeuronFrame up to date with.
+    client :
+        CAVEclient instance.
+    bounds_halfwidth :
+        Must match the value used to build `neuron`.
+    prune_initial_network :
+        Must match the value used to build `neuron`.
+
+    Returns
+    -------
+    :
+        A new NeuronFrame for `root_id`; `neuron` is not modified.
+    """
+    print("Loading level 2 network edits...")
+    networkdeltas_by_operation = get_network_edits(
+        root_id,
+        client,
+        bounds_halfwidth=bounds_halfwidth,
+        incremental=True,
+        use_cache=use_cache,
+        cache_verbose=cache_verbose,
+    )
+    operation_ids = pd.Index(
+        list(networkdeltas_by_operation.keys()), name=neuron.edits.index.name
+    )
+
+    if not neuron.edits.index.isin(operation_ids).all():
+        raise ValueError(
+            f"Edits of neuron {neuron.neuron_id} are not all in the history of "
+            f"{root_id}, so it cannot be extended."
+        )
+
+    new_operation_ids = operation_ids.difference(neuron.edits.index, sort=False)
+    new_networkdeltas_by_operation = {
+        operation_id: networkdeltas_by_operation[operation_id]
+        for operation_id in new_operation_ids
+    }
+    print(f"Extending neuronframe with {len(new_operation_ids)} new operations...")
+
+    networkdeltas_by_metaoperation = get_network_metaedits(
+        networkdeltas_by_operation,
+        root_id,
+        client,
+        use_cache=use_cache,
+        cache_verbose=cache_verbose,
+    )
+    operation_to_metaoperation = get_operation_metaoperation_map(
+        networkdeltas_by_metaoperation
+    )
+
+    print("Collating edit info...")
+    edit_stats = neuron.edits.copy()
+    # some metadata can change as the neuron's history grows
+    for col in ["root_id", "is_filtered", "is_relevant"]:
+        if col in edit_stats.columns:
+            edit_stats[col] = [
+                networkdeltas_by_operation[operation_id].metadata[col]
+                for operation_id in edit_stats.index
+            ]
+    if len(new_operation_ids) > 0:
+        new_edit_stats, _, _ = collate_edit_info(
+            new_networkdeltas_by_operation, operation_to_metaoperation, root_id, client
+        )
+        edit_stats = pd.concat([edit_stats, new_edit_stats])
+    edit_stats = edit_stats.loc[operation_ids]
+    edit_stats["metaoperation_id"] = edit_stats.index.map(operation_to_metaoperation)
+
+    nf = NetworkFrame(neuron.nodes.copy(), neuron.edges.copy(), validate=False)
+    old_node_ids = nf.nodes.index
+
+    print("Loading new initial network state...")
+    if prune_initial_network:
+        initial_nf = get_pruned_initial_network(
+            root_id, networkdeltas_by_operation, client, positions=False
+        )
+    else:
+        new_original_node_ids = get_initial_node_ids(root_id, client).difference(
+            get_initial_node_ids(neuron.neuron_id, client)
+        )
+        if len(new_original_node_ids) > 0:
+            initial_nf = get_initial_network(
+                root_id,
+                client,
+                positions=False,
+                original_node_ids=new_original_node_ids,
+            )
+        else:
+            initial_nf = None
+    if initial_nf is not None:
+        initial_nodes = initial_nf.nodes.loc[
+            initial_nf.nodes.index.difference(nf.nodes.index)
+        ].copy()
+        initial_edges = initial_nf.edges.set_index(["source", "target"], drop=False)
+        initial_edges = initial_edges.loc[
+            initial_edges.index.difference(nf.edges.index)
+        ].copy()
+        for col in EDIT_LABEL_COLUMNS:
+            initial_nodes[col] = -1
+            initial_edges[col] = -1
+        nf.add_nodes(initial_nodes, inplace=True)
+        nf.add_edges(initial_edges, inplace=True)
+
+    print("Applying new edits to frame...")
+    extend_edit_history(nf, new_networkdeltas_by_operation, operation_to_metaoperation)
+
+    print("Applying positions...")
+    new_node_ids = nf.nodes.index.difference(old_node_ids)
+    if len(new_node_ids) > 0:
+        node_positions = get_positions(new_node_ids, client, skip=True)
+        for col in ["rep_coord_nm", "x", "y", "z"]:
+            nf.nodes.loc[new_node_ids, col] = node_positions[col].reindex(new_node_ids)
+
+    print("Applying synapses...")
+    pre_synapses, post_synapses = extend_synapses(
+        nf,
+        networkdeltas_by_operation,
+        root_id,
+        client,
+        neuron.pre_synapses,
+        neuron.post_synapses,
+        new_operation_ids=new_operation_ids,
+    )
+
+    print("Applying nucleus...")
+    nuc_level2_id = apply_nucleus(nf, root_id, client)
+
+    print("Creating full neuronframe...")
+    full_neuron = NeuronFrame(
+        nodes=nf.nodes,
+        edges=nf.edges,
+        nucleus_id=nuc_level2_id,
+        neuron_id=root_id,
+        pre_synapses=pre_synapses,
+        post_synapses=post_synapses,
+        edits=edit_stats,
+    )
+
+    check_neuronframe_final_state(full_neuron, root_id, client)
+
+    full_neuron.apply_edge_lengths(inplace=True)
+
+    return full_neuron
+
+
+def check_neuronframe_final_state(
+    full_neuron: NeuronFrame, root_id: int, client: cc.CAVEclient
+) -> None:
+    """
+    Raise a ValueError if applying all edits to `full_neuron` does not give the level 2
+    graph of `root_id`.
+    """
     print("Comparing to final neuron state...")
     edited_neuron = full_neuron.set_edits(
         full_neuron.edits.index, inplace=False
@@ -132,7 +426,3 @@ def load_neuronframe(
 
     if not check:
         raise ValueError("Edited neuron does not match final state.")
-
-    full_neuron.apply_edge_lengths(inplace=True)
-
-    return full_neuron
@@ -0,0 +1,118 @@
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+from .neuronframe import NeuronFrame
+
+
+def _default_shared_dir() -> str:
+    # a RAM-backed filesystem, where there is one, so nothing is written to disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedNeuronFrame:
+    """
+    Handle to a NeuronFrame published with `publish_neuronframe`.
+
+    The handle itself is tiny, so it can be passed to worker processes (e.g. through
+    `joblib.Parallel`) in place of the NeuronFrame, and each worker calls `attach` to
+    get the NeuronFrame back without copying its tables.
+
+    Use as a context manager, or call `unlink` when done, to delete the published
+    files.
+    """
+
+    def __init__(self, path: Union[str, Path], n_buffers: int):
+        self.path = Path(path)
+        self.n_buffers = n_buffers
+
+    def __repr__(self) -> str:
+        return f"SharedNeuronFrame(path={self.path}, n_buffers={self.n_buffers})"
+
+    def attach(self) -> NeuronFrame:
+        """
+        Get the published NeuronFrame.
+
+        The column data of its tables is memory-mapped from the published files
+        rather than read, so every process attached to it shares the same memory.
+        Mappings are copy-on-write: modifying the NeuronFrame is allowed, and only
+        copies the pages that are modified, privately to this process.
+        """
+        buffers = []
+        for i in range(self.n_buffers):
+            with open(self.path / f"{i}.buffer", "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # empty files can't be mapped
+                    buffers.append(bytearray())
+                else:
+                    buffers.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+        data = (self.path / "neuronframe.pkl").read_bytes()
+        return pickle.loads(data, buffers=buffers)
+
+    def unlink(self) -> None:
+        """Delete the published files; already attached NeuronFrames remain valid."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> "SharedNeuronFrame":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.unlink()
+
+
+def publish_neuronframe(
+    neuron: NeuronFrame, path: Optional[Union[str, Path]] = None
+) -> SharedNeuronFrame:
+    """
+    Publish a NeuronFrame so that worker processes can share one copy of it.
+
+    The NeuronFrame is pickled with its array data (the columns of its nodes, edges,
+    synapses and edits tables) written out of band, one file per array, so that
+    `SharedNeuronFrame.attach` can memory-map them. Columns holding Python objects
+    (e.g. lists or strings) are pickled as usual, and are copied into each process.
+
+    Parameters
+    ----------
+    neuron :
+        NeuronFrame to publish.
+    path :
+        Directory to publish in. If None, uses /dev/shm where available, so the
+        published NeuronFrame only lives in shared memory, and the temporary
+        directory otherwise.
+
+    Returns
+    -------
+    :
+        Handle to pass to workers in place of `neuron`.
+
+    Examples
+    --------
+    >>> def analyze(shared_neuron, i):
+    ...     neuron = shared_neuron.attach()
+    ...     ...
+    >>> with publish_neuronframe(neuron) as shared_neuron:
+    ...     results = Parallel(n_jobs=8)(
+    ...         delayed(analyze)(shared_neuron, i) for i in range(100)
+    ...     )
+    """
+    if path is None:
+        path = _default_shared_dir()
+    Path(path).mkdir(parents=True, exist_ok=True)
+    publish_path = Path(
+        tempfile.mkdtemp(prefix=f"neuronframe-{neuron.neuron_id}-", dir=path)
+    )
+
+    buffers = []
+    data = pickle.dumps(neuron, protocol=5, buffer_callback=buffers.append)
+    for i, buffer in enumerate(buffers):
+        with open(publish_path / f"{i}.buffer", "wb") as f:
+            f.write(buffer.raw())
+    (publish_path / "neuronframe.pkl").write_bytes(data)
+
+    return SharedNeuronFrame(publish_path, len(buffers))
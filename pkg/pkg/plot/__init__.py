@@ -1,9 +1,19 @@
-from .network import networkplot
-from .pyvista import animate_neuron_edit_sequence, set_up_camera
-from .save import savefig
-from .tree import hierarchy_pos, radial_hierarchy_pos, treeplot
-from .utils import clean_axis, rotate_set_labels
-from .context import set_context
+import importlib
+
+# plotting pulls in matplotlib, seaborn and pyvista, so each function's module is
+# only imported when the function is first used
+_LAZY_IMPORTS = {
+    "networkplot": ".network",
+    "animate_neuron_edit_sequence": ".pyvista",
+    "set_up_camera": ".pyvista",
+    "savefig": ".save",
+    "hierarchy_pos": ".tree",
+    "radial_hierarchy_pos": ".tree",
+    "treeplot": ".tree",
+    "clean_axis": ".utils",
+    "rotate_set_labels": ".utils",
+    "set_context": ".context",
+}
 
 __all__ = [
     "networkplot",
@@ -17,3 +27,16 @@ __all__ = [
     "set_up_camera",
     "set_context",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_IMPORTS.keys()))
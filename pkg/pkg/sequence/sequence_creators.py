@@ -1,11 +1,13 @@
 from typing import Literal, Optional, Union
 
 import numpy as np
+import pandas as pd
 from cloudfiles import CloudFiles
 from tqdm.auto import tqdm
 
 from ..io import lazycloud
 from ..neuronframe import NeuronFrame, NeuronFrameSequence
+from ..neuronframe.sequence import resolve_neuron
 
 
 @lazycloud(
@@ -14,6 +16,7 @@ from ..neuronframe import NeuronFrame, NeuronFrameSequence
     file_suffix="time_ordered_sequence.pkl",
     kwarg_keys=["root_id"],
     save_format="pickle",
+    compression="zstd",
 )
 def _create_time_ordered_sequence_dict(
     neuron: NeuronFrame,
@@ -32,8 +35,122 @@ def _create_time_ordered_sequence_dict(
     )
     neuron_sequence.edits.sort_values("time", inplace=True)
 
-    for i in tqdm(range(len(neuron_sequence.edits))):
-        operation_id = neuron_sequence.edits.index[i]
+    return _complete_time_ordered_sequence(neuron_sequence)
+
+
+@lazycloud(
+    cloud_bucket="allen-minnie-phase3",
+    folder="edit_sequences",
+    file_suffix="time_ordered_sequence.pkl",
+    kwarg_keys=["root_id"],
+    save_format="pickle",
+    compression="zstd",
+)
+def _extend_time_ordered_sequence_dict(
+    neuron: NeuronFrame,
+    previous_info: dict,
+    root_id: Optional[int] = None,
+    use_cache: bool = True,
+    cache_verbose: bool = False,
+    only_load: bool = False,
+) -> dict:
+    root_id
+    use_cache
+    cache_verbose
+    only_load
+
+    neuron_sequence = NeuronFrameSequence(
+        neuron,
+        prefix="",
+        edit_label_name="operation_id",
+        include_initial_state=False,
+    )
+    neuron_sequence.edits.sort_values("time", inplace=True)
+    edits = neuron_sequence.edits
+
+    previous_sequence_info = pd.DataFrame(previous_info["sequence_info"]).T
+    applied_edit_ids = pd.Index(previous_sequence_info.iloc[-1]["applied_edits"])
+    new_edits = edits.loc[~edits.index.isin(applied_edit_ids)]
+
+    # the previous steps are only still valid if the new edits all come after them
+    is_extendable = applied_edit_ids.isin(edits.index).all() and (
+        len(applied_edit_ids) == 0
+        or len(new_edits) == 0
+        or new_edits["time"].min() >= edits.loc[applied_edit_ids, "time"].max()
+    )
+    if is_extendable:
+        is_extendable = _previous_states_hold(
+            neuron, previous_sequence_info, new_edits.index
+        )
+    if not is_extendable:
+        print("Previous sequence does not hold for this neuron, recreating sequence...")
+        neuron_sequence = NeuronFrameSequence(
+            neuron, prefix="", edit_label_name="operation_id"
+        )
+        neuron_sequence.edits.sort_values("time", inplace=True)
+        return _complete_time_ordered_sequence(neuron_sequence)
+
+    for label, row in previous_sequence_info.iterrows():
+        neuron_sequence._sequence_info[label] = row.to_dict()
+    neuron_sequence.applied_edit_ids = applied_edit_ids
+
+    if len(new_edits) == 0:
+        return neuron_sequence.to_dict()
+
+    return _complete_time_ordered_sequence(neuron_sequence)
+
+
+def _previous_states_hold(
+    neuron: NeuronFrame, previous_sequence_info: pd.DataFrame, new_edit_ids: pd.Index
+) -> bool:
+    """
+    Check that the states in `previous_sequence_info` are still the states of `neuron`.
+
+    Synapses are mapped onto the level2 nodes which are current when a neuron is built,
+    so a newer neuron can have moved synapses of the previous states onto nodes added
+    by its new edits, or have gained synapses on older nodes. The first is checked for
+    every previous state, the second by replaying the last one.
+    """
+    new_node_ids = neuron.nodes.index[
+        neuron.nodes["operation_added"].isin(new_edit_ids)
+    ]
+    for synapses, mapping_col, previous_synapses in [
+        (
+            neuron.pre_synapses,
+            neuron.pre_synapse_mapping_col,
+            previous_sequence_info["pre_synapses"],
+        ),
+        (
+            neuron.post_synapses,
+            neuron.post_synapse_mapping_col,
+            previous_sequence_info["post_synapses"],
+        ),
+    ]:
+        if len(synapses) == 0:
+            continue
+        previous_synapse_ids = np.unique(
+            np.concatenate([np.empty(0, dtype=int)] + previous_synapses.tolist())
+        )
+        is_moved = synapses.index.isin(previous_synapse_ids) & synapses[
+            mapping_col
+        ].isin(new_node_ids)
+        if is_moved.any():
+            return False
+
+    last_state = previous_sequence_info.iloc[-1]
+    last_neuron = resolve_neuron(
+        neuron.set_edits(list(last_state["applied_edits"]), inplace=False), neuron
+    )
+    return (
+        set(last_neuron.pre_synapses.index) == set(last_state["pre_synapses"])
+        and set(last_neuron.post_synapses.index) == set(last_state["post_synapses"])
+        and len(last_neuron) == last_state["n_nodes"]
+    )
+
+
+def _complete_time_ordered_sequence(neuron_sequence: NeuronFrameSequence) -> dict:
+    unapplied_edit_ids = neuron_sequence.unapplied_edits.index
+    for operation_id in tqdm(unapplied_edit_ids):
         neuron_sequence.apply_edits(operation_id)
 
     if not neuron_sequence.is_completed:
@@ -45,17 +162,48 @@ def _create_time_ordered_sequence_dict(
 def create_time_ordered_sequence(
     neuron: NeuronFrame,
     root_id: Optional[int] = None,
+    previous_root_id: Optional[int] = None,
     use_cache: bool = True,
     cache_verbose: bool = False,
     only_load: bool = False,
 ) -> NeuronFrameSequence:
-    info = _create_time_ordered_sequence_dict(
-        neuron,
-        root_id=root_id,
-        use_cache=use_cache,
-        cache_verbose=cache_verbose,
-        only_load=only_load,
-    )
+    """
+    Create (or load) the sequence of states of `neuron` from applying its edits one
+    at a time, in time order.
+
+    If `previous_root_id` is given and the sequence for `root_id` is not cached yet,
+    the cached sequence for `previous_root_id` (if any) is extended with only the
+    steps for edits which are new in `neuron`, rather than replaying all of them.
+    """
+    info = None
+    if previous_root_id is not None and not only_load:
+        if use_cache:
+            info = _create_time_ordered_sequence_dict(
+                neuron, root_id=root_id, cache_verbose=cache_verbose, only_load=True
+            )
+        if info is None:
+            previous_info = _create_time_ordered_sequence_dict(
+                None,
+                root_id=previous_root_id,
+                cache_verbose=cache_verbose,
+                only_load=True,
+            )
+            if previous_info is not None:
+                info = _extend_time_ordered_sequence_dict(
+                    neuron,
+                    previous_info,
+                    root_id=root_id,
+                    use_cache=use_cache,
+                    cache_verbose=cache_verbose,
+                )
+    if info is None:
+        info = _create_time_ordered_sequence_dict(
+            neuron,
+            root_id=root_id,
+            use_cache=use_cache,
+            cache_verbose=cache_verbose,
+            only_load=only_load,
+        )
     if info is None:
         return None
     else:
@@ -68,6 +216,7 @@ def create_time_ordered_sequence(
     file_suffix="lumped_time_sequence.pkl",
     kwarg_keys=["root_id"],
     save_format="pickle",
+    compression="zstd",
 )
 def _create_lumped_time_sequence_dict(
     neuron: NeuronFrame,
@@ -122,6 +271,7 @@ def create_lumped_time_sequence(
     file_suffix="merge_and_clean_sequence.pkl",
     kwarg_keys=["root_id", "order_by", "random_seed"],
     save_format="pickle",
+    compression="zstd",
 )
 def _create_merge_and_clean_sequence_dict(
     neuron,
@@ -1,8 +1,11 @@
 from .client import start_client
+from .l2cache import L2AttributeStore, decode_l2_values, decode_l2data, get_l2data
 from .message import send_message
 from .wrangle import (
     find_closest_point,
     get_all_nodes_edges,
+    get_level2_children,
+    get_level2_chunk_bounds,
     get_level2_nodes_edges,
     get_nucleus_level2_id,
     get_nucleus_point_nm,
@@ -19,6 +22,8 @@ from .wrangle import (
 
 __all__ = [
     "get_all_nodes_edges",
+    "get_level2_children",
+    "get_level2_chunk_bounds",
     "get_level2_nodes_edges",
     "get_nucleus_point_nm",
     "get_positions",
@@ -34,4 +39,8 @@ __all__ = [
     "send_message",
     "start_client",
     "load_joint_table",
+    "L2AttributeStore",
+    "get_l2data",
+    "decode_l2data",
+    "decode_l2_values",
 ]
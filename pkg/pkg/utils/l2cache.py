@@ -0,0 +1,372 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from caveclient import CAVEclient
+from numpy.typing import ArrayLike
+
+from pkg.constants import OUT_PATH
+
+# how each l2cache attribute is laid out as typed columns in the store
+ATTRIBUTE_COLUMNS = {
+    "area_nm2": ["value"],
+    "max_dt_nm": ["value"],
+    "mean_dt_nm": ["value"],
+    "size_nm3": ["value"],
+    "rep_coord_nm": ["x", "y", "z"],
+    "pca": [f"pca_{i}" for i in range(9)],
+    "pca_val": [f"pca_val_{i}" for i in range(3)],
+}
+
+# sqlite limits the number of variables in a single statement
+QUERY_CHUNK_SIZE = 900
+
+
+def decode_l2_values(
+    values: Sequence, n_components: int = 1, dtype=np.float64
+) -> np.ndarray:
+    """
+    Decode the values of one l2cache attribute into a typed array.
+
+    Parameters
+    ----------
+    values :
+        Value of the attribute for each level2 ID, as returned by the l2cache: a
+        number for scalar attributes, or a (possibly nested) list for vector ones.
+        None, NaN or a value with the wrong number of components means missing.
+    n_components :
+        Number of components of the attribute, e.g. 3 for `rep_coord_nm` and 9 for
+        `pca`, which is flattened.
+    dtype :
+        Floating point type of the output.
+
+    Returns
+    -------
+    :
+        Array of shape (len(values), n_components), with NaN for missing values.
+    """
+    decoded = np.full((len(values), n_components), np.nan, dtype=dtype)
+    if len(values) == 0:
+        return decoded
+
+    if n_components == 1:
+        is_present = np.fromiter(
+            (v is not None and np.ndim(v) == 0 for v in values),
+            dtype=bool,
+            count=len(values),
+        )
+    else:
+        is_present = np.fromiter(
+            (isinstance(v, (list, tuple, np.ndarray)) for v in values),
+            dtype=bool,
+            count=len(values),
+        )
+    present = [v for v, p in zip(values, is_present) if p]
+    if len(present) == 0:
+        return decoded
+
+    try:
+        present = np.asarray(present, dtype=dtype).reshape(len(present), -1)
+    except ValueError:
+        # ragged values, e.g. some malformed ones; decode them one by one
+        present = None
+    if present is not None and present.shape[1] == n_components:
+        decoded[is_present] = present
+    else:
+        for i in np.flatnonzero(is_present):
+            value = np.asarray(values[i], dtype=dtype).ravel()
+            if len(value) == n_components:
+                decoded[i] = value
+    return decoded
+
+
+def decode_l2data(
+    l2data: Union[dict, pd.DataFrame], attributes: list[str], dtype=np.float64
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Decode l2cache attributes into one typed array per attribute.
+
+    Parameters
+    ----------
+    l2data :
+        Dictionary mapping level2 IDs to dictionaries of their attributes, as returned
+        by `get_l2data`, or a DataFrame of the same indexed by level2 ID.
+    attributes :
+        Attributes to decode. Attributes not in `l2data` are all NaN.
+    dtype :
+        Floating point type of the output.
+
+    Returns
+    -------
+    :
+        The level2 IDs, and for each attribute an array of its values with one row
+        per level2 ID and one column per component (see `ATTRIBUTE_COLUMNS`), with
+        NaN for missing values.
+    """
+    if isinstance(l2data, pd.DataFrame):
+        l2_ids = l2data.index.to_numpy().astype(np.int64)
+        values_by_attribute = {
+            attribute: l2data[attribute].tolist()
+            if attribute in l2data.columns
+            else [None] * len(l2data)
+            for attribute in attributes
+        }
+    else:
+        l2_ids = np.fromiter(
+            (int(l2_id) for l2_id in l2data.keys()), dtype=np.int64, count=len(l2data)
+        )
+        nodes = list(l2data.values())
+        values_by_attribute = {
+            attribute: [node.get(attribute) for node in nodes]
+            for attribute in attributes
+        }
+
+    decoded = {}
+    for attribute, values in values_by_attribute.items():
+        n_components = len(ATTRIBUTE_COLUMNS.get(attribute, ["value"]))
+        decoded[attribute] = decode_l2_values(values, n_components, dtype=dtype)
+    return l2_ids, decoded
+
+
+def _unpack_value(attribute: str, value) -> Optional[list]:
+    values = np.asarray(value, dtype=float).ravel()
+    if len(values) != len(ATTRIBUTE_COLUMNS[attribute]) or np.isnan(values).all():
+        return None
+    return values.tolist()
+
+
+def _pack_row(attribute: str, row: tuple):
+    if attribute == "rep_coord_nm" or attribute == "pca_val":
+        return list(row)
+    elif attribute == "pca":
+        return np.array(row).reshape(3, 3).tolist()
+    else:
+        return row[0]
+
+
+class L2AttributeStore:
+    """
+    Local on-disk cache of level2 attributes from the l2cache.
+
+    Level2 IDs are immutable, so once an attribute has been fetched for a level2 ID it
+    never needs to be fetched again, from any neuron or any run. Each attribute is a
+    SQLite table keyed by level2 ID, with vector attributes such as `rep_coord_nm` and
+    `pca` stored as typed numeric columns. Level2 IDs which the l2cache has no value of
+    an attribute for are recorded as missing, as a row of NULLs, so that they are not
+    requested again either.
+
+    Parameters
+    ----------
+    path :
+        Path to the SQLite database. Created if it does not exist.
+    timeout :
+        Seconds to wait on a lock held by another process writing to the store.
+    retry_missing :
+        Whether to request level2 IDs recorded as missing from the l2cache again, e.g.
+        if it may have computed their attributes since.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = OUT_PATH / "l2_attribute_store.sqlite",
+        timeout: float = 60.0,
+        retry_missing: bool = False,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.retry_missing = retry_missing
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for attribute, columns in ATTRIBUTE_COLUMNS.items():
+                column_defs = ", ".join(f"{column} REAL" for column in columns)
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {attribute} "
+                    f"(l2_id INTEGER PRIMARY KEY, {column_defs})"
+                )
+
+    def __repr__(self) -> str:
+        return f"L2AttributeStore(path={self.path})"
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _select(
+        self, l2_ids: np.ndarray, attribute: str, columns: list[str], condition: str
+    ) -> list[tuple]:
+        select = ", ".join(["l2_id"] + columns)
+        rows = []
+        with closing(self._connect()) as conn:
+            for i in range(0, len(l2_ids), QUERY_CHUNK_SIZE):
+                chunk = l2_ids[i : i + QUERY_CHUNK_SIZE].tolist()
+                placeholders = ", ".join("?" * len(chunk))
+                rows += conn.execute(
+                    f"SELECT {select} FROM {attribute} "
+                    f"WHERE l2_id IN ({placeholders}) AND {condition}",
+                    chunk,
+                ).fetchall()
+        return rows
+
+    def read(self, l2_ids: ArrayLike, attribute: str) -> pd.DataFrame:
+        """
+        Read the stored values of `attribute` for `l2_ids`.
+
+        Returns
+        -------
+        :
+            DataFrame indexed by level2 ID with one float column per component of the
+            attribute. Level2 IDs not in the store, or recorded as missing, do not
+            appear.
+        """
+        columns = ATTRIBUTE_COLUMNS[attribute]
+        l2_ids = np.unique(np.asarray(l2_ids, dtype=np.int64))
+        is_present = " OR ".join(f"{column} IS NOT NULL" for column in columns)
+        rows = self._select(l2_ids, attribute, columns, f"({is_present})")
+
+        data = pd.DataFrame(rows, columns=["l2_id"] + columns)
+        data = data.set_index("l2_id").astype(float)
+        data.index = data.index.astype(np.int64)
+        return data
+
+    def read_missing(self, l2_ids: ArrayLike, attribute: str) -> np.ndarray:
+        """Return those of `l2_ids` recorded as having no value of `attribute`."""
+        columns = ATTRIBUTE_COLUMNS[attribute]
+        l2_ids = np.unique(np.asarray(l2_ids, dtype=np.int64))
+        is_missing = " AND ".join(f"{column} IS NULL" for column in columns)
+        rows = self._select(l2_ids, attribute, [], f"({is_missing})")
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def write(
+        self,
+        l2data: dict,
+        attributes: list[str],
+        l2_ids: Optional[ArrayLike] = None,
+    ) -> None:
+        """
+        Store the l2cache-formatted `l2data` for any of `attributes` present.
+
+        Those of `l2_ids` with no value of an attribute in `l2data` are recorded as
+        missing it, unless a value for them is already stored.
+        """
+        if l2_ids is None:
+            l2_ids = []
+        l2_ids = np.unique(np.asarray(l2_ids, dtype=np.int64))
+        with closing(self._connect()) as conn, conn:
+            for attribute in attributes:
+                if attribute not in ATTRIBUTE_COLUMNS:
+                    continue
+                n_columns = len(ATTRIBUTE_COLUMNS[attribute])
+                rows = []
+                missing_rows = []
+                for l2_id in l2_ids:
+                    node_data = l2data.get(str(l2_id), {})
+                    if attribute not in node_data:
+                        missing_rows.append([int(l2_id)] + [None] * n_columns)
+                for l2_id, node_data in l2data.items():
+                    if attribute not in node_data:
+                        continue
+                    values = _unpack_value(attribute, node_data[attribute])
+                    if values is not None:
+                        rows.append([int(l2_id)] + values)
+                    else:
+                        missing_rows.append([int(l2_id)] + [None] * n_columns)
+                placeholders = ", ".join("?" * (n_columns + 1))
+                if len(rows) > 0:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO {attribute} VALUES ({placeholders})",
+                        rows,
+                    )
+                if len(missing_rows) > 0:
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO {attribute} VALUES ({placeholders})",
+                        missing_rows,
+                    )
+
+    def get_l2data(
+        self, l2_ids: ArrayLike, client: CAVEclient, attributes: list[str]
+    ) -> dict:
+        """
+        Drop-in for `client.l2cache.get_l2data` which consults the store first.
+
+        Only the level2 IDs missing some stored attribute are requested from the
+        l2cache, in one batch, and the results are written back to the store. Level2
+        IDs recorded as missing an attribute are not requested again, unless
+        `retry_missing`, and do not have it in the output. Attributes with no column
+        layout in `ATTRIBUTE_COLUMNS` bypass the store.
+
+        Returns
+        -------
+        :
+            Dictionary mapping each level2 ID (as a string) to a dictionary of its
+            attributes, in the same format as the l2cache.
+        """
+        l2_ids = np.unique(np.asarray(l2_ids, dtype=np.int64))
+        l2data = {str(l2_id): {} for l2_id in l2_ids}
+
+        stored_attributes = [a for a in attributes if a in ATTRIBUTE_COLUMNS]
+        unstored_attributes = [a for a in attributes if a not in ATTRIBUTE_COLUMNS]
+
+        is_missing = np.zeros(len(l2_ids), dtype=bool)
+        for attribute in stored_attributes:
+            data = self.read(l2_ids, attribute)
+            known_ids = data.index.to_numpy()
+            if not self.retry_missing:
+                known_ids = np.union1d(known_ids, self.read_missing(l2_ids, attribute))
+            is_missing |= ~np.isin(l2_ids, known_ids)
+            for l2_id, row in zip(data.index, data.itertuples(index=False)):
+                l2data[str(l2_id)][attribute] = _pack_row(attribute, row)
+
+        if len(unstored_attributes) > 0:
+            fetch_ids = l2_ids
+        else:
+            fetch_ids = l2_ids[is_missing]
+
+        if len(fetch_ids) > 0:
+            fetched = client.l2cache.get_l2data(
+                fetch_ids.tolist(), attributes=attributes
+            )
+            self.write(fetched, stored_attributes, l2_ids=fetch_ids)
+            for l2_id, node_data in fetched.items():
+                # prefer what was already in the store
+                l2data[str(l2_id)] = {**node_data, **l2data.get(str(l2_id), {})}
+
+        return l2data
+
+
+_DEFAULT_STORE = None
+
+
+def get_default_l2_store() -> L2AttributeStore:
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        _DEFAULT_STORE = L2AttributeStore()
+    return _DEFAULT_STORE
+
+
+def get_l2data(
+    l2_ids: ArrayLike,
+    client: CAVEclient,
+    attributes: list[str],
+    store: Optional[L2AttributeStore] = None,
+) -> dict:
+    """
+    Get level2 attributes, consulting the local `L2AttributeStore` before the l2cache.
+
+    Parameters
+    ----------
+    l2_ids :
+        Level2 IDs to get attributes for.
+    client :
+        CAVEclient instance.
+    attributes :
+        l2cache attributes to get.
+    store :
+        Store to use; if None, uses the default store under `OUT_PATH`.
+    """
+    if store is None:
+        store = get_default_l2_store()
+    return store.get_l2data(l2_ids, client, attributes)
@@ -5,10 +5,12 @@ from time import sleep
 import numpy as np
 import pandas as pd
 from caveclient import CAVEclient
-from sklearn.metrics import pairwise_distances_argmin
+from joblib import Parallel, delayed
 
 from pkg.constants import DATA_PATH, MTYPES_TABLE, NUCLEUS_TABLE, OUT_PATH
 
+from .l2cache import decode_l2_values, get_l2data
+
 
 def get_positions(
     nodelist, client: CAVEclient, n_retries=1, retry_delay=20, skip=False
@@ -35,7 +37,7 @@ def get_positions(
             )
         nodes = pd.concat(nodes, axis=0)
         return nodes
-    l2stats = client.l2cache.get_l2data(nodelist, attributes=["rep_coord_nm"])
+    l2stats = get_l2data(nodelist, client, attributes=["rep_coord_nm"])
     nodes = pd.DataFrame(l2stats).T
     if "rep_coord_nm" not in nodes.columns:
         nodes["rep_coord_nm"] = np.nan
@@ -71,6 +73,82 @@ def get_positions(
     return nodes
 
 
+def get_level2_children(level2_ids, client: CAVEclient, n_jobs=-1) -> pd.Series:
+    """Get the supervoxels belonging to each of a set of level2 IDs.
+
+    The chunkedgraph only exposes children one node at a time, so the requests are
+    made concurrently, once per unique level2 ID.
+
+    Parameters
+    ----------
+    level2_ids :
+        Level2 IDs to look up.
+    client :
+        CAVEclient instance.
+    n_jobs :
+        Number of concurrent requests to make.
+
+    Returns
+    -------
+    :
+        Series indexed by supervoxel ID, with the level2 ID it belongs to as values,
+        in the order that `level2_ids` were passed in.
+    """
+    level2_ids = pd.unique(np.asarray(level2_ids, dtype=np.int64))
+    if len(level2_ids) == 0:
+        return pd.Series(index=pd.Index([], dtype=np.int64), dtype=np.int64)
+
+    children = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(client.chunkedgraph.get_children)(level2_id) for level2_id in level2_ids
+    )
+    counts = [len(supervoxels) for supervoxels in children]
+    supervoxel_map = pd.Series(
+        data=np.repeat(level2_ids, counts),
+        index=np.concatenate(children).astype(np.int64),
+    )
+    supervoxel_map.index.name = "supervoxel_id"
+    supervoxel_map.name = "level2_id"
+    return supervoxel_map
+
+
+def get_level2_chunk_bounds(level2_ids, client: CAVEclient) -> np.ndarray:
+    """Get the bounding box of the chunk each of a set of level2 IDs lives in.
+
+    The chunk position is encoded in the bits of every chunkedgraph node ID, so this
+    only needs the (cached) segmentation info rather than a request per node.
+
+    Parameters
+    ----------
+    level2_ids :
+        Level2 IDs to look up.
+    client :
+        CAVEclient instance.
+
+    Returns
+    -------
+    :
+        Array of shape (n, 3, 2) holding the (x, y, z) x (start, stop) bounds of each
+        chunk in chunkedgraph coordinates, in the same format as `bounds` for
+        `client.chunkedgraph.level2_chunk_graph`.
+    """
+    info = client.chunkedgraph.segmentation_info
+    graph_info = info["graph"]
+    chunk_size = np.array(graph_info["chunk_size"], dtype=np.int64)
+    voxel_offset = np.array(info["scales"][0].get("voxel_offset", [0, 0, 0]))
+    n_bits_layer = graph_info.get("n_bits_for_layer_id", 8)
+    n_bits_dim = graph_info["spatial_bit_masks"]["2"]
+
+    level2_ids = np.asarray(level2_ids, dtype=np.uint64)
+    mask = np.uint64((1 << n_bits_dim) - 1)
+    chunk_coords = np.empty((len(level2_ids), 3), dtype=np.int64)
+    for i in range(3):
+        shift = np.uint64(64 - n_bits_layer - (i + 1) * n_bits_dim)
+        chunk_coords[:, i] = (level2_ids >> shift) & mask
+
+    starts = voxel_offset + chunk_coords * chunk_size
+    return np.stack([starts, starts + chunk_size], axis=-1)
+
+
 def get_level2_nodes_edges(
     root_id: int, client: CAVEclient, positions=True, bounds=None
 ):
@@ -127,55 +205,10 @@ def get_skeleton_nodes_edges(root_id: int, client: CAVEclient):
     return skeleton_nodes, skeleton_edges
 
 
-def pt_to_xyz(pts):
-    # name = pts.name
-    # idx_name = pts.index.name
-    # if idx_name is None:
-    #     idx_name = "index"
-    # positions = pts.explode().reset_index()
-
-    # def to_xyz(order):
-    #     if order % 3 == 0:
-    #         return "x"
-    #     elif order % 3 == 1:
-    #         return "y"
-    #     else:
-    #         return "z"
-
-    # positions["axis"] = positions.index.map(to_xyz)
-    # positions = positions.pivot(index=idx_name, columns="axis", values=name)
-
-    positions = pd.DataFrame(index=pts.index)
-
-    if not isinstance(pts.iloc[0], (list, np.ndarray, tuple)):
-        positions["x"] = np.nan
-        positions["y"] = np.nan
-        positions["z"] = np.nan
-        return positions
-
-    def x_mapper(x):
-        if isinstance(x, list):
-            return x[0]
-        else:
-            return np.nan
-
-    def y_mapper(y):
-        if isinstance(y, list):
-            return y[1]
-        else:
-            return np.nan
-
-    def z_mapper(z):
-        if isinstance(z, list):
-            return z[2]
-        else:
-            return np.nan
-
-    positions["x"] = pts.apply(x_mapper)
-    positions["y"] = pts.apply(y_mapper)
-    positions["z"] = pts.apply(z_mapper)
-
-    return positions
+def pt_to_xyz(pts: pd.Series) -> pd.DataFrame:
+    """Split a series of [x, y, z] points into x, y and z columns, NaN where missing."""
+    positions = decode_l2_values(pts.tolist(), n_components=3, dtype=float)
+    return pd.DataFrame(positions, index=pts.index, columns=["x", "y", "z"])
 
 
 def get_all_nodes_edges(root_ids, client: CAVEclient, positions=False, bounds=None):
@@ -224,8 +257,8 @@ def get_nucleus_point_nm(root_id: int, client: CAVEclient, method="table"):
         current_nuc_level2 = client.chunkedgraph.get_roots(
             [nuc_supervoxel], stop_layer=2
         )[0]
-        nuc_pt_nm = client.l2cache.get_l2data(
-            [current_nuc_level2], attributes=["rep_coord_nm"]
+        nuc_pt_nm = get_l2data(
+            [current_nuc_level2], client, attributes=["rep_coord_nm"]
         )[str(current_nuc_level2)]["rep_coord_nm"]
         nuc_pt_nm = np.array(nuc_pt_nm)
     elif method == "table":
@@ -235,6 +268,8 @@ def get_nucleus_point_nm(root_id: int, client: CAVEclient, method="table"):
 
 
 def find_closest_point(df, point):
+    from sklearn.metrics import pairwise_distances_argmin
+
     if not isinstance(point, np.ndarray):
         point = np.array(point)
     X = df.loc[:, ["x", "y", "z"]].values
@@ -1,8 +1,23 @@
+from .pipeline import (
+    enqueue_pipeline,
+    find_completed_roots,
+    poll_pipeline_queue,
+    run_pipeline,
+    run_root_pipelines,
+)
+from .session import (
+    NeuronSession,
+    SequenceScheme,
+    get_sequence_schemes,
+    run_neuron_session,
+    run_neuron_sessions,
+)
 from .workers import (
     create_neuronframe,
     create_sequences,
     extract_edit_info,
     extract_initial_network,
+    get_worker_client,
 )
 
 __all__ = [
@@ -10,4 +25,15 @@ __all__ = [
     "extract_initial_network",
     "create_sequences",
     "create_neuronframe",
+    "get_worker_client",
+    "run_pipeline",
+    "enqueue_pipeline",
+    "poll_pipeline_queue",
+    "run_root_pipelines",
+    "find_completed_roots",
+    "NeuronSession",
+    "SequenceScheme",
+    "get_sequence_schemes",
+    "run_neuron_session",
+    "run_neuron_sessions",
 ]
@@ -0,0 +1,333 @@
+import os
+import time
+import traceback
+from functools import partial
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Union
+
+from joblib import Parallel, delayed
+from taskqueue import TaskQueue, queueable
+
+from pkg.constants import OUT_PATH
+from pkg.edits import get_network_edits, get_network_metaedits
+from pkg.io import ArtifactCatalog, get_default_catalog
+from pkg.neuronframe import load_neuronframe
+
+from .workers import _create_sequences, get_sequence_seeds, get_worker_client
+
+
+class PipelineStage(NamedTuple):
+    """
+    A step of the per-neuron pipeline.
+
+    Attributes
+    ----------
+    name :
+        Name of the stage.
+    run :
+        Function of (root_id, client) which computes and caches the stage's
+        artifacts.
+    depends_on :
+        Names of the stages which must be run first.
+    artifacts :
+        Function of root_id giving the artifacts the stage makes, as (file_suffix,
+        key parameters) pairs, which are looked up in the artifact catalog to skip
+        stages which are already done.
+    """
+
+    name: str
+    run: Callable
+    depends_on: tuple
+    artifacts: Callable
+
+
+def _run_edits(root_id, client):
+    networkdeltas_by_operation = get_network_edits(root_id, client)
+    get_network_metaedits(networkdeltas_by_operation, root_id, client)
+
+
+def _run_neuronframe(root_id, client):
+    load_neuronframe(root_id, client)
+
+
+def _sequence_artifacts(root_id) -> list:
+    artifacts = [
+        ("time_ordered_sequence.pkl", {}),
+        ("merge_and_clean_sequence.pkl", {"order_by": "time"}),
+    ]
+    for seed in get_sequence_seeds():
+        artifacts.append(
+            (
+                "merge_and_clean_sequence.pkl",
+                {"order_by": "random", "random_seed": seed},
+            )
+        )
+    return artifacts
+
+
+STAGES = {
+    "edits": PipelineStage(
+        name="edits",
+        run=_run_edits,
+        depends_on=(),
+        artifacts=lambda root_id: [
+            ("operations.npz", {}),
+            ("meta_operations.npz", {}),
+        ],
+    ),
+    "neuronframe": PipelineStage(
+        name="neuronframe",
+        run=_run_neuronframe,
+        depends_on=("edits",),
+        artifacts=lambda root_id: [("neuronframe.pkl", {})],
+    ),
+    "sequences": PipelineStage(
+        name="sequences",
+        run=_create_sequences,
+        depends_on=("neuronframe",),
+        artifacts=_sequence_artifacts,
+    ),
+}
+
+
+def _resolve_stages(stages: list[str]) -> list[PipelineStage]:
+    # the stages with all of their dependencies, each after what it depends on
+    resolved = []
+
+    def visit(name):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}")
+        if STAGES[name] in resolved:
+            return
+        for dependency in STAGES[name].depends_on:
+            visit(dependency)
+        resolved.append(STAGES[name])
+
+    for name in stages:
+        visit(name)
+    return resolved
+
+
+def find_completed_roots(
+    stage: Union[str, PipelineStage],
+    root_ids: list,
+    catalog: Optional[ArtifactCatalog] = None,
+) -> set:
+    """
+    Find which of `root_ids` already have every artifact of `stage` in the catalog.
+
+    Parameters
+    ----------
+    stage :
+        Stage, or the name of one in `STAGES`.
+    root_ids :
+        Root IDs to check.
+    catalog :
+        Catalog to look the artifacts up in. If None, uses `get_default_catalog`; if
+        that is turned off, no root IDs are completed.
+    """
+    if isinstance(stage, str):
+        stage = STAGES[stage]
+    if catalog is None:
+        catalog = get_default_catalog()
+    if catalog is None:
+        return set()
+
+    # artifacts of the same kind are looked up for all root IDs at once
+    root_ids = [int(root_id) for root_id in root_ids]
+    root_ids_by_artifact = {}
+    for root_id in root_ids:
+        for file_suffix, params in stage.artifacts(root_id):
+            artifact = (file_suffix, tuple(sorted(params.items())))
+            root_ids_by_artifact.setdefault(artifact, []).append(root_id)
+
+    completed = set(root_ids)
+    for (file_suffix, params), artifact_root_ids in root_ids_by_artifact.items():
+        found = catalog.query(
+            file_suffix=file_suffix, root_id=artifact_root_ids, **dict(params)
+        )
+        if len(found) > 0:
+            found = set(found["root_id"].astype(int))
+        else:
+            found = set()
+        completed &= found | (set(root_ids) - set(artifact_root_ids))
+    return completed
+
+
+def run_root_pipelines(
+    root_ids: list,
+    stages: list[str] = list(STAGES.keys()),
+    client=None,
+    catalog: Optional[ArtifactCatalog] = None,
+    verbose: bool = True,
+) -> dict:
+    """
+    Run the pipeline stages for each of a batch of root IDs.
+
+    Stages are run in dependency order, stage by stage for the whole batch. Stages
+    whose artifacts are all in the catalog are skipped, and a root ID which fails a
+    stage is not run through the stages after it.
+
+    Parameters
+    ----------
+    root_ids :
+        Root IDs to run.
+    stages :
+        Names of the stages in `STAGES` to run; the stages they depend on are run
+        too.
+    client :
+        CAVEclient instance. If None, uses the one of this worker process.
+    catalog :
+        Catalog to look up completed stages in. If None, uses `get_default_catalog`.
+
+    Returns
+    -------
+    :
+        The stage each failed root ID failed at, and the error it raised.
+    """
+    if client is None:
+        client = get_worker_client()
+
+    failures = {}
+    for stage in _resolve_stages(stages):
+        remaining = [root_id for root_id in root_ids if root_id not in failures]
+        completed = find_completed_roots(stage, remaining, catalog=catalog)
+        for root_id in remaining:
+            if int(root_id) in completed:
+                continue
+            if verbose:
+                print(f"Running stage {stage.name} for root_id: {root_id}")
+            currtime = time.time()
+            try:
+                stage.run(root_id, client)
+            except Exception as e:
+                traceback.print_exc()
+                failures[root_id] = (stage.name, repr(e))
+                continue
+            if verbose:
+                print(
+                    f"{time.time() - currtime:.3f} seconds elapsed for stage "
+                    f"{stage.name} of root_id: {root_id}."
+                )
+    return failures
+
+
+@queueable
+def run_pipeline_batch(root_ids, stages, failure_log=None):
+    failures = run_root_pipelines(root_ids, stages)
+    if failure_log is not None and len(failures) > 0:
+        with open(failure_log, "a") as f:
+            for root_id, (stage, error) in failures.items():
+                f.write(f"{root_id}\t{stage}\t{error}\n")
+    return 1
+
+
+def _get_queue(queue_path: Union[str, Path]) -> TaskQueue:
+    return TaskQueue(f"fq://{Path(queue_path).absolute()}")
+
+
+def enqueue_pipeline(
+    root_ids: list,
+    queue_path: Union[str, Path] = OUT_PATH / "pipeline_queue",
+    stages: list[str] = list(STAGES.keys()),
+    batch_size: int = 8,
+) -> TaskQueue:
+    """
+    Insert batches of root IDs to run through the pipeline into a file-backed queue.
+
+    Parameters
+    ----------
+    root_ids :
+        Root IDs to run.
+    queue_path :
+        Directory holding the queue.
+    stages :
+        Names of the stages in `STAGES` to run.
+    batch_size :
+        Number of root IDs per task. Larger batches spend less time on the queue and
+        on looking up completed stages, smaller ones balance better over workers.
+    """
+    _resolve_stages(stages)
+    root_ids = [int(root_id) for root_id in root_ids]
+    failure_log = str(Path(queue_path).absolute() / "failures.tsv")
+    tq = _get_queue(queue_path)
+    tasks = (
+        partial(
+            run_pipeline_batch,
+            root_ids[i : i + batch_size],
+            list(stages),
+            failure_log=failure_log,
+        )
+        for i in range(0, len(root_ids), batch_size)
+    )
+    tq.insert(tasks)
+    return tq
+
+
+def poll_pipeline_queue(
+    queue_path: Union[str, Path] = OUT_PATH / "pipeline_queue",
+    lease_seconds: int = 3600,
+) -> int:
+    """
+    Run tasks from a pipeline queue until it is empty.
+
+    Returns
+    -------
+    :
+        The number of tasks run.
+    """
+    tq = _get_queue(queue_path)
+    return tq.poll(lease_seconds=lease_seconds, stop_fn=lambda: tq.is_empty())
+
+
+def run_pipeline(
+    root_ids: Optional[list] = None,
+    stages: list[str] = list(STAGES.keys()),
+    queue_path: Union[str, Path] = OUT_PATH / "pipeline_queue",
+    batch_size: int = 8,
+    n_workers: int = -1,
+    lease_seconds: int = 3600,
+):
+    """
+    Run the pipeline stages for many root IDs on this machine.
+
+    Root IDs are put in batches on a file-backed queue, which is then drained by
+    `n_workers` worker processes, each with its own CAVEclient. Stages whose
+    artifacts already exist are skipped (see `run_root_pipelines`), so an
+    interrupted run can simply be started again. Root IDs which fail are written to
+    "failures.tsv" in the queue directory.
+
+    Parameters
+    ----------
+    root_ids :
+        Root IDs to run. If None, only drains what is already on the queue, e.g. to
+        resume an interrupted run.
+    stages :
+        Names of the stages in `STAGES` to run; the stages they depend on are run
+        too.
+    queue_path :
+        Directory holding the queue.
+    batch_size :
+        Number of root IDs per task.
+    n_workers :
+        Number of worker processes. -1 uses one per CPU.
+    lease_seconds :
+        Seconds a task is leased to a worker before it is given to another one, in
+        case the first one died. Should be longer than a batch takes to run.
+
+    Returns
+    -------
+    :
+        The number of tasks run.
+    """
+    if root_ids is not None:
+        enqueue_pipeline(
+            root_ids, queue_path=queue_path, stages=stages, batch_size=batch_size
+        )
+    if n_workers == -1:
+        n_workers = os.cpu_count()
+    n_executed = Parallel(n_jobs=n_workers)(
+        delayed(poll_pipeline_queue)(queue_path, lease_seconds)
+        for _ in range(n_workers)
+    )
+    return sum(n_executed)
@@ -0,0 +1,317 @@
+import os
+import pickle
+import uuid
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from pkg.constants import OUT_PATH
+from pkg.neuronframe import (
+    NeuronFrame,
+    NeuronFrameSequence,
+    SharedNeuronFrame,
+    load_neuronframe,
+    publish_neuronframe,
+)
+from pkg.sequence import (
+    create_lumped_time_sequence,
+    create_merge_and_clean_sequence,
+    create_time_ordered_sequence,
+)
+
+from .workers import N_RANDOM_SEQUENCES, get_sequence_seeds, get_worker_client
+
+
+class SequenceScheme(NamedTuple):
+    """
+    How a neuron's edits are replayed into a sequence.
+
+    Attributes
+    ----------
+    scheme :
+        "historical" (edits in time order), "lumped-time" or "clean-and-merge".
+    order_by :
+        For "clean-and-merge", the order merges are applied in: "time" or "random".
+    random_seed :
+        For "clean-and-merge" ordered by "random", the seed of the order.
+    """
+
+    scheme: str
+    order_by: Optional[str] = None
+    random_seed: Optional[int] = None
+
+
+def get_sequence_schemes(
+    n_random_sequences: int = N_RANDOM_SEQUENCES, lumped_time: bool = False
+) -> list[SequenceScheme]:
+    """
+    Get the sequence schemes made for every neuron (see `create_sequences`).
+
+    Parameters
+    ----------
+    n_random_sequences :
+        Number of random-order clean-and-merge sequences.
+    lumped_time :
+        Whether to include the lumped-time sequence.
+    """
+    schemes = [SequenceScheme("historical")]
+    if lumped_time:
+        schemes.append(SequenceScheme("lumped-time"))
+    schemes.append(SequenceScheme("clean-and-merge", "time"))
+    for seed in get_sequence_seeds(n_random_sequences):
+        schemes.append(SequenceScheme("clean-and-merge", "random", seed))
+    return schemes
+
+
+class NeuronSession:
+    """
+    One neuron, loaded once and kept resident while every sequence scheme and metric
+    is run against it.
+
+    Parameters
+    ----------
+    root_id :
+        Root ID of the neuron.
+    client :
+        CAVEclient instance. If None, uses the one of this worker process.
+    neuron :
+        The NeuronFrame, if already loaded. If None, it is loaded on first use.
+    prepare :
+        Function called on the NeuronFrame once it is loaded, e.g. to annotate its
+        synapses in place, before any sequence is made from it.
+    """
+
+    def __init__(
+        self,
+        root_id: int,
+        client=None,
+        neuron: Optional[NeuronFrame] = None,
+        prepare: Optional[Callable[[NeuronFrame], None]] = None,
+    ):
+        self.root_id = root_id
+        self.client = client
+        self.prepare = prepare
+        self._neuron = neuron
+        if neuron is not None and prepare is not None:
+            prepare(neuron)
+
+    def __repr__(self) -> str:
+        return (
+            f"NeuronSession(root_id={self.root_id}, loaded={self._neuron is not None})"
+        )
+
+    @property
+    def neuron(self) -> NeuronFrame:
+        if self._neuron is None:
+            if self.client is None:
+                self.client = get_worker_client()
+            neuron = load_neuronframe(self.root_id, self.client)
+            if neuron is None or isinstance(neuron, str):
+                neuron = load_neuronframe(self.root_id, self.client, use_cache=False)
+            if self.prepare is not None:
+                self.prepare(neuron)
+            self._neuron = neuron
+        return self._neuron
+
+    def create_sequence(self, scheme: SequenceScheme) -> NeuronFrameSequence:
+        """Create (or load from the cache) the sequence of the neuron for `scheme`."""
+        if scheme.scheme == "historical":
+            return create_time_ordered_sequence(self.neuron, self.root_id)
+        elif scheme.scheme == "lumped-time":
+            return create_lumped_time_sequence(self.neuron, self.root_id)
+        elif scheme.scheme == "clean-and-merge":
+            random_seed = scheme.random_seed
+            if random_seed is not None:
+                # matches the cache keys of the sequences made by `create_sequences`
+                random_seed = np.int32(random_seed)
+            return create_merge_and_clean_sequence(
+                self.neuron,
+                self.root_id,
+                order_by=scheme.order_by,
+                random_seed=random_seed,
+            )
+        else:
+            raise ValueError(f"Scheme {scheme.scheme} not recognized.")
+
+    def _run_scheme(
+        self,
+        scheme: SequenceScheme,
+        metrics: dict[str, Callable],
+        select: Optional[Callable],
+    ) -> tuple[dict, pd.DataFrame]:
+        sequence = self.create_sequence(scheme)
+        if select is not None:
+            sequence = select(sequence, scheme)
+
+        features = {name: metric(sequence) for name, metric in metrics.items()}
+
+        info = sequence.sequence_info.drop(
+            ["pre_synapses", "post_synapses", "applied_edits"],
+            axis=1,
+            errors="ignore",
+        )
+        info["root_id"] = self.root_id
+        info["scheme"] = scheme.scheme
+        info["order_by"] = scheme.order_by
+        info["random_seed"] = scheme.random_seed
+        return features, info
+
+    def run(
+        self,
+        schemes: Optional[list[SequenceScheme]] = None,
+        metrics: dict[str, Callable] = {},
+        select: Optional[Callable] = None,
+        n_jobs: int = 1,
+    ) -> dict:
+        """
+        Create the sequence for each of `schemes` and compute `metrics` on each.
+
+        Sequences are made one at a time and dropped once their metrics are
+        computed, so only the neuron and one sequence are held at once (per worker,
+        if `n_jobs` is not 1).
+
+        Parameters
+        ----------
+        schemes :
+            Sequence schemes to run. If None, uses `get_sequence_schemes`.
+        metrics :
+            Functions of a `NeuronFrameSequence`, by name.
+        select :
+            Function of (sequence, scheme) giving the sequence to compute metrics on,
+            e.g. to select the states after each merge of "clean-and-merge"
+            sequences with `NeuronFrameSequence.select_by_bout`.
+        n_jobs :
+            Number of worker processes to run the schemes in. If not 1, the neuron is
+            published with `publish_neuronframe`, so that the workers share one copy
+            of it rather than each loading or being sent their own.
+
+        Returns
+        -------
+        :
+            Dictionary with "infos", the `sequence_info` of every sequence
+            concatenated, and "features", the result of each metric by (root_id,
+            scheme, order_by, random_seed).
+        """
+        if schemes is None:
+            schemes = get_sequence_schemes()
+
+        if n_jobs == 1:
+            results = [self._run_scheme(scheme, metrics, select) for scheme in schemes]
+        else:
+            with publish_neuronframe(self.neuron) as shared_neuron:
+                results = Parallel(n_jobs=n_jobs)(
+                    delayed(_run_shared_scheme)(
+                        shared_neuron, self.root_id, scheme, metrics, select
+                    )
+                    for scheme in schemes
+                )
+
+        infos = []
+        features = {}
+        for scheme, (sequence_features, info) in zip(schemes, results):
+            features[(self.root_id, *scheme)] = sequence_features
+            infos.append(info)
+
+        return {"infos": pd.concat(infos), "features": features}
+
+
+def _run_shared_scheme(
+    shared_neuron: SharedNeuronFrame,
+    root_id: int,
+    scheme: SequenceScheme,
+    metrics: dict[str, Callable],
+    select: Optional[Callable],
+) -> tuple[dict, pd.DataFrame]:
+    # the neuron was already prepared before it was published
+    session = NeuronSession(root_id, neuron=shared_neuron.attach())
+    return session._run_scheme(scheme, metrics, select)
+
+
+def write_session_outputs(outputs: dict, path: Union[str, Path]) -> None:
+    """Write the outputs of `NeuronSession.run` in one file, atomically."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + f".{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(outputs, f)
+    os.replace(tmp_path, path)
+
+
+def run_neuron_session(
+    root_id: int,
+    schemes: Optional[list[SequenceScheme]] = None,
+    metrics: dict[str, Callable] = {},
+    select: Optional[Callable] = None,
+    prepare: Optional[Callable[[NeuronFrame], None]] = None,
+    out_path: Optional[Union[str, Path]] = OUT_PATH / "sequence_metrics",
+    client=None,
+    recompute: bool = False,
+    scheme_n_jobs: int = 1,
+) -> Optional[dict]:
+    """
+    Run every sequence scheme and metric for one neuron, loading it only once.
+
+    Outputs are written to "{root_id}.pkl" in `out_path`, and are not recomputed if
+    that file exists unless `recompute`. The schemes are run in `scheme_n_jobs`
+    worker processes sharing the neuron (`n_jobs` of `NeuronSession.run`). See
+    `NeuronSession.run` for the other parameters.
+
+    Returns
+    -------
+    :
+        The outputs of `NeuronSession.run`, or None if they were already written.
+    """
+    if out_path is not None:
+        out_file = Path(out_path) / f"{root_id}.pkl"
+        if out_file.exists() and not recompute:
+            return None
+
+    session = NeuronSession(root_id, client=client, prepare=prepare)
+    outputs = session.run(
+        schemes=schemes, metrics=metrics, select=select, n_jobs=scheme_n_jobs
+    )
+    if out_path is not None:
+        write_session_outputs(outputs, out_file)
+    return outputs
+
+
+def run_neuron_sessions(
+    root_ids: list,
+    n_jobs: int = -1,
+    **kwargs,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run `run_neuron_session` for many neurons in parallel and collect the outputs.
+
+    Neurons whose outputs were already written are read back rather than recomputed.
+    Keyword arguments are passed to `run_neuron_session`; `out_path` must not be None.
+    For a few large neurons, running their schemes in parallel with `scheme_n_jobs`
+    (and `n_jobs=1`) keeps one shared copy of each neuron in memory rather than one
+    per worker.
+
+    Returns
+    -------
+    :
+        The concatenated sequence infos, and the metrics with one row per sequence,
+        indexed by (root_id, scheme, order_by, random_seed).
+    """
+    out_path = Path(kwargs.get("out_path", OUT_PATH / "sequence_metrics"))
+    Parallel(n_jobs=n_jobs)(
+        delayed(run_neuron_session)(root_id, **kwargs) for root_id in root_ids
+    )
+
+    all_infos = []
+    all_features = {}
+    for root_id in root_ids:
+        with open(out_path / f"{root_id}.pkl", "rb") as f:
+            outputs = pickle.load(f)
+        all_infos.append(outputs["infos"])
+        all_features.update(outputs["features"])
+
+    all_infos = pd.concat(all_infos)
+    features_df = pd.DataFrame(all_features).T
+    features_df.index.names = ["root_id", "scheme", "order_by", "random_seed"]
+    return all_infos, features_df
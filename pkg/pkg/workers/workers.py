@@ -8,10 +8,32 @@ from pkg.edits import lazy_load_initial_network, lazy_load_network_edits
 from pkg.neuronframe import load_neuronframe
 from pkg.sequence import create_merge_and_clean_sequence, create_time_ordered_sequence
 
+SEQUENCE_SEED = 8888
+N_RANDOM_SEQUENCES = 10
+
+_CLIENT = None
+
+
+def get_worker_client() -> cc.CAVEclient:
+    """Get the CAVEclient of this worker process, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = cc.CAVEclient("minnie65_phase3_v1")
+    return _CLIENT
+
+
+def get_sequence_seeds(n_sequences: int = N_RANDOM_SEQUENCES) -> list[int]:
+    """Get the random seeds of the random-order merge and clean sequences."""
+    rng = np.random.default_rng(SEQUENCE_SEED)
+    return [
+        int(rng.integers(0, np.iinfo(np.int32).max, dtype=np.int32))
+        for _ in range(n_sequences)
+    ]
+
 
 @queueable
 def extract_edit_info(root_id):
-    client = cc.CAVEclient("minnie65_phase3_v1")
+    client = get_worker_client()
 
     lazy_load_network_edits(root_id, client)
 
@@ -22,7 +44,7 @@ def extract_edit_info(root_id):
 
 @queueable
 def extract_initial_network(root_id):
-    client = cc.CAVEclient("minnie65_phase3_v1")
+    client = get_worker_client()
 
     lazy_load_initial_network(root_id, client)
 
@@ -37,7 +59,7 @@ def create_neuronframe(root_id):
     print()
     currtime = time.time()
 
-    client = cc.CAVEclient("minnie65_phase3_v1")
+    client = get_worker_client()
 
     load_neuronframe(root_id, client, cache_verbose=True)
     print()
@@ -47,10 +69,7 @@ def create_neuronframe(root_id):
     return 1
 
 
-@queueable
-def create_sequences(root_id):
-    client = cc.CAVEclient("minnie65_phase3_v1")
-
+def _create_sequences(root_id, client):
     neuron = load_neuronframe(root_id, client)
 
     if neuron is None or isinstance(neuron, str):
@@ -60,11 +79,14 @@ def create_sequences(root_id):
 
     create_merge_and_clean_sequence(neuron, root_id, order_by="time")
 
-    rng = np.random.default_rng(8888)
-    for i in range(10):
-        seed = rng.integers(0, np.iinfo(np.int32).max, dtype=np.int32)
+    for seed in get_sequence_seeds():
         create_merge_and_clean_sequence(
-            neuron, root_id, order_by="random", random_seed=seed
+            neuron, root_id, order_by="random", random_seed=np.int32(seed)
         )
 
+
+@queueable
+def create_sequences(root_id):
+    _create_sequences(root_id, get_worker_client())
+
     return 1
@@ -0,0 +1,227 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("caveclient")
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from pkg.io.cache import (
+    ArtifactKey,
+    CloudCache,
+    DiskCache,
+    LocalFileCache,
+    MemoryCache,
+    TieredCache,
+)
+
+KEY = ArtifactKey("bucket", "folder", "123-result.pkl")
+
+
+class FakeBlob:
+    # the parts of a GCS blob leases use, with generation preconditions
+    def __init__(self, objects: dict, name: str):
+        self.objects = objects
+        self.name = name
+        self.generation = None
+
+    def download_as_bytes(self):
+        if self.name not in self.objects:
+            raise NotFound(self.name)
+        data, self.generation = self.objects[self.name]
+        return data
+
+    def _check(self, if_generation_match):
+        generation = self.objects.get(self.name, (None, 0))[1]
+        if if_generation_match is not None and if_generation_match != generation:
+            raise PreconditionFailed(self.name)
+        return generation
+
+    def upload_from_string(self, data, if_generation_match=None):
+        generation = self._check(if_generation_match)
+        self.objects[self.name] = (data, generation + 1)
+
+    def upload_from_file(self, stream, size=None, content_type=None):
+        self.upload_from_string(stream.read(size))
+
+    def delete(self, if_generation_match=None):
+        if self.name not in self.objects:
+            raise NotFound(self.name)
+        self._check(if_generation_match)
+        del self.objects[self.name]
+
+
+class FakeCloudCache(CloudCache):
+    def __init__(self):
+        super().__init__()
+        self.objects = {}
+
+    def _blob(self, key, file_name):
+        return FakeBlob(self.objects, f"{key.cloud_bucket}/{key.folder}/{file_name}")
+
+
+@pytest.fixture(params=["local", "cloud"])
+def tier(request, tmp_path):
+    if request.param == "local":
+        return LocalFileCache(tmp_path)
+    return FakeCloudCache()
+
+
+def test_lease_is_exclusive(tier):
+    assert tier.acquire_lease(KEY, "a", ttl=60)
+    assert tier.acquire_lease(KEY, "a", ttl=60)
+    assert not tier.acquire_lease(KEY, "b", ttl=60)
+
+    # only the holder can release it
+    tier.release_lease(KEY, "b")
+    assert not tier.acquire_lease(KEY, "b", ttl=60)
+    tier.release_lease(KEY, "a")
+    assert tier.acquire_lease(KEY, "b", ttl=60)
+
+
+def test_expired_lease_is_taken_over(tier):
+    assert tier.acquire_lease(KEY, "a", ttl=-1)
+    assert tier.acquire_lease(KEY, "b", ttl=60)
+    assert not tier.acquire_lease(KEY, "a", ttl=60)
+
+    # the old holder releasing it late does not free it
+    tier.release_lease(KEY, "a")
+    assert not tier.acquire_lease(KEY, "c", ttl=60)
+
+
+def test_renewed_lease_is_kept(tier):
+    assert tier.acquire_lease(KEY, "a", ttl=-1)
+    tier.renew_lease(KEY, "a", ttl=60)
+    assert not tier.acquire_lease(KEY, "b", ttl=60)
+
+    # a lease taken over is not renewed by its old holder
+    tier.renew_lease(KEY, "a", ttl=-1)
+    assert tier.acquire_lease(KEY, "b", ttl=60)
+    tier.renew_lease(KEY, "a", ttl=60)
+    assert not tier.acquire_lease(KEY, "a", ttl=60)
+
+
+def test_cloud_lease_takes_one_request():
+    tier = FakeCloudCache()
+    calls = []
+    lease_blob = tier._lease_blob
+
+    def counting_lease_blob(key):
+        calls.append(key)
+        return lease_blob(key)
+
+    tier._lease_blob = counting_lease_blob
+    start = time.time()
+    assert tier.acquire_lease(KEY, "a", ttl=60)
+    assert len(calls) == 1
+    assert time.time() - start < 0.5
+
+
+def test_tiered_cache_acquire(tmp_path):
+    local = LocalFileCache(tmp_path)
+    cache = TieredCache([local], poll_interval=0.01, wait_timeout=None)
+    data, tier_name, lease = cache.acquire(KEY)
+    assert data is None and tier_name is None
+    assert local._lease_file(KEY).exists()
+
+    cache.put(KEY, b"result")
+    lease.release()
+    assert not local._lease_file(KEY).exists()
+    assert cache.get(KEY) == (b"result", "local")
+
+
+def test_cloud_put_takes_buffers():
+    tier = FakeCloudCache()
+    data = bytearray(b"result")
+    tier.put(KEY, memoryview(data))
+    assert tier.objects[KEY.path][0] == b"result"
+
+
+def _key(i):
+    return ArtifactKey("bucket", "folder", f"{i}-result.pkl")
+
+
+def test_tiers_promote_hits(tmp_path):
+    memory = MemoryCache()
+    disk = DiskCache(tmp_path / "disk")
+    local = LocalFileCache(tmp_path / "local")
+    cache = TieredCache([memory, disk, local])
+
+    local.put(KEY, b"result")
+    assert cache.get(KEY) == (b"result", "local")
+    assert memory.get(KEY) == b"result"
+    assert disk.get(KEY) == b"result"
+    assert cache.get(KEY) == (b"result", "memory")
+
+    memory.clear()
+    assert cache.get(KEY) == (b"result", "disk")
+    assert memory.get(KEY) == b"result"
+
+    cache.put(_key(1), b"other")
+    assert [tier.get(_key(1)) for tier in cache.tiers] == [b"other"] * 3
+    cache.discard(_key(1))
+    assert cache.get(_key(1)) == (None, None)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(max_bytes=10)
+    for i in range(3):
+        memory.put(_key(i), b"abc")
+    memory.get(_key(0))
+    memory.put(_key(3), b"abc")
+    assert memory.get(_key(1)) is None
+    assert [memory.get(_key(i)) is not None for i in [0, 2, 3]] == [True] * 3
+    assert memory.n_bytes == 9
+
+    # replacing an artifact counts only its new size; too large ones are not held
+    memory.put(_key(0), b"a")
+    assert memory.n_bytes == 7
+    memory.put(_key(4), b"a" * 11)
+    assert memory.get(_key(4)) is None
+    assert memory.n_bytes == 7
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    disk = DiskCache(tmp_path, max_bytes=100, scan_interval=float("inf"))
+    now = time.time()
+    for i in range(4):
+        disk.put(_key(i), b"a" * 20)
+        os.utime(disk._file(_key(i)), (now - 100 + i, now - 100 + i))
+    # reading marks it as recently used
+    disk.get(_key(0))
+
+    # past max_bytes, down to under 90% of it, least recently used first
+    disk.put(_key(4), b"a" * 40)
+    assert [disk.get(_key(i)) is not None for i in range(5)] == [
+        True,
+        False,
+        False,
+        True,
+        True,
+    ]
+    assert disk._n_bytes == 80
+
+
+def test_disk_cache_size_accounting(tmp_path):
+    disk = DiskCache(tmp_path, max_bytes=1000, scan_interval=float("inf"))
+    disk.put(_key(0), b"a" * 10)
+    # the first put scans to find the size, and later ones keep a running total
+    assert disk._n_bytes == 10
+
+    scans = []
+    evict = disk.evict
+    disk.evict = lambda: scans.append(1) or evict()
+    disk.put(_key(1), b"a" * 20)
+    disk.put(_key(0), b"a" * 5)
+    assert disk._n_bytes == 25
+    disk.discard(_key(1))
+    disk.discard(_key(2))
+    assert disk._n_bytes == 5
+    assert scans == []
+
+    # files other processes added are counted at the next scan
+    (tmp_path / "other").write_bytes(b"a" * 7)
+    disk.scan_interval = 0
+    disk.put(_key(3), b"a" * 3)
+    assert scans == [1]
+    assert disk._n_bytes == 15
@@ -0,0 +1,141 @@
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.io.catalog
+from cloudfiles import CloudFiles
+from pkg.io import ArtifactCatalog, lazycloud
+from pkg.io.cache import ArtifactKey, LocalFileCache, TieredCache
+from pkg.io.catalog import _parse_params
+
+OPTIONAL_DEFAULTS = {"adaptive_bounds": False, "max_bounds_halfwidth": None}
+
+
+def test_parse_params_positional():
+    params = _parse_params("864691135-42", ["root_id", "operation_id"], [])
+    assert params == {"root_id": 864691135, "operation_id": 42}
+
+    # too few positional parameters, or keyword ones which are not expected
+    assert _parse_params("864691135", ["root_id", "operation_id"], []) is None
+    assert _parse_params("864691135-order_by=time", ["root_id"], []) is None
+    assert _parse_params("864691135-extra", ["root_id"], []) is None
+
+
+def test_parse_params_typed():
+    params = _parse_params(
+        "864691135-order_by=random-random_seed=3-fraction=0.5-flag=True-none=None",
+        ["root_id"],
+        None,
+    )
+    assert params == {
+        "root_id": 864691135,
+        "order_by": "random",
+        "random_seed": 3,
+        "fraction": 0.5,
+        "flag": True,
+        "none": None,
+    }
+    assert type(params["random_seed"]) is int
+
+
+def test_parse_params_kwarg_keys():
+    params = _parse_params(
+        "864691135-order_by=time-of-day-random_seed=3",
+        ["root_id"],
+        ["order_by", "random_seed"],
+    )
+    assert params == {"root_id": 864691135, "order_by": "time-of-day", "random_seed": 3}
+
+    # every keyword parameter is in the names lazycloud makes
+    assert (
+        _parse_params("864691135-order_by=time", ["root_id"], ["order_by", "seed"])
+        is None
+    )
+
+
+def test_parse_params_optional_kwargs():
+    params = _parse_params("864691135", ["root_id"], [], OPTIONAL_DEFAULTS)
+    assert params == {
+        "root_id": 864691135,
+        "adaptive_bounds": False,
+        "max_bounds_halfwidth": None,
+    }
+
+    params = _parse_params(
+        "864691135-adaptive_bounds=True-max_bounds_halfwidth=80000",
+        ["root_id"],
+        [],
+        OPTIONAL_DEFAULTS,
+    )
+    assert params == {
+        "root_id": 864691135,
+        "adaptive_bounds": True,
+        "max_bounds_halfwidth": 80000,
+    }
+
+    assert (
+        _parse_params("864691135-random_seed=3", ["root_id"], [], OPTIONAL_DEFAULTS)
+        is None
+    )
+
+
+def test_record_and_query(tmp_path):
+    catalog = ArtifactCatalog(tmp_path / "catalog.sqlite")
+    for root_id in [1, 2]:
+        for seed in [3, 4]:
+            catalog.record(
+                ArtifactKey("bucket", "folder", f"{root_id}-seed={seed}-seq.pkl"),
+                "make_sequence",
+                "seq.pkl",
+                {"root_id": root_id, "seed": seed},
+                size=10,
+            )
+    assert catalog.contains(ArtifactKey("bucket", "folder", "1-seed=3-seq.pkl"))
+    assert len(catalog.query(file_suffix="seq.pkl")) == 4
+    assert len(catalog.query(root_id=[1, 5], seed=3)) == 1
+    assert len(catalog.query(unknown=1)) == 0
+
+    catalog.discard(ArtifactKey("bucket", "folder", "1-seed=3-seq.pkl"))
+    assert catalog.query(root_id=1)["seed"].tolist() == [4]
+
+
+def test_scan(tmp_path, monkeypatch):
+    # the artifacts are in a local directory laid out like the buckets
+    monkeypatch.setattr(
+        pkg.io.catalog,
+        "CloudFiles",
+        lambda path: CloudFiles(path.replace("gs://", f"file://{tmp_path}/")),
+    )
+
+    @lazycloud(
+        cloud_bucket="bucket",
+        folder="folder",
+        file_suffix="result.json",
+        arg_keys=[0],
+        kwarg_keys=["order_by"],
+        save_format="json",
+        cache=TieredCache([LocalFileCache(tmp_path)]),
+        catalog=ArtifactCatalog(tmp_path / "written.sqlite"),
+        optional_kwarg_keys=["random_seed"],
+    )
+    def make_result(root_id, order_by="time", random_seed=None):
+        return {"root_id": root_id}
+
+    make_result(11, order_by="time")
+    make_result(12, order_by="random", random_seed=7)
+    # not made by the function
+    LocalFileCache(tmp_path).put(
+        ArtifactKey("bucket", "folder", "11-other-result.json"), b"{}"
+    )
+
+    catalog = ArtifactCatalog(tmp_path / "scanned.sqlite")
+    assert catalog.scan(function=make_result) == 2
+    found = catalog.query(function="make_result").sort_values("root_id")
+    assert found["root_id"].tolist() == [11, 12]
+    assert found["order_by"].tolist() == ["time", "random"]
+    assert found["random_seed"].tolist()[1] == 7
+    assert found["random_seed"].isna().tolist()[0]
+    assert found["size"].tolist() == [len(b'{"root_id": 11}')] * 2
+
+    # already cataloged artifacts are skipped
+    assert catalog.scan(function=make_result) == 0
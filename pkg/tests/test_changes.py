@@ -0,0 +1,353 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.edits.changes
+from joblib import parallel_backend
+from pkg.edits import get_initial_network, get_network_edits
+from pkg.edits.changes import (
+    NetworkDelta,
+    _delta_leaves_bounds,
+    _get_bounds_settings,
+    _legacy_network_edits_loader,
+    _network_edits_loader,
+    _network_edits_saver,
+)
+from pkg.io import ArtifactCatalog, deserialize, serialize
+from pkg.io.cache import ArtifactKey, LocalFileCache, TieredCache, set_default_cache
+from pkg.io.catalog import set_default_catalog
+
+
+class FakeChunkedGraph:
+    segmentation_info = {
+        "graph": {
+            "chunk_size": [10, 10, 10],
+            "n_bits_for_layer_id": 8,
+            "spatial_bit_masks": {"2": 10},
+        },
+        "scales": [{"voxel_offset": [0, 0, 0]}],
+    }
+
+
+class FakeClient:
+    chunkedgraph = FakeChunkedGraph()
+
+
+def level2_id(x, y, z, counter=1):
+    return (2 << 56) | (x << 46) | (y << 36) | (z << 26) | counter
+
+
+# chunks (1, 1, 1) through (2, 2, 2), i.e. 10 to 30 along each axis
+BBOX = np.array([[10, 30], [10, 30], [10, 30]])
+
+
+def _delta(removed, added, edges):
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    delta = NetworkDelta(
+        np.array(removed, dtype=np.int64),
+        np.array(added, dtype=np.int64),
+        edges,
+        np.empty((0, 2), dtype=np.int64),
+    )
+    return delta, pd.DataFrame(edges, columns=["source", "target"])
+
+
+def test_changes_inside_bounds():
+    # changed nodes in chunks on the edge of the box, linked only to nodes inside it
+    removed = level2_id(1, 1, 1)
+    added = [level2_id(2, 2, 2), level2_id(2, 2, 2, 2)]
+    delta, edges = _delta(
+        [removed],
+        added,
+        [[removed, level2_id(2, 1, 1)], [level2_id(2, 1, 1), level2_id(2, 2, 1)]],
+    )
+    assert not _delta_leaves_bounds(delta, edges, BBOX, FakeClient())
+
+
+def test_changes_leave_bounds():
+    removed = level2_id(2, 2, 2)
+    delta, edges = _delta([removed], [], [[removed, level2_id(2, 3, 2)]])
+    assert _delta_leaves_bounds(delta, edges, BBOX, FakeClient())
+
+    delta, edges = _delta([removed], [], [[level2_id(0, 2, 2), removed]])
+    assert _delta_leaves_bounds(delta, edges, BBOX, FakeClient())
+
+
+def test_changes_in_straddling_chunks():
+    # a box which cuts through chunks (1, 1, 1) and (2, 2, 2)
+    bbox = BBOX + np.array([5, -5])
+    removed = level2_id(1, 1, 1)
+    delta, edges = _delta([removed], [], [[removed, level2_id(2, 2, 2)]])
+    assert not _delta_leaves_bounds(delta, edges, bbox, FakeClient())
+
+    # unchanged nodes outside of the box do not count unless linked to a change
+    delta, edges = _delta(
+        [removed], [], [[level2_id(2, 2, 2), level2_id(3, 2, 2)], [removed, removed]]
+    )
+    assert not _delta_leaves_bounds(delta, edges, bbox, FakeClient())
+
+
+def test_no_changes():
+    delta, edges = _delta([], [], [[level2_id(0, 0, 0), level2_id(5, 5, 5)]])
+    assert not _delta_leaves_bounds(delta, edges, BBOX, FakeClient())
+
+
+def _frame_delta(removed, added, removed_edges, added_edges, metadata):
+    return NetworkDelta(
+        pd.DataFrame(index=pd.Index(removed, dtype=np.int64)),
+        pd.DataFrame(index=pd.Index(added, dtype=np.int64)),
+        pd.DataFrame(
+            np.array(removed_edges, dtype=np.int64).reshape(-1, 2),
+            columns=["source", "target"],
+        ),
+        pd.DataFrame(
+            np.array(added_edges, dtype=np.int64).reshape(-1, 2),
+            columns=["source", "target"],
+        ),
+        metadata=metadata,
+    )
+
+
+def _round_trip(networkdeltas):
+    data = serialize(_network_edits_saver(networkdeltas), "npz", compression="zstd")
+    return _network_edits_loader(deserialize(data, "npz"))
+
+
+def test_network_edits_round_trip():
+    networkdeltas = {
+        5: _frame_delta(
+            [1, 2],
+            [3],
+            [[1, 2], [2, 4]],
+            [[3, 4]],
+            {
+                "operation_id": np.int64(5),
+                "is_merge": np.bool_(True),
+                "sink_coords": np.array([[1, 2, 3]]),
+                "n_added_nodes": 1,
+                "user": "someone",
+            },
+        ),
+        # an operation which changed nothing in the box
+        2: _frame_delta([], [], [], [], {"operation_id": 2}),
+        9: _frame_delta([3], [6, 7], [[3, 4]], [[6, 7], [6, 4]], {}),
+    }
+    loaded = _round_trip(networkdeltas)
+
+    assert list(loaded) == [5, 2, 9]
+    for operation_id, delta in networkdeltas.items():
+        loaded_delta = loaded[operation_id]
+        # arrays until the tables are asked for
+        assert isinstance(loaded_delta._removed_nodes, np.ndarray)
+        assert isinstance(loaded_delta._added_edges, np.ndarray)
+        np.testing.assert_array_equal(
+            loaded_delta._node_ids("added"), delta._node_ids("added")
+        )
+        assert loaded_delta == delta
+        assert isinstance(loaded_delta._removed_nodes, pd.DataFrame)
+
+    metadata = loaded[5].metadata
+    assert metadata == {
+        "operation_id": 5,
+        "is_merge": True,
+        "sink_coords": [[1, 2, 3]],
+        "n_added_nodes": 1,
+        "user": "someone",
+    }
+    assert type(metadata["operation_id"]) is int
+    assert type(metadata["is_merge"]) is bool
+    assert len(loaded[2].added_edges) == 0
+    assert list(loaded[2].added_edges.columns) == ["source", "target"]
+
+
+def test_network_edits_round_trip_empty():
+    assert _round_trip({}) == {}
+
+
+def test_legacy_network_edits_loader():
+    delta = _frame_delta([1], [3], [[1, 2]], [[3, 2]], {"operation_id": 5})
+    legacy = {"5": delta.to_dict()}
+    loaded = _legacy_network_edits_loader(legacy)
+    assert list(loaded) == [5]
+    assert loaded[5] == delta
+    assert loaded[5].metadata == {"operation_id": 5}
+
+
+class FakeLineageChunkedGraph(FakeChunkedGraph):
+    def get_lineage_graph(self, root_id, as_nx_graph=True):
+        # 100 -> 200 -> 300, with a sibling 250 of 200
+        return nx.DiGraph([(100, 200), (200, 300), (250, 300)])
+
+
+class FakeLineageClient:
+    chunkedgraph = FakeLineageChunkedGraph()
+
+
+@pytest.fixture
+def local_cache(tmp_path):
+    local = LocalFileCache(tmp_path / "cache")
+    set_default_cache(TieredCache([local]))
+    set_default_catalog(ArtifactCatalog(tmp_path / "catalog.sqlite"))
+    yield local
+    set_default_cache(None)
+    set_default_catalog(None)
+
+
+def _settings_delta(operation_id, **bounds_settings):
+    metadata = {"operation_id": operation_id, **_get_bounds_settings(**bounds_settings)}
+    return _frame_delta([operation_id], [operation_id + 10], [], [], metadata)
+
+
+def test_incremental_checks_bounds_settings(local_cache, monkeypatch):
+    default = dict(
+        bounds_halfwidth=10_000, adaptive_bounds=False, max_bounds_halfwidth=None
+    )
+    ancestor_deltas = {
+        1: _settings_delta(1, **default),
+        2: _settings_delta(2, **{**default, "bounds_halfwidth": 5_000}),
+        # cached before the settings were recorded
+        4: _frame_delta([4], [14], [], [], {"operation_id": 4}),
+    }
+    local_cache.put(
+        ArtifactKey("allen-minnie-phase3", "edit_info", "200-operations.npz"),
+        serialize(pkg.edits.changes._network_edits_saver(ancestor_deltas), "npz"),
+    )
+
+    computed = []
+
+    def get_info_for_operation(
+        operation_id,
+        row,
+        root_id,
+        client,
+        bounds_halfwidth,
+        adaptive_bounds=False,
+        max_bounds_halfwidth=None,
+    ):
+        computed.append(operation_id)
+        delta = _frame_delta([operation_id], [operation_id + 10], [], [], {})
+        delta.metadata = pkg.edits.changes._get_operation_metadata(
+            row,
+            operation_id,
+            root_id,
+            delta,
+            _get_bounds_settings(
+                bounds_halfwidth, adaptive_bounds, max_bounds_halfwidth
+            ),
+        )
+        return delta
+
+    monkeypatch.setattr(
+        pkg.edits.changes, "_get_info_for_operation", get_info_for_operation
+    )
+    change_log = pd.DataFrame({"is_filtered": [True] * 4}, index=[1, 2, 3, 4])
+
+    with parallel_backend("threading"):
+        networkdeltas = get_network_edits(
+            300,
+            FakeLineageClient(),
+            verbose=False,
+            incremental=True,
+            change_log=change_log,
+        )
+    assert sorted(computed) == [2, 3, 4]
+    assert list(networkdeltas) == [1, 2, 3, 4]
+    assert networkdeltas[1] == ancestor_deltas[1]
+    assert networkdeltas[1].metadata["root_id"] == 300
+    for delta in networkdeltas.values():
+        assert delta.metadata["bounds_halfwidth"] == 10_000
+
+    # cached with other adaptive settings, so there is nothing to reuse
+    computed.clear()
+    with parallel_backend("threading"):
+        get_network_edits(
+            300,
+            FakeLineageClient(),
+            verbose=False,
+            adaptive_bounds=True,
+            incremental=True,
+            change_log=change_log,
+        )
+    assert sorted(computed) == [1, 2, 3, 4]
+
+
+# original objects 1001 and 1002 were merged (operation 10) into 500, and a split
+# (operation 11) then made 600; the split cut off nodes 5 and 16 of 1002
+PRUNE_OBJECTS = {
+    1001: ([1, 2, 3], [(1, 2), (2, 3)]),
+    1002: ([4, 5, 16], [(4, 5), (5, 16)]),
+    600: ([1, 2, 8, 12], [(1, 2), (2, 8), (8, 12)]),
+}
+PRUNE_DELTAS = {
+    10: ([3, 4], [8, 9], [(2, 3), (4, 5)], [(2, 8), (8, 9), (9, 5)]),
+    11: ([9], [12], [(8, 9), (9, 5)], [(8, 12)]),
+}
+
+
+class FakePruneChunkedGraph:
+    def get_lineage_graph(self, root_id, as_nx_graph=True):
+        return nx.DiGraph([(1001, 500), (1002, 500), (500, 600)])
+
+
+class FakePruneClient:
+    chunkedgraph = FakePruneChunkedGraph()
+
+
+def _object_nodes_edges(root_id, client, positions=False):
+    nodes, edges = PRUNE_OBJECTS[root_id]
+    return (
+        pd.DataFrame(index=pd.Index(nodes, dtype=np.int64)),
+        pd.DataFrame(np.array(edges, dtype=np.int64), columns=["source", "target"]),
+    )
+
+
+def test_pruned_initial_network(monkeypatch):
+    monkeypatch.setattr(
+        pkg.edits.changes, "get_level2_nodes_edges", _object_nodes_edges
+    )
+    networkdeltas = {
+        operation_id: _frame_delta(*delta, {"operation_id": operation_id})
+        for operation_id, delta in PRUNE_DELTAS.items()
+    }
+    client = FakePruneClient()
+
+    with parallel_backend("threading"):
+        initial_nf = get_initial_network(600, client)
+    pruned_nf = get_initial_network(
+        600, client, prune=True, networkdeltas_by_operation=networkdeltas
+    )
+
+    # the initial nodes which matter for this neuron are the ones which are in its
+    # final state or which some edit removed
+    final_nodes = PRUNE_OBJECTS[600][0]
+    removed_nodes = [node for delta in PRUNE_DELTAS.values() for node in delta[0]]
+    reachable = initial_nf.nodes.index[
+        initial_nf.nodes.index.isin(final_nodes + removed_nodes)
+    ]
+    assert reachable.tolist() == [1, 2, 3, 4]
+    expected_nf = initial_nf.query_nodes("index.isin(@reachable)", local_dict=locals())
+
+    assert pruned_nf.nodes.index.sort_values().equals(expected_nf.nodes.index)
+    pruned_edges = pruned_nf.edges[["source", "target"]].sort_values(
+        ["source", "target"]
+    )
+    expected_edges = expected_nf.edges[["source", "target"]].sort_values(
+        ["source", "target"]
+    )
+    assert pruned_edges.values.tolist() == expected_edges.values.tolist()
+    assert pruned_edges.values.tolist() == [[1, 2], [2, 3]]
+
+    # replaying the edits on the pruned network gives the final neuron
+    nodes = set(pruned_nf.nodes.index)
+    edges = set(map(tuple, pruned_edges.values.tolist()))
+    for removed, added, removed_edges, added_edges in PRUNE_DELTAS.values():
+        nodes = (nodes - set(removed)) | set(added)
+        edges = (edges - set(removed_edges)) | set(added_edges)
+    assert nodes == set(final_nodes)
+    assert edges == set(PRUNE_OBJECTS[600][1])
+
+    with pytest.raises(ValueError, match="networkdeltas_by_operation"):
+        get_initial_network(600, client, prune=True)
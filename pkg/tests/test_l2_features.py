@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.features.l2_features
+from pkg.features.l2_features import (
+    _aggregate_neighborhoods,
+    _build_adjacency,
+    _depth_first_ordering,
+    _geodesic_reachability,
+    _k_hop_reachability,
+    _weight_by_edge_length,
+    process_node_data,
+)
+
+
+@pytest.fixture
+def graph():
+    rng = np.random.default_rng(8888)
+    n = 60
+    node_ids = pd.Index(np.arange(n) + 1000, name="l2_id")
+    # a random tree plus a few extra edges, so that some nodes have several paths
+    sources = np.concatenate([np.arange(1, n), rng.integers(0, n, 10)])
+    targets = np.concatenate(
+        [[rng.integers(0, i) for i in range(1, n)], rng.integers(0, n, 10)]
+    )
+    keep = sources != targets
+    edges = pd.DataFrame(
+        {"source": node_ids[sources[keep]], "target": node_ids[targets[keep]]}
+    )
+    features = pd.DataFrame(
+        rng.normal(size=(n, 3)), index=node_ids, columns=["a", "b", "c"]
+    )
+    features = features.mask(rng.random(features.shape) < 0.2)
+    return node_ids, edges, features
+
+
+def _pandas_neighborhoods(node_ids, edges, k):
+    neighbors = {node_id: {node_id} for node_id in node_ids}
+    for source, target in edges.itertuples(index=False):
+        neighbors[source].add(target)
+        neighbors[target].add(source)
+    neighborhoods = {}
+    for node_id in node_ids:
+        reached = {node_id}
+        for _ in range(k):
+            reached = set().union(*(neighbors[n] for n in reached))
+        neighborhoods[node_id] = reached
+    return neighborhoods
+
+
+def test_k_hop_reachability(graph):
+    node_ids, edges, _ = graph
+    adjacency = _build_adjacency(node_ids, edges)
+    for k in [0, 1, 3]:
+        reachability = _k_hop_reachability(adjacency, k)
+        expected = _pandas_neighborhoods(node_ids, edges, k)
+        for i, node_id in enumerate(node_ids):
+            reached = set(node_ids[reachability[[i]].indices])
+            assert reached == expected[node_id]
+
+    with pytest.raises(ValueError):
+        _k_hop_reachability(adjacency, -1)
+
+
+def test_aggregate_neighborhoods(graph):
+    node_ids, edges, features = graph
+    aggregations = ["mean", "std", "min", "max"]
+    neighborhoods = _k_hop_reachability(_build_adjacency(node_ids, edges), 2)
+    aggregated = _aggregate_neighborhoods(
+        neighborhoods, features.to_numpy(), aggregations
+    )
+
+    for i, node_ids_in_neighborhood in enumerate(
+        _pandas_neighborhoods(node_ids, edges, 2).values()
+    ):
+        neighborhood_features = features.loc[list(node_ids_in_neighborhood)]
+        for aggregation in aggregations:
+            expected = neighborhood_features.agg(aggregation).to_numpy()
+            np.testing.assert_allclose(
+                aggregated[aggregation][i], expected, equal_nan=True
+            )
+
+
+def _positions(node_ids, missing=()):
+    rng = np.random.default_rng(8889)
+    positions = rng.normal(size=(len(node_ids), 3)) * 10
+    positions[list(missing)] = np.nan
+    return positions
+
+
+def _edge_lengths(adjacency):
+    coo = adjacency.tocoo()
+    return dict(zip(zip(coo.row.tolist(), coo.col.tolist()), coo.data.tolist()))
+
+
+def test_weight_by_edge_length(graph):
+    node_ids, edges, _ = graph
+    adjacency = _build_adjacency(node_ids, edges)
+    positions = _positions(node_ids, missing=[3])
+    lengths = _edge_lengths(_weight_by_edge_length(adjacency, positions))
+
+    expected = {}
+    for i, j in _edge_lengths(adjacency):
+        expected[i, j] = np.sqrt(((positions[i] - positions[j]) ** 2).sum())
+    known = [length for length in expected.values() if not np.isnan(length)]
+    for key, length in expected.items():
+        if np.isnan(length):
+            expected[key] = np.median(known)
+    assert lengths.keys() == expected.keys()
+    for key, length in expected.items():
+        assert lengths[key] == pytest.approx(length)
+
+    # with no positions at all, every edge counts the same
+    positions = _positions(node_ids, missing=range(len(node_ids)))
+    lengths = _edge_lengths(_weight_by_edge_length(adjacency, positions))
+    assert set(lengths.values()) == {1.0}
+
+    # zero-length edges are kept
+    positions = np.zeros((len(node_ids), 3))
+    lengths = _edge_lengths(_weight_by_edge_length(adjacency, positions))
+    assert lengths.keys() == expected.keys()
+    assert all(length > 0 for length in lengths.values())
+
+
+def _isolate(node_ids, edges, isolated=(1, 2, 30)):
+    # so that the graph has several connected components
+    is_isolated = edges.isin(node_ids[list(isolated)]).any(axis=1)
+    return edges[~is_isolated]
+
+
+def _neighbors(node_ids, edges):
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    neighbors = {i: set() for i in range(len(node_ids))}
+    for source, target in edges.itertuples(index=False):
+        neighbors[index[source]].add(index[target])
+        neighbors[index[target]].add(index[source])
+    return neighbors
+
+
+def test_depth_first_ordering(graph):
+    node_ids, edges, _ = graph
+    edges = _isolate(node_ids, edges)
+    neighbors = _neighbors(node_ids, edges)
+    order = _depth_first_ordering(_build_adjacency(node_ids, edges)).tolist()
+    assert sorted(order) == list(range(len(node_ids)))
+
+    # a depth-first traversal only backtracks from a node once all of its neighbors
+    # are visited, and only starts a new component once the last one is exhausted
+    visited = set()
+    path = []
+    n_components = 0
+    for node in order:
+        while path and node not in neighbors[path[-1]]:
+            assert neighbors[path[-1]] <= visited
+            path.pop()
+        if not path:
+            n_components += 1
+        visited.add(node)
+        path.append(node)
+
+    n_expected = 0
+    unseen = set(neighbors)
+    while unseen:
+        n_expected += 1
+        frontier = {unseen.pop()}
+        while frontier:
+            unseen -= frontier
+            frontier = set().union(*(neighbors[node] for node in frontier)) & unseen
+    assert n_components == n_expected
+    assert n_components >= 4
+
+
+def _floyd_warshall(lengths):
+    n = lengths.shape[0]
+    distances = np.full((n, n), np.inf)
+    for (i, j), length in _edge_lengths(lengths).items():
+        distances[i, j] = length
+    np.fill_diagonal(distances, 0)
+    for k in range(n):
+        distances = np.minimum(distances, distances[:, [k]] + distances[[k], :])
+    return distances
+
+
+@pytest.mark.parametrize("batch_size", [1024, 7])
+def test_geodesic_reachability(graph, monkeypatch, batch_size):
+    monkeypatch.setattr(pkg.features.l2_features, "GEODESIC_BATCH_SIZE", batch_size)
+    node_ids, edges, _ = graph
+    edges = _isolate(node_ids, edges)
+    lengths = _weight_by_edge_length(
+        _build_adjacency(node_ids, edges), _positions(node_ids)
+    )
+    distances = _floyd_warshall(lengths)
+    for distance in [0.0, 10.0, 25.0, 50.0, np.inf]:
+        reachability = _geodesic_reachability(lengths, distance)
+        np.testing.assert_array_equal(
+            reachability.toarray() > 0,
+            np.isfinite(distances) & (distances <= distance),
+        )
+
+
+def test_process_node_data():
+    pca = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    l2data = {
+        "1": {
+            "area_nm2": 1.0,
+            "size_nm3": 2.0,
+            "pca": pca,
+            "pca_val": [6.0, 3.0, 1.0],
+            "rep_coord_nm": [10.0, 20.0, 30.0],
+        },
+        # no rep_coord_nm, and a malformed pca_val
+        "2": {"area_nm2": None, "size_nm3": 4.0, "pca": pca, "pca_val": [1.0, 2.0]},
+        "3": {},
+    }
+    node_data = process_node_data(l2data)
+
+    assert node_data.index.tolist() == [1, 2, 3]
+    assert node_data.index.name == "l2_id"
+    assert node_data.shape == (3, 20)
+    assert node_data.dtypes.eq(np.float64).all()
+    assert node_data.loc[1, "pca_ratio_01"] == 2.0
+    assert node_data.loc[1, ["rep_coord_x", "rep_coord_y", "rep_coord_z"]].tolist() == [
+        10.0,
+        20.0,
+        30.0,
+    ]
+    assert node_data.loc[2, "size_nm3"] == 4.0
+    assert node_data.loc[2, ["area_nm2", "pca_ratio_01", "rep_coord_x"]].isna().all()
+    assert node_data.loc[3].isna().all()
+    # max_dt_nm and mean_dt_nm were never computed
+    assert node_data[["max_dt_nm", "mean_dt_nm"]].isna().all().all()
+
+    # the same from a DataFrame, as before
+    frame = pd.DataFrame.from_dict(l2data, orient="index").reindex(list(l2data))
+    frame.index = frame.index.astype(int)
+    pd.testing.assert_frame_equal(process_node_data(frame), node_data)
+
+    assert process_node_data({}) is None
+    assert process_node_data({"1": {}, "2": {"pca": None}}) is None
+    assert process_node_data(l2data, dtype=np.float32).dtypes.eq(np.float32).all()
@@ -0,0 +1,226 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+from pkg.utils import pt_to_xyz
+from pkg.utils.l2cache import (
+    L2AttributeStore,
+    _pack_row,
+    decode_l2_values,
+    decode_l2data,
+)
+
+PCA = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
+L2DATA = {
+    "1": {"rep_coord_nm": [10.0, 20.0, 30.0], "size_nm3": 5.0, "pca": PCA},
+    "2": {"rep_coord_nm": [40.0, 50.0, 60.0], "size_nm3": 6.0, "pca": PCA},
+    "3": {"rep_coord_nm": [70.0, 80.0, 90.0], "size_nm3": 7.0, "pca": PCA},
+    # computed by the l2cache, but without a size
+    "4": {"rep_coord_nm": [1.0, 2.0, 3.0], "pca": PCA},
+    # nothing computed by the l2cache, which returns an empty dictionary
+    "5": {},
+}
+
+
+class FakeL2Cache:
+    def __init__(self):
+        self.data = copy.deepcopy(L2DATA)
+        self.requests = []
+
+    def get_l2data(self, l2_ids, attributes):
+        self.requests.append((sorted(l2_ids), attributes))
+        return {
+            str(l2_id): {
+                attribute: value
+                for attribute, value in self.data[str(l2_id)].items()
+                if attribute in attributes
+            }
+            for l2_id in l2_ids
+        }
+
+
+class FakeClient:
+    def __init__(self):
+        self.l2cache = FakeL2Cache()
+
+
+def test_pack_row():
+    assert _pack_row("pca", tuple(np.ravel(PCA))) == PCA
+    assert _pack_row("rep_coord_nm", (1.0, 2.0, 3.0)) == [1.0, 2.0, 3.0]
+    assert _pack_row("size_nm3", (5.0,)) == 5.0
+
+
+def test_round_trip(tmp_path):
+    store = L2AttributeStore(tmp_path / "store.sqlite")
+    store.write(L2DATA, ["rep_coord_nm", "pca", "size_nm3"])
+
+    reloaded = L2AttributeStore(tmp_path / "store.sqlite")
+    coords = reloaded.read([3, 1, 2, 6], "rep_coord_nm")
+    assert coords.index.tolist() == [1, 2, 3]
+    assert coords.columns.tolist() == ["x", "y", "z"]
+    assert coords.loc[2].tolist() == [40.0, 50.0, 60.0]
+    assert coords.dtypes.eq(float).all()
+
+    pca = reloaded.read([1], "pca")
+    assert pca.shape == (1, 9)
+    np.testing.assert_array_equal(pca.loc[1], np.ravel(PCA))
+    assert reloaded.read([1, 2, 3, 4], "size_nm3")["value"].tolist() == [5.0, 6.0, 7.0]
+
+
+def test_partial_hit(tmp_path):
+    store = L2AttributeStore(tmp_path / "store.sqlite")
+    store.write({"1": L2DATA["1"], "2": L2DATA["2"]}, ["rep_coord_nm", "pca"])
+    client = FakeClient()
+
+    l2data = store.get_l2data([3, 1, 2], client, ["rep_coord_nm", "pca"])
+    # only the level2 ID not in the store is requested
+    assert client.l2cache.requests == [([3], ["rep_coord_nm", "pca"])]
+    assert l2data == {
+        str(l2_id): {
+            "rep_coord_nm": L2DATA[str(l2_id)]["rep_coord_nm"],
+            "pca": PCA,
+        }
+        for l2_id in [1, 2, 3]
+    }
+
+    # and written back, so nothing is requested the next time
+    assert store.get_l2data([1, 2, 3], client, ["rep_coord_nm", "pca"]) == l2data
+    assert len(client.l2cache.requests) == 1
+
+
+def test_missing_values_are_recorded(tmp_path):
+    store = L2AttributeStore(tmp_path / "store.sqlite")
+    client = FakeClient()
+
+    l2data = store.get_l2data([3, 4, 5], client, ["rep_coord_nm", "size_nm3"])
+    assert l2data["4"] == {"rep_coord_nm": [1.0, 2.0, 3.0]}
+    assert l2data["5"] == {}
+    assert store.read_missing([3, 4, 5], "size_nm3").tolist() == [4, 5]
+    assert store.read_missing([3, 4, 5], "rep_coord_nm").tolist() == [5]
+    assert store.read([3, 4, 5], "size_nm3").index.tolist() == [3]
+
+    # the level2 IDs recorded as missing are not requested again
+    assert store.get_l2data([3, 4, 5], client, ["rep_coord_nm", "size_nm3"]) == l2data
+    assert len(client.l2cache.requests) == 1
+
+    # unless asked to, and a value found later replaces the record
+    retry_store = L2AttributeStore(tmp_path / "store.sqlite", retry_missing=True)
+    client.l2cache.data["4"]["size_nm3"] = 8.0
+    l2data = retry_store.get_l2data([3, 4, 5], client, ["size_nm3"])
+    assert client.l2cache.requests[-1] == ([4, 5], ["size_nm3"])
+    assert l2data["4"] == {"size_nm3": 8.0}
+    assert store.read_missing([4, 5], "size_nm3").tolist() == [5]
+
+    # a missing record never replaces a stored value
+    store.write({}, ["size_nm3"], l2_ids=[3, 4])
+    assert store.read([3, 4], "size_nm3")["value"].tolist() == [7.0, 8.0]
+
+
+def test_unstored_attributes_bypass_store(tmp_path):
+    store = L2AttributeStore(tmp_path / "store.sqlite")
+    store.write(L2DATA, ["rep_coord_nm"])
+    client = FakeClient()
+    l2data = store.get_l2data([1, 2], client, ["rep_coord_nm", "chunk_intersect_count"])
+    assert client.l2cache.requests == [
+        ([1, 2], ["rep_coord_nm", "chunk_intersect_count"])
+    ]
+    assert l2data["1"] == {"rep_coord_nm": [10.0, 20.0, 30.0]}
+
+
+def _old_pt_to_xyz(pts):
+    # pt_to_xyz before it used decode_l2_values
+    positions = pd.DataFrame(index=pts.index)
+    if not isinstance(pts.iloc[0], (list, np.ndarray, tuple)):
+        positions["x"] = np.nan
+        positions["y"] = np.nan
+        positions["z"] = np.nan
+        return positions
+    for i, axis in enumerate(["x", "y", "z"]):
+        positions[axis] = pts.apply(lambda x: x[i] if isinstance(x, list) else np.nan)
+    return positions
+
+
+def test_decode_scalar_values():
+    decoded = decode_l2_values([5.0, None, np.nan, 7, [1.0]])
+    assert decoded.shape == (5, 1)
+    assert decoded.dtype == np.float64
+    np.testing.assert_array_equal(decoded[:, 0], [5.0, np.nan, np.nan, 7.0, np.nan])
+
+    assert decode_l2_values([], n_components=3).shape == (0, 3)
+    assert np.isnan(decode_l2_values([None, None], n_components=3)).all()
+    assert decode_l2_values([5.0], dtype=np.float32).dtype == np.float32
+
+
+def test_decode_vector_values():
+    values = [[1.0, 2.0, 3.0], None, np.nan, (4, 5, 6), np.array([7.0, 8.0, 9.0])]
+    decoded = decode_l2_values(values, n_components=3)
+    expected = [[1, 2, 3], [np.nan] * 3, [np.nan] * 3, [4, 5, 6], [7, 8, 9]]
+    np.testing.assert_array_equal(decoded, expected)
+
+
+def test_decode_ragged_values():
+    # values with the wrong number of components are missing, the rest are kept
+    values = [[1.0, 2.0, 3.0], [1.0, 2.0], [4.0, 5.0, 6.0, 7.0], [8.0, 9.0, 10.0]]
+    decoded = decode_l2_values(values, n_components=3)
+    expected = [[1, 2, 3], [np.nan] * 3, [np.nan] * 3, [8, 9, 10]]
+    np.testing.assert_array_equal(decoded, expected)
+
+    # all with the same, wrong, number of components
+    assert np.isnan(decode_l2_values([[1.0, 2.0], [3.0, 4.0]], 3)).all()
+
+
+def test_decode_nested_pca():
+    other_pca = np.arange(9.0).reshape(3, 3).tolist()
+    decoded = decode_l2_values([PCA, None, other_pca, PCA[:2]], n_components=9)
+    np.testing.assert_array_equal(decoded[0], np.ravel(PCA))
+    assert np.isnan(decoded[1]).all()
+    np.testing.assert_array_equal(decoded[2], np.arange(9.0))
+    assert np.isnan(decoded[3]).all()
+
+
+@pytest.mark.parametrize("as_frame", [False, True])
+def test_decode_l2data(as_frame):
+    l2data = L2DATA
+    if as_frame:
+        # the level2 ID with no attributes is a row of NaN
+        l2data = pd.DataFrame.from_dict(L2DATA, orient="index").reindex(list(L2DATA))
+        l2data.index = l2data.index.astype(int)
+    l2_ids, decoded = decode_l2data(l2data, ["size_nm3", "pca", "area_nm2"])
+
+    assert l2_ids.tolist() == [1, 2, 3, 4, 5]
+    np.testing.assert_array_equal(
+        decoded["size_nm3"][:, 0], [5.0, 6.0, 7.0, np.nan, np.nan]
+    )
+    np.testing.assert_array_equal(decoded["pca"][2], np.ravel(PCA))
+    assert np.isnan(decoded["pca"][4]).all()
+    # not computed for any level2 ID
+    assert decoded["area_nm2"].shape == (5, 1)
+    assert np.isnan(decoded["area_nm2"]).all()
+
+
+@pytest.mark.parametrize(
+    "pts",
+    [
+        [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]],
+        [[1.0, 2.0, 3.0], None, np.nan, [4, 5, 6]],
+        [None, [1.0, 2.0, 3.0]],
+        [np.nan, np.nan],
+    ],
+)
+def test_pt_to_xyz_matches_old(pts):
+    pts = pd.Series(pts, index=[10 + i for i in range(len(pts))], name="pt")
+    positions = pt_to_xyz(pts)
+    old_positions = _old_pt_to_xyz(pts)
+    if not isinstance(pts.iloc[0], list):
+        # the old version gave up if the first point was missing
+        assert old_positions.isna().all().all()
+        old_positions = pd.DataFrame(
+            pts.apply(lambda x: x if isinstance(x, list) else [np.nan] * 3).tolist(),
+            index=pts.index,
+            columns=["x", "y", "z"],
+        )
+    pd.testing.assert_frame_equal(positions, old_positions.astype(float))
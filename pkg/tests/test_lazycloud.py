@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caveclient")
+
+from pkg.io import ArtifactCatalog, get_cache_metrics, lazycloud, reset_cache_metrics
+from pkg.io.cache import ArtifactKey, LocalFileCache, MemoryCache, TieredCache
+from pkg.io.metrics import CACHE_METRICS
+
+
+@pytest.fixture
+def cached(tmp_path):
+    local = LocalFileCache(tmp_path / "local")
+    catalog = ArtifactCatalog(tmp_path / "catalog.sqlite")
+    calls = []
+
+    @lazycloud(
+        cloud_bucket="bucket",
+        folder="folder",
+        file_suffix="result.json",
+        arg_keys=[0],
+        save_format="json",
+        cache=TieredCache([local]),
+        catalog=catalog,
+        optional_kwarg_keys=["scale"],
+    )
+    def compute(object_id, scale=1, verbose=False):
+        calls.append((object_id, scale))
+        return {"value": object_id * scale}
+
+    return compute, local, catalog, calls
+
+
+def test_optional_kwarg_keys(cached):
+    compute, local, catalog, calls = cached
+    assert compute(3) == {"value": 3}
+    assert compute(3, scale=1) == {"value": 3}
+    assert compute(3, 2) == {"value": 6}
+    assert compute(3, scale=2) == {"value": 6}
+    assert calls == [(3, 1), (3, 2)]
+
+    file_names = sorted(file.name for file in (local.path / "bucket/folder").iterdir())
+    assert file_names == ["3-result.json", "3-scale=2-result.json"]
+
+    recorded = catalog.query(function="compute").sort_values("scale")
+    assert recorded["object_id"].tolist() == [3, 3]
+    assert recorded["scale"].tolist() == [1, 2]
+
+
+def test_cache_metrics(tmp_path):
+    memory = MemoryCache()
+
+    @lazycloud(
+        cloud_bucket="bucket",
+        folder="folder",
+        file_suffix="metrics.json",
+        arg_keys=[0],
+        save_format="json",
+        cache=TieredCache([memory, LocalFileCache(tmp_path)]),
+        catalog=ArtifactCatalog(tmp_path / "catalog.sqlite"),
+    )
+    def compute_for_metrics(object_id, only_load=False):
+        return {"value": object_id}
+
+    reset_cache_metrics()
+    compute_for_metrics(1)
+    compute_for_metrics(1)
+    memory.clear()
+    compute_for_metrics(1)
+    assert compute_for_metrics(2, only_load=True) is None
+
+    metrics = get_cache_metrics("compute_for_metrics").loc["compute_for_metrics"]
+    assert metrics["calls"] == 4
+    assert metrics["hits"] == 2
+    assert metrics["hits_memory"] == 1
+    assert metrics["hits_local"] == 1
+    assert metrics["misses"] == 2
+    assert metrics["waits"] == 0
+    assert metrics["bytes_written"] == len(b'{"value": 1}')
+    assert metrics["bytes_read"] == 2 * len(b'{"value": 1}')
+    assert metrics["compute_seconds"] > 0
+
+    CACHE_METRICS.dump(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f)["compute_for_metrics"]["calls"] == 4
+    CACHE_METRICS.dump(tmp_path / "metrics.csv")
+    assert (tmp_path / "metrics.csv").read_text().startswith("function,calls,")
+
+    reset_cache_metrics()
+    assert len(get_cache_metrics()) == 0
+
+
+def test_legacy_formats(tmp_path):
+    local = LocalFileCache(tmp_path)
+    calls = []
+
+    @lazycloud(
+        cloud_bucket="bucket",
+        folder="folder",
+        file_suffix="result.npz",
+        arg_keys=[0],
+        save_format="npz",
+        load_func=lambda arrays: {"value": int(arrays["value"])},
+        save_func=lambda result: {"value": np.array(result["value"])},
+        cache=TieredCache([MemoryCache(), local]),
+        catalog=ArtifactCatalog(tmp_path / "catalog.sqlite"),
+        legacy_formats=[("result.json", "json", lambda d: {"value": d["old_value"]})],
+    )
+    def compute_migrated(object_id, use_cache=True, only_load=False):
+        calls.append(object_id)
+        return {"value": object_id}
+
+    local.put(ArtifactKey("bucket", "folder", "3-result.json"), b'{"old_value": 30}')
+    assert compute_migrated(3, only_load=True) == {"value": 30}
+    assert compute_migrated(3) == {"value": 30}
+    assert calls == []
+    assert local.get(ArtifactKey("bucket", "folder", "3-result.npz")) is not None
+
+    # only when not recomputing anyway
+    assert compute_migrated(3, use_cache=False) == {"value": 3}
+    assert compute_migrated(4) == {"value": 4}
+    assert calls == [3, 4]
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("caveclient")
+
+from pkg.io import SupervoxelLevel2Store
+
+
+class FakeChunkedGraph:
+    def __init__(self, children: dict):
+        self.children = children
+        self.requested = []
+
+    def get_children(self, level2_id):
+        self.requested.append(level2_id)
+        return self.children[level2_id]
+
+
+class FakeClient:
+    def __init__(self, children: dict):
+        self.chunkedgraph = FakeChunkedGraph(children)
+
+
+CHILDREN = {
+    100: [1, 2, 3],
+    101: [4, 5],
+    # supervoxels 2 and 3 after an edit which merged them with 6
+    102: [2, 3, 6],
+    103: [],
+}
+
+
+def test_round_trip(tmp_path):
+    store = SupervoxelLevel2Store(tmp_path)
+    client = FakeClient(CHILDREN)
+    assert store.update([100, 101, 103], client, n_jobs=1) == 3
+
+    reloaded = SupervoxelLevel2Store(tmp_path)
+    assert len(reloaded) == 5
+    assert reloaded.contains_level2_ids([100, 101, 102, 103]).tolist() == [
+        True,
+        True,
+        False,
+        True,
+    ]
+    supervoxel_map = reloaded.get_map([101, 100, 103])
+    assert supervoxel_map.index.tolist() == [4, 5, 1, 2, 3]
+    assert supervoxel_map.tolist() == [101, 101, 100, 100, 100]
+
+    # only the level2 IDs not yet stored are fetched
+    assert reloaded.update([100, 102], client, n_jobs=1) == 1
+    assert client.chunkedgraph.requested == [100, 101, 103, 102]
+
+
+def test_lookup_across_shards(tmp_path):
+    store = SupervoxelLevel2Store(tmp_path, max_shards=None)
+    client = FakeClient(CHILDREN)
+    for level2_id in [100, 101, 102]:
+        store.update([level2_id], client, n_jobs=1)
+    assert len(store._shards) == 3
+
+    found = store.lookup([2, 4, 7])
+    assert sorted(zip(found.index, found.values)) == [(2, 100), (2, 102), (4, 101)]
+
+    supervoxel_map = store.get_map([102, 101])
+    assert supervoxel_map.index.tolist() == [2, 3, 6, 4, 5]
+    assert supervoxel_map.tolist() == [102, 102, 102, 101, 101]
+
+
+def test_duplicate_shards(tmp_path):
+    # as when two workers fetch the same level2 IDs at once
+    store = SupervoxelLevel2Store(tmp_path, max_shards=None)
+    store.append([1, 2, 3], [100, 100, 100], [100])
+    store.append([3, 2, 4], [100, 100, 101], [100, 101])
+
+    supervoxel_map = store.get_map([100, 101])
+    assert supervoxel_map.index.tolist() == [1, 2, 3, 4]
+    found = store.lookup([2])
+    assert found.tolist() == [100]
+
+    store.compact()
+    assert len(store._shards) == 1
+    assert len(store) == 4
+    assert store.fetched_level2_ids.tolist() == [100, 101]
+    reloaded = SupervoxelLevel2Store(tmp_path)
+    assert reloaded.get_map([100, 101]).equals(supervoxel_map)
+
+
+def test_merges_past_max_shards(tmp_path):
+    store = SupervoxelLevel2Store(tmp_path, max_shards=4)
+    for level2_id in range(200, 220):
+        store.append([level2_id * 10, level2_id * 10 + 1], [level2_id] * 2, [level2_id])
+        assert len(store._shards) <= 4
+
+    reloaded = SupervoxelLevel2Store(tmp_path)
+    assert len(reloaded._shards) == len(store._shards)
+    assert reloaded.contains_level2_ids(np.arange(200, 220)).all()
+    supervoxel_map = reloaded.get_map(np.arange(200, 220))
+    assert len(supervoxel_map) == 40
+    assert (supervoxel_map.index // 10 == supervoxel_map.values).all()
@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.workers.pipeline
+from pkg.io import ArtifactCatalog
+from pkg.io.cache import ArtifactKey
+from pkg.workers import find_completed_roots, run_root_pipelines
+from pkg.workers.pipeline import STAGES, PipelineStage
+from pkg.workers.workers import get_sequence_seeds
+
+
+def _record(catalog, root_id, file_suffix, **params):
+    params = {"root_id": root_id, **params}
+    name = "-".join(f"{k}={v}" for k, v in params.items())
+    catalog.record(
+        ArtifactKey("bucket", "folder", f"{name}-{file_suffix}"),
+        "function",
+        file_suffix,
+        params,
+        size=1,
+    )
+
+
+def test_find_completed_roots(tmp_path):
+    catalog = ArtifactCatalog(tmp_path / "catalog.sqlite")
+    _record(catalog, 1, "operations.npz")
+    _record(catalog, 1, "meta_operations.npz")
+    # only half of the artifacts of the stage
+    _record(catalog, 2, "operations.npz")
+    _record(catalog, 3, "neuronframe.pkl")
+
+    assert find_completed_roots("edits", [1, 2, 3, 4], catalog=catalog) == {1}
+    assert find_completed_roots("neuronframe", [1, 2, 3], catalog=catalog) == {3}
+    assert find_completed_roots(STAGES["edits"], [2, 4], catalog=catalog) == set()
+
+
+def test_find_completed_roots_params(tmp_path):
+    catalog = ArtifactCatalog(tmp_path / "catalog.sqlite")
+    for root_id in [1, 2]:
+        _record(catalog, root_id, "time_ordered_sequence.pkl")
+        _record(catalog, root_id, "merge_and_clean_sequence.pkl", order_by="time")
+        for seed in get_sequence_seeds():
+            if root_id == 2 and seed == get_sequence_seeds()[-1]:
+                continue
+            _record(
+                catalog,
+                root_id,
+                "merge_and_clean_sequence.pkl",
+                order_by="random",
+                random_seed=seed,
+            )
+
+    assert find_completed_roots("sequences", [1, 2], catalog=catalog) == {1}
+
+
+def test_run_root_pipelines(tmp_path, monkeypatch):
+    catalog = ArtifactCatalog(tmp_path / "catalog.sqlite")
+    runs = []
+
+    def run_first(root_id, client):
+        runs.append(("first", root_id))
+        if root_id == 3:
+            raise ValueError("bad neuron")
+        _record(catalog, root_id, "first.pkl")
+
+    def run_second(root_id, client):
+        runs.append(("second", root_id))
+        _record(catalog, root_id, "second.pkl")
+
+    monkeypatch.setattr(
+        pkg.workers.pipeline,
+        "STAGES",
+        {
+            "second": PipelineStage(
+                "second", run_second, ("first",), lambda root_id: [("second.pkl", {})]
+            ),
+            "first": PipelineStage(
+                "first", run_first, (), lambda root_id: [("first.pkl", {})]
+            ),
+        },
+    )
+    _record(catalog, 1, "first.pkl")
+
+    failures = run_root_pipelines(
+        [1, 2, 3], ["second"], client=object(), catalog=catalog, verbose=False
+    )
+    assert failures == {3: ("first", "ValueError('bad neuron')")}
+    assert runs == [("first", 2), ("first", 3), ("second", 1), ("second", 2)]
+
+    # everything which succeeded is skipped when run again
+    runs.clear()
+    run_root_pipelines([1, 2], ["second"], client=object(), catalog=catalog)
+    assert runs == []
+
+    with pytest.raises(ValueError, match="Unknown stage"):
+        run_root_pipelines([1], ["third"], client=object(), catalog=catalog)
@@ -0,0 +1,364 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.edits.changes
+import pkg.neuronframe.process
+from networkframe import NetworkFrame
+from pkg.edits import NetworkDelta, get_pruned_initial_network
+from pkg.io import ArtifactCatalog
+from pkg.io.cache import LocalFileCache, TieredCache, set_default_cache
+from pkg.io.catalog import set_default_catalog
+from pkg.neuronframe import NeuronFrameSequence
+from pkg.neuronframe.process import (
+    build_neuronframe,
+    check_neuronframe_final_state,
+    extend_neuronframe,
+)
+from pkg.sequence.sequence_creators import (
+    _create_time_ordered_sequence_dict,
+    _extend_time_ordered_sequence_dict,
+)
+
+# the original objects in the lineage, as level2 nodes and edges; 1001 holds the
+# nucleus at level2 node 1
+OBJECTS = {
+    1001: ([1, 2, 3], [(1, 2), (2, 3)]),
+    1002: ([4], []),
+    1003: ([6, 7], [(6, 7)]),
+}
+# removed nodes, added nodes, removed edges, added edges and whether it is a merge
+OPERATIONS = {
+    10: ([3, 4], [8, 9], [(2, 3)], [(2, 8), (8, 9)], True),
+    11: ([8], [12], [(2, 8), (8, 9)], [(2, 12)], False),
+    12: ([12, 6], [13, 14], [(2, 12), (6, 7)], [(2, 13), (13, 14), (14, 7)], True),
+    13: ([13], [15], [(2, 13), (13, 14)], [(2, 15), (15, 14)], False),
+}
+# 100 is an earlier root ID of the neuron which later became 200; in 200, operations
+# 12 and 13 form one metaoperation
+ROOTS = {
+    100: {
+        "objects": [1001, 1002],
+        "metaoperations": {10: [10], 11: [11]},
+        "pre_synapses": {1: 101, 3: 103, 5: 105},
+        "post_synapses": {2: 102, 4: 104},
+    },
+    200: {
+        "objects": [1001, 1002, 1003],
+        "metaoperations": {10: [10], 11: [11], 12: [12, 13]},
+        "pre_synapses": {1: 101, 3: 103, 5: 105, 6: 106},
+        "post_synapses": {2: 102, 4: 104, 7: 107},
+    },
+}
+CHILDREN = {
+    1: [101],
+    2: [102],
+    3: [103, 104],
+    4: [105],
+    6: [106],
+    7: [107],
+    8: [103, 104],
+    9: [105],
+    12: [103, 104],
+    13: [103, 104],
+    14: [106],
+    15: [103, 104],
+}
+
+
+def _operation_ids(root_id):
+    return [
+        operation_id
+        for operation_ids in ROOTS[root_id]["metaoperations"].values()
+        for operation_id in operation_ids
+    ]
+
+
+def _replay(root_id, objects):
+    nodes = {node for obj in objects for node in OBJECTS[obj][0]}
+    edges = {edge for obj in objects for edge in OBJECTS[obj][1]}
+    for operation_id in _operation_ids(root_id):
+        removed_nodes, added_nodes, removed_edges, added_edges, _ = OPERATIONS[
+            operation_id
+        ]
+        nodes = (nodes - set(removed_nodes)) | set(added_nodes)
+        edges = (edges - set(removed_edges)) | set(added_edges)
+    return nodes, edges
+
+
+class FakeChunkedGraph:
+    def __init__(self, root_id):
+        # the level2 nodes of everything, as of when `root_id` was the latest
+        self.current_nodes = _replay(root_id, OBJECTS.keys())[0]
+
+    def get_roots(self, supervoxel_ids, stop_layer=2):
+        assert stop_layer == 2
+        return [
+            next(node for node in self.current_nodes if sv in CHILDREN[node])
+            for sv in supervoxel_ids
+        ]
+
+    def get_children(self, level2_id):
+        return CHILDREN[level2_id]
+
+
+class FakeClient:
+    def __init__(self, root_id):
+        self.chunkedgraph = FakeChunkedGraph(root_id)
+
+
+def _get_network_edits(root_id, client, **kwargs):
+    networkdeltas_by_operation = {}
+    for i, operation_id in enumerate(sorted(_operation_ids(root_id))):
+        removed_nodes, added_nodes, removed_edges, added_edges, is_merge = OPERATIONS[
+            operation_id
+        ]
+        networkdeltas_by_operation[operation_id] = NetworkDelta(
+            np.array(removed_nodes),
+            np.array(added_nodes),
+            np.array(removed_edges).reshape(-1, 2),
+            np.array(added_edges).reshape(-1, 2),
+            metadata={
+                "operation_id": operation_id,
+                "root_id": root_id,
+                "is_merge": is_merge,
+                "is_filtered": True,
+                "is_relevant": True,
+                "time": f"2020-01-0{i + 1} 00:00:00",
+            },
+        )
+    return networkdeltas_by_operation
+
+
+def _get_network_metaedits(networkdeltas_by_operation, root_id, client, **kwargs):
+    empty = np.empty(0, dtype=int)
+    return {
+        metaoperation_id: NetworkDelta(
+            empty,
+            empty,
+            empty.reshape(-1, 2),
+            empty.reshape(-1, 2),
+            metadata={"operation_ids": operation_ids},
+        )
+        for metaoperation_id, operation_ids in ROOTS[root_id]["metaoperations"].items()
+    }
+
+
+def _collate_edit_info(
+    networkdeltas_by_operation, operation_to_metaoperation, root_id, client
+):
+    edit_stats = pd.DataFrame(
+        [delta.metadata for delta in networkdeltas_by_operation.values()]
+    ).set_index("operation_id")
+    edit_stats["metaoperation_id"] = edit_stats.index.map(operation_to_metaoperation)
+    return edit_stats, None, None
+
+
+def _get_level2_nodes_edges(root_id, client, positions=False):
+    # the final neuron is the component of the nucleus
+    nodes, edges = _replay(root_id, ROOTS[root_id]["objects"])
+    component = {1}
+    while True:
+        reached = component | {
+            node for edge in edges if component & set(edge) for node in edge
+        }
+        if reached == component:
+            break
+        component = reached
+    edges = [edge for edge in sorted(edges) if component & set(edge)]
+    return (
+        pd.DataFrame(index=pd.Index(sorted(component), name="l2_id")),
+        pd.DataFrame(edges, columns=["source", "target"]),
+    )
+
+
+def _get_initial_node_ids(root_id, client):
+    return pd.Index(ROOTS[root_id]["objects"])
+
+
+def _get_initial_network(
+    root_id,
+    client,
+    positions=False,
+    prune=False,
+    networkdeltas_by_operation=None,
+    original_node_ids=None,
+):
+    if prune:
+        return get_pruned_initial_network(root_id, networkdeltas_by_operation, client)
+    if original_node_ids is None:
+        original_node_ids = _get_initial_node_ids(root_id, client)
+    nodes = [node for obj in original_node_ids for node in OBJECTS[obj][0]]
+    edges = [edge for obj in original_node_ids for edge in OBJECTS[obj][1]]
+    return NetworkFrame(
+        pd.DataFrame(index=nodes),
+        pd.DataFrame(edges, columns=["source", "target"], dtype=int),
+        validate=False,
+    )
+
+
+def _get_positions(nodelist, client, skip=False):
+    nodes = pd.DataFrame(index=pd.Index(list(nodelist), name="l2_id"))
+    nodes["x"] = nodes.index * 1000.0
+    nodes["y"] = 0.0
+    nodes["z"] = 0.0
+    nodes["rep_coord_nm"] = nodes[["x", "y", "z"]].values.tolist()
+    return nodes
+
+
+def _apply_positions(nf, client, skip=False):
+    node_positions = _get_positions(nf.nodes.index, client)
+    nf.nodes[["rep_coord_nm", "x", "y", "z"]] = node_positions[
+        ["rep_coord_nm", "x", "y", "z"]
+    ]
+
+
+def _apply_nucleus(nf, root_id, client):
+    nf.nodes["nucleus"] = False
+    nf.nodes.loc[1, "nucleus"] = True
+    return 1
+
+
+def _get_alltime_synapses(root_id, client, verbose=False):
+    tables = []
+    for side in ["pre", "post"]:
+        synapses = ROOTS[root_id][f"{side}_synapses"]
+        tables.append(
+            pd.DataFrame(
+                {f"{side}_pt_supervoxel_id": list(synapses.values())},
+                index=pd.Index(list(synapses.keys()), name="id"),
+            )
+        )
+    return tuple(tables)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    for name, func in [
+        ("get_network_edits", _get_network_edits),
+        ("get_network_metaedits", _get_network_metaedits),
+        ("collate_edit_info", _collate_edit_info),
+        ("get_initial_node_ids", _get_initial_node_ids),
+        ("get_initial_network", _get_initial_network),
+        ("get_level2_nodes_edges", _get_level2_nodes_edges),
+        ("get_positions", _get_positions),
+        ("apply_positions", _apply_positions),
+        ("apply_nucleus", _apply_nucleus),
+    ]:
+        monkeypatch.setattr(pkg.neuronframe.process, name, func)
+    monkeypatch.setattr(
+        pkg.edits.changes, "get_level2_nodes_edges", _get_level2_nodes_edges
+    )
+    monkeypatch.setattr(
+        pkg.edits.changes, "get_alltime_synapses", _get_alltime_synapses
+    )
+
+    set_default_cache(TieredCache([LocalFileCache(tmp_path / "cache")]))
+    set_default_catalog(ArtifactCatalog(tmp_path / "catalog.sqlite"))
+    yield
+    set_default_cache(None)
+    set_default_catalog(None)
+
+
+def _assert_neuronframes_equal(neuron, expected):
+    assert neuron.neuron_id == expected.neuron_id
+    assert neuron.nucleus_id == expected.nucleus_id
+
+    synapse_cols = ["pre_synapses", "post_synapses", "synapses"]
+    nodes = neuron.nodes.sort_index()
+    expected_nodes = expected.nodes.sort_index()
+    for col in synapse_cols:
+        assert nodes[col].apply(sorted).equals(expected_nodes[col].apply(sorted))
+    pd.testing.assert_frame_equal(
+        nodes.drop(columns=synapse_cols),
+        expected_nodes.drop(columns=synapse_cols),
+        check_like=True,
+    )
+
+    pd.testing.assert_frame_equal(
+        neuron.edges.sort_index(), expected.edges.sort_index(), check_like=True
+    )
+    pd.testing.assert_frame_equal(neuron.edits, expected.edits, check_like=True)
+    pd.testing.assert_frame_equal(
+        neuron.pre_synapses, expected.pre_synapses, check_like=True
+    )
+    pd.testing.assert_frame_equal(
+        neuron.post_synapses, expected.post_synapses, check_like=True
+    )
+
+
+def _build_neuronframes(prune_initial_network=False):
+    # the earlier neuron was built back when 100 was its latest root ID
+    previous_neuron = build_neuronframe(
+        100, FakeClient(100), prune_initial_network=prune_initial_network
+    )
+    client = FakeClient(200)
+    neuron = extend_neuronframe(
+        previous_neuron, 200, client, prune_initial_network=prune_initial_network
+    )
+    expected = build_neuronframe(
+        200, client, prune_initial_network=prune_initial_network
+    )
+    return previous_neuron, neuron, expected
+
+
+@pytest.mark.parametrize("prune_initial_network", [False, True])
+def test_extend_neuronframe_matches_build(history, prune_initial_network):
+    previous_neuron, neuron, expected = _build_neuronframes(prune_initial_network)
+
+    check_neuronframe_final_state(neuron, 200, FakeClient(200))
+    _assert_neuronframes_equal(neuron, expected)
+    assert neuron.edits["root_id"].tolist() == [200] * 4
+    assert neuron.edits["metaoperation_id"].tolist() == [10, 11, 12, 12]
+    # the synapses of the merged in object are only in the extended neuron
+    assert neuron.pre_synapses.index.tolist() == [1, 3, 5, 6]
+    assert previous_neuron.pre_synapses.index.tolist() == [1, 3, 5]
+    # the previous neuron was not modified
+    assert previous_neuron.neuron_id == 100
+    assert previous_neuron.edits.index.tolist() == [10, 11]
+
+
+@pytest.mark.parametrize("moved_synapses", [False, True])
+def test_extend_sequence_matches_create(history, monkeypatch, moved_synapses):
+    if not moved_synapses:
+        # synapses 3 and 4 move onto the node added by operation 13; without them, the
+        # earlier states of the sequence still hold and are reused
+        for root in ROOTS.values():
+            for side in ["pre_synapses", "post_synapses"]:
+                synapses = {
+                    synapse_id: sv
+                    for synapse_id, sv in root[side].items()
+                    if synapse_id not in [3, 4]
+                }
+                monkeypatch.setitem(root, side, synapses)
+    previous_neuron, neuron, expected = _build_neuronframes()
+
+    previous_info = _create_time_ordered_sequence_dict(
+        previous_neuron, root_id=100, use_cache=False
+    )
+
+    applied = []
+    apply_edits = NeuronFrameSequence.apply_edits
+
+    def spy_apply_edits(self, edits, *args, **kwargs):
+        applied.append(edits)
+        return apply_edits(self, edits, *args, **kwargs)
+
+    monkeypatch.setattr(NeuronFrameSequence, "apply_edits", spy_apply_edits)
+    extended_info = _extend_time_ordered_sequence_dict(
+        neuron, previous_info, root_id=200, use_cache=False
+    )
+    if moved_synapses:
+        assert len(applied) == 5
+    else:
+        assert applied == [12, 13]
+
+    expected_info = _create_time_ordered_sequence_dict(
+        expected, root_id=200, use_cache=False
+    )
+    assert extended_info["sequence_info"] == expected_info["sequence_info"]
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(extended_info["edits"]).T, pd.DataFrame(expected_info["edits"]).T
+    )
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("caveclient")
+
+from pkg.io import deserialize, serialize
+from pkg.io.serialization import HEADER_MAGIC, get_compression
+
+COMPRESSIONS = [None, "zstd", "brotli", "gzip"]
+
+OBJECTS = {
+    "pickle": {"values": list(range(10_000)), "name": "neuron"},
+    "json": {"values": list(range(10_000)), "flag": True},
+    "npz": {"a": np.arange(10_000), "b": np.linspace(0, 1, 99).reshape(9, 11)},
+}
+
+
+def _assert_equal(loaded, expected):
+    assert loaded.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(loaded[key], value)
+        else:
+            assert loaded[key] == value
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("save_format", list(OBJECTS))
+def test_round_trip(save_format, compression):
+    obj = OBJECTS[save_format]
+    data = serialize(obj, save_format, compression=compression)
+    assert get_compression(data) == compression
+
+    # from the returned buffer, and as read back from a tier
+    _assert_equal(deserialize(data, save_format), obj)
+    _assert_equal(deserialize(bytes(data), save_format), obj)
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS[1:])
+def test_header(compression):
+    data = bytes(serialize({"a": 1}, "json", compression=compression))
+    assert data.startswith(HEADER_MAGIC + compression.encode() + b"\n")
+
+    data = bytes(serialize({"a": 1}, "json"))
+    assert data == b'{"a": 1}'
+    assert get_compression(data) is None
+
+
+def test_compression_level():
+    obj = OBJECTS["pickle"]
+    fast = serialize(obj, "pickle", compression="zstd", compression_level=1)
+    small = serialize(obj, "pickle", compression="zstd", compression_level=19)
+    assert len(small) <= len(fast)
+    assert deserialize(small, "pickle") == obj
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS[1:])
+@pytest.mark.parametrize("save_format", list(OBJECTS))
+def test_truncated(save_format, compression):
+    data = bytes(serialize(OBJECTS[save_format], save_format, compression=compression))
+    for end in [len(data) - 1, len(data) // 2]:
+        with pytest.raises(EOFError):
+            deserialize(data[:end], save_format)
+        with pytest.raises(EOFError):
+            deserialize(memoryview(data)[:end], save_format)
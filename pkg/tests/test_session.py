@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.workers.session
+from joblib import parallel_backend
+from pkg.neuronframe import NeuronFrame
+from pkg.workers import (
+    NeuronSession,
+    SequenceScheme,
+    get_sequence_schemes,
+    run_neuron_session,
+    run_neuron_sessions,
+)
+
+
+class FakeSequence:
+    def __init__(self, neuron, scheme, order_by=None, random_seed=None):
+        self.neuron = neuron
+        self.scheme = scheme
+        self.sequence_info = pd.DataFrame(
+            {"order": [0, 1], "applied_edits": [[], [1]]}, index=[10, 11]
+        )
+
+
+@pytest.fixture
+def sequence_creators(monkeypatch):
+    calls = []
+
+    def creator(scheme):
+        def create(neuron, root_id, order_by=None, random_seed=None):
+            calls.append((scheme, root_id, order_by, random_seed))
+            return FakeSequence(neuron, scheme, order_by, random_seed)
+
+        return create
+
+    for name, scheme in [
+        ("create_time_ordered_sequence", "historical"),
+        ("create_lumped_time_sequence", "lumped-time"),
+        ("create_merge_and_clean_sequence", "clean-and-merge"),
+    ]:
+        monkeypatch.setattr(pkg.workers.session, name, creator(scheme))
+    return calls
+
+
+def test_get_sequence_schemes():
+    schemes = get_sequence_schemes(n_random_sequences=2, lumped_time=True)
+    assert [scheme.scheme for scheme in schemes] == [
+        "historical",
+        "lumped-time",
+        "clean-and-merge",
+        "clean-and-merge",
+        "clean-and-merge",
+    ]
+    assert schemes[2].order_by == "time"
+    assert schemes[3].random_seed != schemes[4].random_seed
+    assert get_sequence_schemes(n_random_sequences=2)[2:] == schemes[3:]
+
+
+def test_session_run(sequence_creators):
+    neuron = {"name": "neuron"}
+    prepared = []
+    session = NeuronSession(7, neuron=neuron, prepare=prepared.append)
+    assert prepared == [neuron]
+
+    schemes = [
+        SequenceScheme("historical"),
+        SequenceScheme("clean-and-merge", "random", 5),
+    ]
+    outputs = session.run(
+        schemes=schemes,
+        metrics={"n_states": lambda sequence: len(sequence.sequence_info)},
+        select=lambda sequence, scheme: sequence,
+    )
+    # the neuron was only prepared once, and used for every scheme
+    assert prepared == [neuron]
+    assert [call[0] for call in sequence_creators] == ["historical", "clean-and-merge"]
+    assert sequence_creators[1][2:] == ("random", 5)
+
+    assert outputs["features"] == {
+        (7, "historical", None, None): {"n_states": 2},
+        (7, "clean-and-merge", "random", 5): {"n_states": 2},
+    }
+    infos = outputs["infos"]
+    assert "applied_edits" not in infos.columns
+    assert infos["scheme"].tolist() == ["historical"] * 2 + ["clean-and-merge"] * 2
+    assert infos["random_seed"].tolist()[2:] == [5, 5]
+
+    with pytest.raises(ValueError, match="not recognized"):
+        session.create_sequence(SequenceScheme("backwards"))
+
+
+def test_run_neuron_sessions(sequence_creators, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        pkg.workers.session, "load_neuronframe", lambda root_id, client: {}
+    )
+    schemes = [SequenceScheme("historical")]
+    metrics = {"n_states": lambda sequence: len(sequence.sequence_info)}
+
+    outputs = run_neuron_session(
+        1, schemes=schemes, metrics=metrics, out_path=tmp_path, client=object()
+    )
+    assert (tmp_path / "1.pkl").exists()
+    # already written, so not run again
+    assert (
+        run_neuron_session(
+            1, schemes=schemes, metrics=metrics, out_path=tmp_path, client=object()
+        )
+        is None
+    )
+    assert len(sequence_creators) == 1
+
+    infos, features = run_neuron_sessions(
+        [1, 2],
+        n_jobs=1,
+        schemes=schemes,
+        metrics=metrics,
+        out_path=tmp_path,
+        client=object(),
+    )
+    assert len(sequence_creators) == 2
+    assert infos["root_id"].tolist() == [1, 1, 2, 2]
+    assert features.index.get_level_values("root_id").tolist() == [1, 2]
+    assert features.index.get_level_values("scheme").tolist() == ["historical"] * 2
+    assert features["n_states"].tolist() == [2, 2]
+    pd.testing.assert_frame_equal(infos.iloc[:2], outputs["infos"])
+
+
+def test_session_run_shared(sequence_creators, tmp_path, monkeypatch):
+    published = []
+    publish_neuronframe = pkg.workers.session.publish_neuronframe
+
+    def publish(neuron):
+        published.append(neuron)
+        return publish_neuronframe(neuron, path=tmp_path)
+
+    monkeypatch.setattr(pkg.workers.session, "publish_neuronframe", publish)
+
+    nodes = pd.DataFrame({"x": np.arange(5.0)}, index=np.arange(10, 15))
+    edges = pd.DataFrame({"source": [10, 11], "target": [11, 12]})
+    neuron = NeuronFrame(nodes, edges, neuron_id=7)
+    schemes = get_sequence_schemes(n_random_sequences=2)
+    metrics = {
+        "n_states": lambda sequence: len(sequence.sequence_info),
+        "x": lambda sequence: sequence.neuron.nodes["x"].sum(),
+    }
+
+    session = NeuronSession(7, neuron=neuron)
+    expected = session.run(schemes=schemes, metrics=metrics)
+    # threads, so that the fake sequence creators are used in the workers too
+    with parallel_backend("threading"):
+        outputs = session.run(
+            schemes=schemes,
+            metrics={**metrics, "original": lambda sequence: sequence.neuron is neuron},
+            n_jobs=2,
+        )
+
+    assert published == [neuron]
+    assert not any(tmp_path.iterdir())
+    # every scheme ran on an attached copy of the neuron
+    assert not any(
+        features.pop("original") for features in outputs["features"].values()
+    )
+    assert outputs["features"] == expected["features"]
+    pd.testing.assert_frame_equal(outputs["infos"], expected["infos"])
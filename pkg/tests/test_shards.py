@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+pytest.importorskip("pyarrow")
+
+import pkg.features.shards
+from pkg.features import FeatureShards
+from pkg.features.l2_features import BaseWrangler, ExtractionFailure
+
+
+class FakeWrangler(BaseWrangler):
+    """Two nodes of features per object; objects in `failing` fail, `empty` have none."""
+
+    def __init__(self, failing=(), empty=()):
+        super().__init__(client=None, max_concurrent_requests=1)
+        self.failing = failing
+        self.empty = empty
+        self.planned = []
+
+    def _plan_for_object(self, object_id, bounds):
+        self.planned.append(object_id)
+        if object_id in self.failing:
+            return ExtractionFailure(f"Failed to plan {object_id}")
+        return object_id
+
+    def _fetch(self, plans):
+        return plans
+
+    def _extract_for_object(self, plan, fetched):
+        if isinstance(fetched, ExtractionFailure):
+            return fetched
+        if fetched in self.empty:
+            return None
+        return pd.DataFrame(
+            {
+                "object_id": fetched,
+                "l2_id": [fetched * 10, fetched * 10 + 1],
+                "feature": [float(fetched), float(fetched) + 0.5],
+            }
+        )
+
+    def _combine_features(self, data_by_object):
+        data = pd.concat([x for x in data_by_object if x is not None])
+        return data.set_index(["object_id", "l2_id"])
+
+
+def _manifest_objects(shards):
+    return [
+        [object_id for object_id, _ in manifest["objects"]]
+        for manifest in shards._manifests()
+    ]
+
+
+def test_write_and_read(tmp_path):
+    shards = FeatureShards(tmp_path / "features")
+    data = FakeWrangler().get_features([1, 2])
+    shards.write(data, [(1, None), (2, (0, 10))])
+    shards.write(None, [(3, None)])
+
+    reloaded = FeatureShards(tmp_path / "features")
+    assert len(reloaded) == 2
+    assert reloaded.completed_objects() == {(1, None), (2, (0, 10)), (3, None)}
+    pd.testing.assert_frame_equal(reloaded.read(), data)
+    assert [len(shard) for shard in reloaded] == [4]
+    assert reloaded.read(columns=[]).shape == (4, 0)
+    # no temporary files are left behind
+    assert sorted(file.name for file in (tmp_path / "features").iterdir()) == [
+        "part-00000.json",
+        "part-00000.parquet",
+        "part-00001.json",
+    ]
+
+
+def test_read_object_ids(tmp_path, monkeypatch):
+    shards = FakeWrangler().get_features(
+        [1, 2, 3, 4, 5], out_path=tmp_path, objects_per_shard=2
+    )
+    assert _manifest_objects(shards) == [[1, 2], [3, 4], [5]]
+
+    read_files = []
+    read_parquet = pd.read_parquet
+
+    def spy_read_parquet(file, *args, **kwargs):
+        read_files.append(file.name)
+        return read_parquet(file, *args, **kwargs)
+
+    monkeypatch.setattr(pkg.features.shards.pd, "read_parquet", spy_read_parquet)
+    data = shards.read(object_ids=[2, 5])
+    assert data.index.get_level_values("object_id").tolist() == [2, 2, 5, 5]
+    assert data["feature"].tolist() == [2.0, 2.5, 5.0, 5.5]
+    # the shard holding neither object is not read
+    assert read_files == ["part-00000.parquet", "part-00002.parquet"]
+
+    assert shards.read(object_ids=[6]).empty
+
+
+def test_stream_resume(tmp_path):
+    bounds = [None, None, np.array([[0, 1], [0, 1], [0, 1]]), None, None]
+    wrangler = FakeWrangler(failing=[3], empty=[4])
+    shards = wrangler.get_features(
+        [1, 2, 3, 4, 5], bounds, out_path=tmp_path, objects_per_shard=2
+    )
+    # failed objects are left out of the manifests, so they are tried again, but
+    # objects without any features are recorded
+    assert _manifest_objects(shards) == [[1, 2], [4], [5]]
+    assert shards.read().index.get_level_values("object_id").unique().tolist() == [
+        1,
+        2,
+        5,
+    ]
+
+    with pytest.raises(ValueError, match="resume=True"):
+        wrangler.get_features([1], out_path=tmp_path)
+
+    wrangler = FakeWrangler(empty=[4])
+    shards = wrangler.get_features(
+        [1, 2, 3, 4, 5], bounds, out_path=tmp_path, objects_per_shard=2, resume=True
+    )
+    assert wrangler.planned == [3]
+    assert _manifest_objects(shards) == [[1, 2], [4], [5], [3]]
+    assert (3, (0, 1, 0, 1, 0, 1)) in shards.completed_objects()
+    data = shards.read()
+    assert sorted(data.index.get_level_values("object_id").unique()) == [1, 2, 3, 5]
+    assert not data.index.duplicated().any()
+
+    # the same object with other bounds is not done yet
+    wrangler = FakeWrangler()
+    wrangler.get_features([3], out_path=tmp_path, resume=True)
+    assert wrangler.planned == [3]
+    wrangler.get_features([3], out_path=tmp_path, resume=True)
+    assert wrangler.planned == [3]
+
+
+def test_stream_all_failed(tmp_path):
+    shards = FakeWrangler(failing=[1, 2]).get_features(
+        [1, 2], out_path=tmp_path, objects_per_shard=2
+    )
+    assert _manifest_objects(shards) == [[]]
+    assert shards.completed_objects() == set()
+    assert shards.read().empty
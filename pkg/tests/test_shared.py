@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+from joblib import Parallel, delayed
+from pkg.neuronframe import NeuronFrame, SharedNeuronFrame, publish_neuronframe
+
+
+@pytest.fixture
+def neuron():
+    rng = np.random.default_rng(8888)
+    node_ids = np.arange(100, 120)
+    nodes = pd.DataFrame(
+        {
+            "x": rng.normal(size=20),
+            "operation_added": rng.integers(-1, 5, size=20),
+            "label": [f"node{i}" for i in range(20)],
+        },
+        index=node_ids,
+    )
+    edges = pd.DataFrame({"source": node_ids[:-1], "target": node_ids[1:]})
+    pre_synapses = pd.DataFrame(
+        {"pre_pt_level2_id": node_ids[:5], "size": np.arange(5.0)},
+        index=np.arange(5),
+    )
+    return NeuronFrame(
+        nodes, edges, pre_synapses=pre_synapses, nucleus_id=100, neuron_id=7
+    )
+
+
+def _assert_neurons_equal(loaded, neuron):
+    assert isinstance(loaded, NeuronFrame)
+    pd.testing.assert_frame_equal(loaded.nodes, neuron.nodes)
+    pd.testing.assert_frame_equal(loaded.edges, neuron.edges)
+    pd.testing.assert_frame_equal(loaded.pre_synapses, neuron.pre_synapses)
+    pd.testing.assert_frame_equal(loaded.post_synapses, neuron.post_synapses)
+    assert loaded.nucleus_id == neuron.nucleus_id
+    assert loaded.neuron_id == neuron.neuron_id
+
+
+def test_publish_attach(neuron, tmp_path):
+    with publish_neuronframe(neuron, path=tmp_path) as shared_neuron:
+        assert shared_neuron.path.parent == tmp_path
+        assert shared_neuron.n_buffers > 0
+        loaded = shared_neuron.attach()
+        _assert_neurons_equal(loaded, neuron)
+
+        # changes are private to the process which made them
+        loaded.nodes.loc[100, "x"] = 1000.0
+        assert shared_neuron.attach().nodes.loc[100, "x"] == neuron.nodes.loc[100, "x"]
+
+    assert not shared_neuron.path.exists()
+    # still valid once unlinked
+    assert loaded.nodes.loc[100, "x"] == 1000.0
+    pd.testing.assert_frame_equal(loaded.edges, neuron.edges)
+
+
+def _count_nodes(shared_neuron: SharedNeuronFrame, i: int) -> int:
+    neuron = shared_neuron.attach()
+    return len(neuron.nodes) + i
+
+
+def test_attach_in_workers(neuron, tmp_path):
+    with publish_neuronframe(neuron, path=tmp_path) as shared_neuron:
+        counts = Parallel(n_jobs=2)(
+            delayed(_count_nodes)(shared_neuron, i) for i in range(4)
+        )
+    assert counts == [20, 21, 22, 23]
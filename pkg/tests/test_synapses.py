@@ -0,0 +1,136 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+from pkg.edits import group_synapses_by_level2
+from pkg.io import SupervoxelLevel2Store
+from pkg.morphology import map_synapse_level2_ids, remap_level2_ids
+
+# level2 ID 10 was split into 11 and 12, which were merged into 20 later on; 30 was
+# never edited
+CHILDREN = {
+    10: [1, 2, 3],
+    11: [1, 2],
+    12: [3],
+    20: [1, 2, 3, 4],
+    30: [5, 6],
+}
+LINEAGE_COMPONENTS = pd.Series({10: 0, 11: 0, 12: 0, 20: 0})
+NODELIST = pd.Index([10, 11, 12, 30])
+
+
+class FakeChunkedGraph:
+    def __init__(self):
+        self.requested = []
+
+    def get_roots(self, supervoxel_ids, stop_layer=2):
+        assert stop_layer == 2
+        return [
+            max(level2_id for level2_id, children in CHILDREN.items() if sv in children)
+            for sv in supervoxel_ids
+        ]
+
+    def get_children(self, level2_id):
+        self.requested.append(level2_id)
+        return CHILDREN[level2_id]
+
+
+class FakeClient:
+    def __init__(self):
+        self.chunkedgraph = FakeChunkedGraph()
+
+
+def test_current_synapses():
+    synapses = pd.DataFrame({"pre_pt_supervoxel_id": [5, 6]}, index=[7, 8])
+    client = FakeClient()
+    map_synapse_level2_ids(synapses, LINEAGE_COMPONENTS, NODELIST, "pre", client)
+
+    assert synapses["pre_pt_current_level2_id"].tolist() == [30, 30]
+    assert synapses["pre_pt_level2_id"].tolist() == [30, 30]
+    assert client.chunkedgraph.requested == []
+
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_remap_level2_ids(use_store, tmp_path):
+    client = FakeClient()
+    store = SupervoxelLevel2Store(tmp_path) if use_store else None
+    supervoxel_ids = pd.Series([3, 1, 2], index=[100, 101, 102])
+    current_level2_ids = pd.Series([20, 20, 20], index=[100, 101, 102])
+
+    level2_ids = remap_level2_ids(
+        supervoxel_ids,
+        current_level2_ids,
+        LINEAGE_COMPONENTS,
+        # a network holding the nodes after the split only
+        pd.Index([11, 12, 30]),
+        client,
+        supervoxel_store=store,
+    )
+    assert level2_ids.index.tolist() == [100, 101, 102]
+    assert level2_ids.tolist() == [12, 11, 11]
+    assert sorted(client.chunkedgraph.requested) == [11, 12]
+
+
+def test_remap_level2_ids_ties_are_deterministic():
+    # 1 and 2 are in both 10 and 11, and 3 in both 10 and 12
+    supervoxel_ids = pd.Series([1, 2, 3])
+    current_level2_ids = pd.Series([20, 20, 20])
+    results = set()
+    for lineage_components in [
+        LINEAGE_COMPONENTS,
+        LINEAGE_COMPONENTS.iloc[::-1],
+        LINEAGE_COMPONENTS.iloc[[2, 0, 3, 1]],
+    ]:
+        level2_ids = remap_level2_ids(
+            supervoxel_ids,
+            current_level2_ids,
+            lineage_components,
+            NODELIST[::-1],
+            FakeClient(),
+        )
+        results.add(tuple(level2_ids))
+    assert results == {(10, 10, 10)}
+
+
+def test_remap_level2_ids_missing():
+    # 4 only joined the lineage with 20, which is not in the network
+    supervoxel_ids = pd.Series([1, 4])
+    current_level2_ids = pd.Series([20, 20])
+    with pytest.raises(ValueError, match="1 supervoxels"):
+        remap_level2_ids(
+            supervoxel_ids,
+            current_level2_ids,
+            LINEAGE_COMPONENTS,
+            NODELIST,
+            FakeClient(),
+        )
+
+
+def test_group_synapses_by_level2():
+    node_index = pd.Index([30, 10, 20, 40])
+    synapses = pd.DataFrame(
+        {"pre_pt_level2_id": [20, 30, 20, 10, 30]}, index=[5, 6, 7, 8, 9]
+    )
+    indptr, indices = group_synapses_by_level2(synapses, "pre_pt_level2_id", node_index)
+
+    assert indptr.tolist() == [0, 2, 3, 5, 5]
+    # synapses are in node order, and in table order within each node
+    assert indices.tolist() == [6, 9, 8, 5, 7]
+    for i, node_id in enumerate(node_index):
+        node_synapses = indices[indptr[i] : indptr[i + 1]]
+        expected = synapses.index[synapses["pre_pt_level2_id"] == node_id]
+        assert node_synapses.tolist() == expected.tolist()
+
+    indptr, indices = group_synapses_by_level2(
+        synapses.iloc[:0], "pre_pt_level2_id", node_index
+    )
+    assert indptr.tolist() == [0, 0, 0, 0, 0]
+    assert len(indices) == 0
+
+
+def test_group_synapses_by_level2_unmapped():
+    node_index = pd.Index([30, 10, 20])
+    synapses = pd.DataFrame({"pre_pt_level2_id": [20, 50, 10]}, index=[5, 6, 7])
+    with pytest.raises(KeyError, match=r"1 synapses .* \[50\]"):
+        group_synapses_by_level2(synapses, "pre_pt_level2_id", node_index)
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("caveclient")
+
+import pkg.features.l2_features
+from pkg.features import L2AggregateWrangler
+from pkg.features.l2_features import ExtractionFailure, L2ObjectPlan
+from requests.exceptions import HTTPError
+
+# level2 IDs of each object; objects 1 and 2 share node 13
+LEAVES = {1: [11, 12, 13], 2: [13, 14], 3: [15, 16, 17], 4: [18]}
+EDGES = {1: [(11, 12), (12, 13)], 2: [(13, 14)], 3: [(15, 16), (16, 17)], 4: []}
+BOUNDS = np.array([[0, 100], [0, 100], [0, 100]])
+
+
+def _l2data(l2_id):
+    return {
+        "area_nm2": float(l2_id),
+        "max_dt_nm": 2.0 * l2_id,
+        "mean_dt_nm": 3.0 * l2_id,
+        "size_nm3": 4.0 * l2_id,
+        "pca": [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, float(l2_id)]],
+        "pca_val": [3.0, 2.0, 1.0],
+        "rep_coord_nm": [float(l2_id), 0.0, 0.0],
+    }
+
+
+class FakeChunkedGraph:
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.planned = []
+
+    def get_leaves(self, object_id, stop_layer=2, bounds=None):
+        self.planned.append((object_id, None if bounds is None else bounds.tolist()))
+        if object_id in self.failing:
+            raise HTTPError(f"No leaves for {object_id}")
+        return LEAVES[object_id]
+
+    def level2_chunk_graph(self, object_id, bounds=None):
+        return EDGES[object_id]
+
+
+class FakeClient:
+    def __init__(self, failing=()):
+        self.chunkedgraph = FakeChunkedGraph(failing)
+
+
+@pytest.fixture
+def l2data_requests(monkeypatch):
+    requests = []
+
+    def get_l2data(l2_ids, client, attributes):
+        l2_ids = np.asarray(l2_ids).tolist()
+        requests.append(l2_ids)
+        if 17 in l2_ids:
+            raise HTTPError("l2cache is down")
+        return {str(l2_id): _l2data(l2_id) for l2_id in l2_ids}
+
+    monkeypatch.setattr(pkg.features.l2_features, "get_l2data", get_l2data)
+    return requests
+
+
+def test_repeated_objects_are_planned_once(l2data_requests):
+    client = FakeClient()
+    wrangler = L2AggregateWrangler(client, neighborhood_hops=1)
+    plans = wrangler._plan([1, 2, 1, 1], [None, None, None, BOUNDS])
+
+    assert sorted(client.chunkedgraph.planned, key=str) == sorted(
+        [(1, None), (2, None), (1, BOUNDS.tolist())], key=str
+    )
+    assert plans[0] is plans[2]
+    assert isinstance(plans[3], L2ObjectPlan)
+    assert plans[1].l2_ids.tolist() == [13, 14]
+    assert plans[1].edges.values.tolist() == [[13, 14]]
+
+
+def test_one_request_per_batch(l2data_requests, monkeypatch):
+    monkeypatch.setattr(pkg.features.l2_features, "L2DATA_BATCH_SIZE", 2)
+    wrangler = L2AggregateWrangler(FakeClient(), neighborhood_hops=1)
+    plans = wrangler._plan([1, 2, 4], [None] * 3)
+    fetched = wrangler._fetch(plans)
+
+    # every level2 ID is requested once, in batches, even if in several objects
+    assert sorted(l2data_requests) == [[11, 12], [13, 14], [18]]
+    assert [data.index.tolist() for data in fetched] == [[11, 12, 13], [13, 14], [18]]
+    assert fetched[0].loc[13].equals(fetched[1].loc[13])
+    assert fetched[1]["area_nm2"].tolist() == [13.0, 14.0]
+
+
+def test_failures_are_per_object(l2data_requests, monkeypatch):
+    monkeypatch.setattr(pkg.features.l2_features, "L2DATA_BATCH_SIZE", 3)
+    wrangler = L2AggregateWrangler(FakeClient(failing=[4]), neighborhood_hops=1)
+    data_by_object = wrangler._extract_features([1, 3, 4], [None] * 3)
+
+    # 3 has a node in the batch which failed to fetch, and 4 failed to plan
+    assert isinstance(data_by_object[0], pd.DataFrame)
+    assert isinstance(data_by_object[1], ExtractionFailure)
+    assert isinstance(data_by_object[2], ExtractionFailure)
+    assert [11, 12, 13] in l2data_requests
+
+    features = wrangler.get_features([1, 3, 4])
+    assert features.index.get_level_values("object_id").unique().tolist() == [1]
+    assert features.index.get_level_values("l2_id").tolist() == [11, 12, 13]
+
+
+def test_errors_raise_without_continue_on_error(l2data_requests):
+    wrangler = L2AggregateWrangler(
+        FakeClient(failing=[4]), neighborhood_hops=1, continue_on_error=False
+    )
+    with pytest.raises(HTTPError):
+        wrangler.get_features([1, 4])
+    with pytest.raises(HTTPError):
+        wrangler.get_features([3])